@@ -0,0 +1,260 @@
+"""Exact-match cache of LLM responses.
+
+Responses are keyed on a stable hash of everything that changes the answer (model, messages,
+schema, sampling parameters). Values are stored as text: the completion itself, or the validated
+json of the schema instance, rehydrated with ``schema.model_validate_json`` on a hit.
+
+Two tiers are available:
+
+- an in-memory LRU with a TTL, private to the worker,
+- an optional SQLite file, shared by the workers of a host and kept across restarts.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Optional, Type
+
+from pydantic import BaseModel
+
+from genai_template_backend.env_settings import Settings, logger
+
+
+@lru_cache(maxsize=None)
+def schema_fingerprint(schema: Type[BaseModel]) -> str:
+    """Identifies a schema by its import path and its json schema, so editing it invalidates."""
+    json_schema = json.dumps(schema.model_json_schema(), sort_keys=True)
+    return f"{schema.__module__}.{schema.__qualname__}:{hashlib.sha256(json_schema.encode()).hexdigest()}"
+
+
+def make_cache_key(
+    model_name: str,
+    messages: list,
+    schema: Optional[Type[BaseModel]] = None,
+    temperature: Optional[float] = None,
+    seed: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+    **kwargs,
+) -> str:
+    """Returns a stable sha256 hex digest of the request.
+
+    Extra ``kwargs`` forwarded to the provider are part of the key as well.
+    """
+    payload = {
+        "model": model_name,
+        "messages": messages,
+        "schema": schema_fingerprint(schema) if schema else None,
+        "temperature": temperature,
+        "seed": seed,
+        "max_tokens": max_tokens,
+        "kwargs": kwargs,
+    }
+    serialized = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def dump_cached_value(value: Any, schema: Optional[Type[BaseModel]] = None) -> str:
+    if schema:
+        return schema.model_validate(value).model_dump_json()
+    return value
+
+
+def load_cached_value(value: str, schema: Optional[Type[BaseModel]] = None) -> Any:
+    if schema:
+        return schema.model_validate_json(value)
+    return value
+
+
+class SQLiteCacheTier:
+    """Persistent tier storing ``key -> (value, expires_at)`` rows in a SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._connection.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < time.time():
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl),
+            )
+
+    def update(self, key: str, update: Callable[[Optional[str]], Optional[str]], ttl: float):
+        """Replaces the value of ``key`` with ``update(value)`` in one transaction.
+
+        ``value`` is None if the key is missing or expired, the row is left as is if ``update``
+        returns None. The SQLite write lock serializes the updates of all the workers. Returns
+        the new value.
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                value = row[0] if row is not None and row[1] >= time.time() else None
+                new_value = update(value)
+                if new_value is not None:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, new_value, time.time() + ttl),
+                    )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            return new_value
+
+    def delete(self, key: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class ResponseCache:
+    """In-memory LRU + TTL cache, optionally backed by a ``SQLiteCacheTier``.
+
+    The sync methods are used by ``generate_from_messages``, the async ones run the disk tier in a
+    thread so the event loop never waits on SQLite.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0, disk_path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk = SQLiteCacheTier(disk_path) if disk_path else None
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> Optional["ResponseCache"]:
+        if not settings.LLM_CACHE_ENABLED:
+            return None
+        logger.info(
+            f"LLM response cache enabled: max_size={settings.LLM_CACHE_MAX_SIZE}, "
+            f"ttl={settings.LLM_CACHE_TTL}s, disk={settings.LLM_CACHE_PATH}"
+        )
+        return cls(
+            max_size=settings.LLM_CACHE_MAX_SIZE,
+            ttl=settings.LLM_CACHE_TTL,
+            disk_path=settings.LLM_CACHE_PATH,
+        )
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _set_memory(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _count_disk_lookup(self, value: Optional[str]):
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+        value = self.disk.get(key) if self.disk else None
+        self._count_disk_lookup(value)
+        if value is not None:
+            self._set_memory(key, value)
+        return value
+
+    def set(self, key: str, value: str):
+        self._set_memory(key, value)
+        if self.disk:
+            self.disk.set(key, value, self.ttl)
+
+    async def aget(self, key: str) -> Optional[str]:
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+        value = await asyncio.to_thread(self.disk.get, key) if self.disk else None
+        self._count_disk_lookup(value)
+        if value is not None:
+            self._set_memory(key, value)
+        return value
+
+    async def aset(self, key: str, value: str):
+        self._set_memory(key, value)
+        if self.disk:
+            await asyncio.to_thread(self.disk.set, key, value, self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk:
+            self.disk.clear()
+
+    def close(self):
+        if self.disk:
+            self.disk.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
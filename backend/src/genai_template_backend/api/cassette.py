@@ -0,0 +1,254 @@
+"""Record / replay of the provider calls, for offline and reproducible profiling runs.
+
+In ``record`` mode every litellm completion and embedding call goes to the provider and its
+response is appended to a cassette file, keyed on a hash of the request. In ``replay`` mode the
+responses are read back from the cassette instead of calling the provider, optionally after their
+recorded duration (or the recorded timing of each chunk, for streams).
+
+The cassette is a single file of records: a header (payload length, sha256 of the request)
+followed by the zlib-compressed JSON of the response. The headers are scanned once when the
+cassette is opened into a dict of request hash -> (offset, length), so a replay is a dict lookup
+and one ``pread`` whatever the size of the cassette. A request recorded twice is answered with
+its last recording.
+"""
+
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from types import ModuleType
+from typing import Any, Callable, Optional
+
+from genai_template_backend.env_settings import Settings, logger
+
+# payload length, sha256 digest of the request
+HEADER = struct.Struct("<I32s")
+
+# connection settings, they don't change the answer
+IGNORED_KWARGS = frozenset(
+    {"api_key", "base_url", "api_base", "api_version", "timeout", "client", "max_retries"}
+)
+
+# litellm functions replaced by ``Cassette.install``: name, request kind, coroutine function
+PROVIDER_FUNCTIONS = (
+    ("acompletion", "completion", True),
+    ("completion", "completion", False),
+    ("aembedding", "embedding", True),
+    ("embedding", "embedding", False),
+)
+
+
+def response_class(kind: str) -> type:
+    """Returns the litellm type of the responses of ``kind``, imported on first use."""
+    from litellm.types.utils import EmbeddingResponse, ModelResponse
+
+    return {"completion": ModelResponse, "embedding": EmbeddingResponse}[kind]
+
+
+class CassetteMiss(LookupError):
+    """A replayed request was not recorded."""
+
+
+def request_key(kind: str, args: tuple, kwargs: dict) -> bytes:
+    """Returns the sha256 digest identifying a provider request."""
+    payload = {
+        "kind": kind,
+        "args": args,
+        "kwargs": {k: v for k, v in kwargs.items() if k not in IGNORED_KWARGS},
+    }
+    serialized = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(serialized.encode()).digest()
+
+
+class Cassette:
+    """Indexed file of recorded provider responses.
+
+    Args:
+        path: cassette file, created in ``record`` mode, must exist in ``replay`` mode.
+        mode: ``record`` or ``replay``.
+        timing: replayed calls take their recorded duration times this factor, 0 answers at once.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", timing: float = 0.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected 'record' or 'replay'")
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        if mode == "record":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a+b" if mode == "record" else "rb")
+        self._index: dict[bytes, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._originals: list[tuple[ModuleType, str, Callable]] = []
+        self._load_index()
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> Optional["Cassette"]:
+        if not settings.LLM_CASSETTE_MODE:
+            return None
+        cassette = cls(
+            settings.LLM_CASSETTE_PATH, settings.LLM_CASSETTE_MODE, settings.LLM_CASSETTE_TIMING
+        )
+        logger.info(
+            f"LLM cassette {settings.LLM_CASSETTE_PATH} opened in {cassette.mode} mode "
+            f"({len(cassette)} recordings)"
+        )
+        return cassette
+
+    def _load_index(self):
+        self._file.seek(0, os.SEEK_END)
+        size = self._file.tell()
+        offset = 0
+        while offset + HEADER.size <= size:
+            self._file.seek(offset)
+            length, key = HEADER.unpack(self._file.read(HEADER.size))
+            if offset + HEADER.size + length > size:
+                break
+            self._index[key] = (offset + HEADER.size, length)
+            offset += HEADER.size + length
+        if offset < size:
+            # last record cut short by a crash while recording
+            logger.warning(f"Ignoring {size - offset} truncated bytes at the end of {self.path}")
+            if self.mode == "record":
+                self._file.truncate(offset)
+
+    def __len__(self) -> int:
+        """Number of recorded calls."""
+        return len(self._index)
+
+    def __contains__(self, key: bytes) -> bool:
+        """Whether a call with this key is recorded."""
+        return key in self._index
+
+    def lookup(self, key: bytes) -> Optional[dict]:
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        offset, length = entry
+        return json.loads(zlib.decompress(os.pread(self._file.fileno(), length, offset)))
+
+    def record(self, key: bytes, recording: dict):
+        payload = zlib.compress(json.dumps(recording, separators=(",", ":"), default=str).encode())
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(HEADER.pack(len(payload), key) + payload)
+            self._file.flush()
+            self._index[key] = (offset + HEADER.size, len(payload))
+
+    def _replayed(self, kind: str, key: bytes) -> dict:
+        recording = self.lookup(key)
+        if recording is None:
+            raise CassetteMiss(f"No recording of this {kind} request in {self.path}")
+        return recording
+
+    def wrap(self, func: Callable, kind: str, is_async: bool) -> Callable:
+        """Returns ``func`` recording to, or replaying from, the cassette."""
+        response_type = response_class(kind)
+
+        if is_async:
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = request_key(kind, args, kwargs)
+                if self.mode == "replay":
+                    recording = self._replayed(kind, key)
+                    if "chunks" in recording:
+                        return self._areplay_stream(recording["chunks"])
+                    if self.timing:
+                        await asyncio.sleep(recording["elapsed"] * self.timing)
+                    return response_type(**recording["response"])
+
+                start = time.perf_counter()
+                res = await func(*args, **kwargs)
+                if kwargs.get("stream"):
+                    return self._arecord_stream(key, res, start)
+                self._record_response(key, res, start)
+                return res
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = request_key(kind, args, kwargs)
+            if self.mode == "replay":
+                recording = self._replayed(kind, key)
+                if "chunks" in recording:
+                    return self._replay_stream(recording["chunks"])
+                if self.timing:
+                    time.sleep(recording["elapsed"] * self.timing)
+                return response_type(**recording["response"])
+
+            start = time.perf_counter()
+            res = func(*args, **kwargs)
+            if kwargs.get("stream"):
+                return self._record_stream(key, res, start)
+            self._record_response(key, res, start)
+            return res
+
+        return wrapper
+
+    def _record_response(self, key: bytes, res: Any, start: float):
+        self.record(key, {"elapsed": time.perf_counter() - start, "response": res.model_dump()})
+
+    async def _arecord_stream(self, key: bytes, res, start: float):
+        chunks = []
+        async for chunk in res:
+            chunks.append((time.perf_counter() - start, chunk.model_dump()))
+            yield chunk
+        # only streams read to the end are recorded
+        self.record(key, {"chunks": chunks})
+
+    def _record_stream(self, key: bytes, res, start: float):
+        chunks = []
+        for chunk in res:
+            chunks.append((time.perf_counter() - start, chunk.model_dump()))
+            yield chunk
+        self.record(key, {"chunks": chunks})
+
+    async def _areplay_stream(self, chunks: list):
+        from litellm.types.utils import ModelResponseStream
+
+        previous = 0.0
+        for at, chunk in chunks:
+            if self.timing:
+                await asyncio.sleep((at - previous) * self.timing)
+            previous = at
+            yield ModelResponseStream(**chunk)
+
+    def _replay_stream(self, chunks: list):
+        from litellm.types.utils import ModelResponseStream
+
+        previous = 0.0
+        for at, chunk in chunks:
+            if self.timing:
+                time.sleep((at - previous) * self.timing)
+            previous = at
+            yield ModelResponseStream(**chunk)
+
+    def install(self, *modules: ModuleType):
+        """Replaces the litellm provider functions of ``modules`` by recording / replaying ones.
+
+        Both ``litellm`` itself and the modules that imported its functions by name are patched.
+        """
+        for module in modules:
+            for name, kind, is_async in PROVIDER_FUNCTIONS:
+                func = getattr(module, name, None)
+                if func is not None:
+                    self._originals.append((module, name, func))
+                    setattr(module, name, self.wrap(func, kind, is_async))
+
+    def uninstall(self):
+        for module, name, func in reversed(self._originals):
+            setattr(module, name, func)
+        self._originals.clear()
+
+    def close(self):
+        self.uninstall()
+        self._file.close()
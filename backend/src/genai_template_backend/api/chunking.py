@@ -0,0 +1,112 @@
+"""Chunked execution of large embedding jobs.
+
+Inputs are split lazily into provider-sized chunks (by item count and estimated tokens). At most
+``max_in_flight`` chunks are being embedded at any time, each chunk is retried on its own, and the
+vectors are written back in input order.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Iterable, Iterator
+
+from tenacity import AsyncRetrying, Retrying, stop_after_attempt
+
+from genai_template_backend.api.rate_limit import wait_retry_after
+
+Chunk = tuple[int, list[str]]  # (index of the first text in the input, texts)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, about 4 characters per token for english text."""
+    return len(text) // 4 + 1
+
+
+def iter_chunks(texts: Iterable[str], max_items: int, max_tokens: int) -> Iterator[Chunk]:
+    """Yields chunks of at most ``max_items`` texts and ``max_tokens`` estimated tokens.
+
+    A text longer than ``max_tokens`` on its own is sent alone in its chunk.
+    """
+    start, chunk, chunk_tokens = 0, [], 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if chunk and (len(chunk) >= max_items or chunk_tokens + tokens > max_tokens):
+            yield start, chunk
+            start, chunk, chunk_tokens = i, [], 0
+        chunk.append(text)
+        chunk_tokens += tokens
+    if chunk:
+        yield start, chunk
+
+
+def map_chunks(
+    texts: list[str],
+    embed_chunk: Callable[[list[str]], list[list[float]]],
+    max_items: int,
+    max_tokens: int,
+    max_in_flight: int,
+    attempts: int = 3,
+) -> list[list[float]]:
+    """Embeds ``texts`` chunk by chunk with ``max_in_flight`` threads."""
+    results = [None] * len(texts)
+    chunks = iter_chunks(texts, max_items, max_tokens)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            start, chunk_texts = chunk
+            for attempt in Retrying(
+                stop=stop_after_attempt(attempts), wait=wait_retry_after(max=30), reraise=True
+            ):
+                with attempt:
+                    vectors = embed_chunk(chunk_texts)
+            results[start : start + len(chunk_texts)] = vectors
+
+    if len(texts) <= max_items:
+        worker()
+        return results
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = [executor.submit(worker) for _ in range(max_in_flight)]
+        for future in futures:
+            future.result()
+    return results
+
+
+async def a_map_chunks(
+    texts: list[str],
+    embed_chunk: Callable[[list[str]], Awaitable[list[list[float]]]],
+    max_items: int,
+    max_tokens: int,
+    max_in_flight: int,
+    attempts: int = 3,
+) -> list[list[float]]:
+    """Async version of ``map_chunks``, with ``max_in_flight`` workers pulling chunks."""
+    results = [None] * len(texts)
+    chunks = iter_chunks(texts, max_items, max_tokens)
+
+    async def worker():
+        for start, chunk_texts in chunks:
+            async for attempt in AsyncRetrying(
+                stop=stop_after_attempt(attempts), wait=wait_retry_after(max=30), reraise=True
+            ):
+                with attempt:
+                    vectors = await embed_chunk(chunk_texts)
+            results[start : start + len(chunk_texts)] = vectors
+
+    if len(texts) <= max_items:
+        await worker()
+        return results
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max_in_flight)]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        raise
+    return results
@@ -0,0 +1,286 @@
+"""Long-lived clients shared by all the requests served by a worker.
+
+They are built once in the FastAPI ``lifespan`` hook (``init_llm_clients``) and stored on
+``app.state``, where the routes get them through a ``get_*`` dependency instead of building them
+per request:
+
+- ``cassette``: records or replays the provider calls, set up first so it wraps litellm.
+- ``embedding_llm`` (``get_embedding_llm``): the embedding model, None if not configured.
+- ``inference_llm`` (``get_inference_llm``): the chat model. Its semantic cache uses
+  ``embedding_llm``.
+- ``vector_index`` (``get_vector_index``): the index searched by ``/api/search``. The routes embed
+  the texts with ``embedding_llm``.
+- ``conversations`` (``get_conversation_store``): the chat histories. Their summaries are written
+  by ``inference_llm``.
+- ``model_server`` (``get_model_server``): the batching server of the local torch models.
+- ``image_pipeline`` (``get_image_pipeline``): the pool preprocessing the uploaded images.
+"""
+
+import os
+import re
+from typing import Optional
+
+import httpx
+from fastapi import FastAPI, Request
+
+from genai_template_backend.api.cache import ResponseCache
+from genai_template_backend.api.cassette import Cassette
+from genai_template_backend.api.conversations import ConversationStore
+from genai_template_backend.api.deployment_router import DeploymentRouter
+from genai_template_backend.api.embedding_store import EmbeddingStore
+from genai_template_backend.api.hedging import Hedger
+from genai_template_backend.api.image_pipeline import ImagePipeline
+from genai_template_backend.api.llm import EmbeddingLLMConfig, InferenceLLMConfig
+from genai_template_backend.api.model_server import ModelServer
+from genai_template_backend.api.rate_limit import get_rate_limiter
+from genai_template_backend.api.semantic_cache import SemanticCache
+from genai_template_backend.api.token_budget import TokenBudget
+from genai_template_backend.api.vector_index import VectorIndex
+from genai_template_backend.env_settings import InferenceDeployment, Settings, logger, settings
+from genai_template_backend.lazy_imports import lazy_import
+
+litellm = lazy_import("litellm")
+
+
+def build_http_limits(settings: Settings) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def build_http_timeout(settings: Settings) -> httpx.Timeout:
+    return httpx.Timeout(
+        timeout=settings.LLM_HTTP_TIMEOUT, connect=settings.LLM_HTTP_CONNECT_TIMEOUT
+    )
+
+
+def build_deployment_router(settings: Settings) -> Optional[DeploymentRouter]:
+    """Returns the router over the primary deployment and ``INFERENCE_DEPLOYMENTS``, if any."""
+    if not settings.INFERENCE_DEPLOYMENTS:
+        return None
+    primary = InferenceDeployment(
+        model_name=settings.INFERENCE_DEPLOYMENT_NAME,
+        base_url=settings.INFERENCE_BASE_URL,
+        api_key=settings.INFERENCE_API_KEY,
+        api_version=settings.INFERENCE_API_VERSION,
+        rate_limit_rpm=settings.LLM_RATE_LIMIT_RPM,
+        rate_limit_tpm=settings.LLM_RATE_LIMIT_TPM,
+    )
+    llms = [
+        InferenceLLMConfig(
+            model_name=deployment.model_name,
+            api_key=deployment.api_key,
+            base_url=deployment.base_url,
+            api_version=deployment.api_version,
+            max_concurrency=deployment.max_concurrency or settings.LLM_MAX_CONCURRENCY,
+            # caches and request coalescing stay on the client in front of the router
+            single_flight=False,
+            token_budget=TokenBudget.from_settings(settings, deployment.model_name),
+            rate_limiter=get_rate_limiter(
+                f"{deployment.model_name}@{deployment.base_url}",
+                requests_per_minute=deployment.rate_limit_rpm,
+                tokens_per_minute=deployment.rate_limit_tpm,
+                max_wait=settings.LLM_RATE_LIMIT_MAX_WAIT,
+            ),
+        )
+        for deployment in [primary, *settings.INFERENCE_DEPLOYMENTS]
+    ]
+    logger.info(f"Routing the inference calls over {len(llms)} deployments")
+    return DeploymentRouter(
+        llms,
+        ewma_alpha=settings.LLM_ROUTER_EWMA_ALPHA,
+        failure_threshold=settings.LLM_ROUTER_FAILURE_THRESHOLD,
+        cooldown=settings.LLM_ROUTER_COOLDOWN,
+    )
+
+
+def build_inference_llm(
+    settings: Settings, embedding_llm: Optional[EmbeddingLLMConfig] = None
+) -> InferenceLLMConfig:
+    router = build_deployment_router(settings)
+    return InferenceLLMConfig(
+        model_name=settings.INFERENCE_DEPLOYMENT_NAME,
+        api_key=settings.INFERENCE_API_KEY,
+        base_url=settings.INFERENCE_BASE_URL,
+        api_version=settings.INFERENCE_API_VERSION,
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        cache=ResponseCache.from_settings(settings),
+        semantic_cache=SemanticCache.from_settings(settings, embedding_llm),
+        single_flight=settings.LLM_SINGLE_FLIGHT_ENABLED,
+        router=router,
+        hedger=Hedger.from_settings(settings, settings.INFERENCE_DEPLOYMENT_NAME),
+        # with a router, each deployment fits the prompts in its own context window
+        token_budget=None
+        if router is not None
+        else TokenBudget.from_settings(settings, settings.INFERENCE_DEPLOYMENT_NAME),
+        # with a router, each deployment has its own limiter
+        rate_limiter=None
+        if router is not None
+        else get_rate_limiter(
+            settings.INFERENCE_DEPLOYMENT_NAME,
+            requests_per_minute=settings.LLM_RATE_LIMIT_RPM,
+            tokens_per_minute=settings.LLM_RATE_LIMIT_TPM,
+            max_wait=settings.LLM_RATE_LIMIT_MAX_WAIT,
+        ),
+    )
+
+
+def build_embedding_store(settings: Settings) -> Optional[EmbeddingStore]:
+    if not settings.EMBEDDINGS_STORE_PATH:
+        return None
+    model_directory = re.sub(r"[^A-Za-z0-9_.-]+", "_", settings.EMBEDDINGS_DEPLOYMENT_NAME)
+    return EmbeddingStore(os.path.join(settings.EMBEDDINGS_STORE_PATH, model_directory))
+
+
+def build_embedding_llm(settings: Settings) -> Optional[EmbeddingLLMConfig]:
+    if not settings.EMBEDDINGS_DEPLOYMENT_NAME:
+        return None
+    return EmbeddingLLMConfig(
+        model_name=settings.EMBEDDINGS_DEPLOYMENT_NAME,
+        api_key=settings.EMBEDDINGS_API_KEY,
+        base_url=settings.EMBEDDINGS_BASE_URL,
+        api_version=settings.EMBEDDINGS_API_VERSION,
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        micro_batch=settings.EMBEDDINGS_MICRO_BATCH_ENABLED,
+        micro_batch_max_size=settings.EMBEDDINGS_MICRO_BATCH_MAX_SIZE,
+        micro_batch_max_wait=settings.EMBEDDINGS_MICRO_BATCH_MAX_WAIT,
+        chunk_max_items=settings.EMBEDDINGS_CHUNK_MAX_ITEMS,
+        chunk_max_tokens=settings.EMBEDDINGS_CHUNK_MAX_TOKENS,
+        chunk_max_in_flight=settings.EMBEDDINGS_CHUNK_MAX_IN_FLIGHT,
+        store=build_embedding_store(settings),
+        rate_limiter=get_rate_limiter(
+            settings.EMBEDDINGS_DEPLOYMENT_NAME,
+            requests_per_minute=settings.EMBEDDINGS_RATE_LIMIT_RPM,
+            tokens_per_minute=settings.EMBEDDINGS_RATE_LIMIT_TPM,
+            max_wait=settings.LLM_RATE_LIMIT_MAX_WAIT,
+        ),
+    )
+
+
+def init_llm_clients(app: FastAPI, settings: Settings = settings) -> None:
+    """Builds the shared http sessions and LLM clients and stores them on ``app.state``.
+
+    litellm reuses ``litellm.client_session`` / ``litellm.aclient_session`` for the providers that
+    go through httpx, so every call made by the worker shares the same keep-alive pool.
+    """
+    limits = build_http_limits(settings)
+    timeout = build_http_timeout(settings)
+    litellm.client_session = httpx.Client(limits=limits, timeout=timeout)
+    litellm.aclient_session = httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    app.state.cassette = Cassette.from_settings(settings)
+    if app.state.cassette is not None:
+        # the clients look the litellm functions up at call time
+        app.state.cassette.install(litellm)
+    app.state.embedding_llm = build_embedding_llm(settings)
+    app.state.inference_llm = build_inference_llm(settings, app.state.embedding_llm)
+    app.state.vector_index = VectorIndex.from_settings(settings)
+    app.state.conversations = ConversationStore.from_settings(settings)
+    app.state.model_server = ModelServer.from_settings(settings)
+    app.state.image_pipeline = ImagePipeline.from_settings(settings)
+    logger.info(
+        f"LLM clients ready: inference={settings.INFERENCE_DEPLOYMENT_NAME}, "
+        f"embeddings={settings.EMBEDDINGS_DEPLOYMENT_NAME}, "
+        f"max_concurrency={settings.LLM_MAX_CONCURRENCY}, "
+        f"max_connections={settings.LLM_HTTP_MAX_CONNECTIONS}"
+    )
+
+
+async def close_llm_clients(app: FastAPI, settings: Settings = settings) -> None:
+    """Closes the shared http sessions and the clients opened by ``init_llm_clients``.
+
+    The vector index isn't saved here: its writes are logged as they happen, see
+    ``VectorIndex.shared_write``.
+    """
+    if litellm.aclient_session is not None:
+        await litellm.aclient_session.aclose()
+        litellm.aclient_session = None
+    if litellm.client_session is not None:
+        litellm.client_session.close()
+        litellm.client_session = None
+    cassette = getattr(app.state, "cassette", None)
+    if cassette is not None:
+        cassette.close()
+        app.state.cassette = None
+    inference_llm = getattr(app.state, "inference_llm", None)
+    if inference_llm is not None and inference_llm.cache is not None:
+        inference_llm.cache.close()
+    conversations = getattr(app.state, "conversations", None)
+    if conversations is not None:
+        await conversations.aclose()
+    model_server = getattr(app.state, "model_server", None)
+    if model_server is not None:
+        await model_server.aclose()
+    image_pipeline = getattr(app.state, "image_pipeline", None)
+    if image_pipeline is not None:
+        await image_pipeline.aclose()
+    app.state.inference_llm = None
+    app.state.embedding_llm = None
+    app.state.vector_index = None
+    app.state.conversations = None
+    app.state.model_server = None
+    app.state.image_pipeline = None
+
+
+def get_inference_llm(request: Request) -> InferenceLLMConfig:
+    """FastAPI dependency returning the shared inference client.
+
+    Falls back to building it on first use when the app runs without its lifespan
+    (e.g. ``TestClient(app)`` used outside a ``with`` block).
+    """
+    llm = getattr(request.app.state, "inference_llm", None)
+    if llm is None:
+        llm = build_inference_llm(settings, get_embedding_llm(request))
+        request.app.state.inference_llm = llm
+    return llm
+
+
+def get_embedding_llm(request: Request) -> Optional[EmbeddingLLMConfig]:
+    """FastAPI dependency returning the shared embedding client, if one is configured."""
+    llm = getattr(request.app.state, "embedding_llm", None)
+    if llm is None:
+        llm = build_embedding_llm(settings)
+        request.app.state.embedding_llm = llm
+    return llm
+
+
+def get_vector_index(request: Request) -> VectorIndex:
+    """FastAPI dependency returning the vector index of the catalog.
+
+    A sync dependency, run in the threadpool: it reloads the index when another worker saved it.
+    """
+    index = getattr(request.app.state, "vector_index", None)
+    if index is None:
+        index = VectorIndex.from_settings(settings)
+        request.app.state.vector_index = index
+    index.refresh()
+    return index
+
+
+def get_conversation_store(request: Request) -> ConversationStore:
+    """FastAPI dependency returning the store of the chat conversations."""
+    store = getattr(request.app.state, "conversations", None)
+    if store is None:
+        store = ConversationStore.from_settings(settings)
+        request.app.state.conversations = store
+    return store
+
+
+def get_model_server(request: Request) -> ModelServer:
+    """FastAPI dependency returning the server of the local torch models."""
+    server = getattr(request.app.state, "model_server", None)
+    if server is None:
+        server = ModelServer.from_settings(settings)
+        request.app.state.model_server = server
+    return server
+
+
+def get_image_pipeline(request: Request) -> ImagePipeline:
+    """FastAPI dependency returning the preprocessing pool of the uploaded images."""
+    pipeline = getattr(request.app.state, "image_pipeline", None)
+    if pipeline is None:
+        pipeline = ImagePipeline.from_settings(settings)
+        request.app.state.image_pipeline = pipeline
+    return pipeline
@@ -0,0 +1,309 @@
+"""Server-side conversation history of the chat sessions.
+
+Conversations are keyed by an id stored in the ``SessionMiddleware`` cookie and kept in an
+in-memory LRU with an idle TTL, optionally backed by a ``SQLiteCacheTier`` so they survive
+restarts and are shared by the workers of a host. With the SQLite tier, the file is the source of
+truth: the conversation is read from it on each request, and the turns and summaries are applied
+to its row in a transaction, so two workers serving the same session don't overwrite each other.
+
+The prompt sent to the model is the summary of the older turns, then the most recent turns
+fitting in ``history_max_tokens``, then the new message. Once the turns kept verbatim exceed the
+budget, the oldest ones are folded into the summary, down to half the budget: the summary is
+updated with those turns only, in the background, instead of re-summarizing the whole
+conversation on each turn.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from genai_template_backend.api.cache import SQLiteCacheTier
+from genai_template_backend.api.rate_limit import estimate_message_tokens
+from genai_template_backend.env_settings import Settings, logger
+
+SUMMARY_PROMPT = (
+    "You maintain the running summary of a conversation between a user and an assistant. "
+    "Update the summary with the new turns, keep the facts, preferences and decisions that "
+    "matter for the rest of the conversation, in at most {max_words} words. "
+    "Answer with the updated summary only."
+)
+
+
+@dataclass
+class Conversation:
+    """Summary of the older turns and the turns kept verbatim."""
+
+    summary: str = ""
+    messages: list[dict] = field(default_factory=list)
+    summarized_messages: int = 0
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, value: str) -> "Conversation":
+        return cls(**json.loads(value))
+
+    def fold(self, summarized_messages: int, folded: list[dict], summary: str) -> bool:
+        """Replaces the ``folded`` oldest turns with ``summary``.
+
+        Returns False, leaving the conversation as is, if it was summarized since the turns were
+        read (``summarized_messages`` changed) or doesn't start with them anymore.
+        """
+        if (
+            self.summarized_messages != summarized_messages
+            or self.messages[: len(folded)] != folded
+        ):
+            return False
+        self.summary = summary
+        del self.messages[: len(folded)]
+        self.summarized_messages += len(folded)
+        return True
+
+
+class ConversationStore:
+    """Bounded store of the conversations, LRU + idle TTL, with an optional SQLite tier.
+
+    Args:
+        max_conversations: conversations kept in memory, the least recently used are evicted.
+        ttl: seconds of inactivity after which a conversation is forgotten.
+        disk_path: SQLite file of the persistent tier, memory only if None.
+        history_max_tokens: token budget of the summary and turns sent with each message.
+        summary_max_tokens: length of the summary, part of the budget.
+    """
+
+    def __init__(
+        self,
+        max_conversations: int = 10_000,
+        ttl: float = 86_400.0,
+        disk_path: Optional[str] = None,
+        history_max_tokens: int = 2000,
+        summary_max_tokens: int = 256,
+    ):
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self.history_max_tokens = history_max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.disk = SQLiteCacheTier(disk_path) if disk_path else None
+        self._entries: OrderedDict[str, tuple[Conversation, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        # one summary at a time per conversation, the tasks are referenced until they finish
+        self._summarizing: dict[str, asyncio.Task] = {}
+        self.evictions = 0
+        self.summaries = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "ConversationStore":
+        return cls(
+            max_conversations=settings.CONVERSATION_MAX_SESSIONS,
+            ttl=settings.CONVERSATION_TTL,
+            disk_path=settings.CONVERSATION_PATH,
+            history_max_tokens=settings.CONVERSATION_HISTORY_MAX_TOKENS,
+            summary_max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS,
+        )
+
+    def _get_memory(self, conversation_id: str) -> Optional[Conversation]:
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return None
+            conversation, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[conversation_id]
+                return None
+            self._entries.move_to_end(conversation_id)
+            return conversation
+
+    def _set_memory(self, conversation_id: str, conversation: Conversation):
+        with self._lock:
+            self._entries[conversation_id] = (conversation, time.monotonic() + self.ttl)
+            self._entries.move_to_end(conversation_id)
+            while len(self._entries) > self.max_conversations:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    async def aget(self, conversation_id: str) -> Conversation:
+        """Returns the conversation, a new one if it is unknown or expired.
+
+        With the SQLite tier, it is read from the file: another worker may have updated it.
+        """
+        if not self.disk:
+            conversation = self._get_memory(conversation_id)
+            if conversation is None:
+                conversation = Conversation()
+                self._set_memory(conversation_id, conversation)
+            return conversation
+        value = await asyncio.to_thread(self.disk.get, conversation_id)
+        conversation = Conversation.from_json(value) if value is not None else Conversation()
+        self._set_memory(conversation_id, conversation)
+        return conversation
+
+    async def asave(self, conversation_id: str, conversation: Conversation):
+        """Overwrites the conversation."""
+        self._set_memory(conversation_id, conversation)
+        if self.disk:
+            await asyncio.to_thread(
+                self.disk.set, conversation_id, conversation.to_json(), self.ttl
+            )
+
+    async def _aupdate(self, conversation_id: str, update) -> Optional[Conversation]:
+        """Applies ``update(conversation)`` to the row of the SQLite tier in one transaction.
+
+        ``update`` gets None for a missing conversation and returns the conversation to save, None
+        to leave the row as is. Returns the updated conversation, None if it wasn't updated.
+        """
+
+        def update_value(value: Optional[str]) -> Optional[str]:
+            conversation = update(Conversation.from_json(value) if value is not None else None)
+            return conversation.to_json() if conversation is not None else None
+
+        value = await asyncio.to_thread(self.disk.update, conversation_id, update_value, self.ttl)
+        if value is None:
+            return None
+        conversation = Conversation.from_json(value)
+        self._set_memory(conversation_id, conversation)
+        return conversation
+
+    async def adelete(self, conversation_id: str):
+        """Forgets the conversation and cancels its summary in progress."""
+        with self._lock:
+            self._entries.pop(conversation_id, None)
+        task = self._summarizing.get(conversation_id)
+        if task is not None:
+            # a summary saved after the delete would bring the conversation back
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if self.disk:
+            await asyncio.to_thread(self.disk.delete, conversation_id)
+
+    def prompt_messages(self, conversation: Conversation, message: str) -> list[dict]:
+        """Returns the summary, the latest turns fitting in the budget and the new message."""
+        new_message = {"role": "user", "content": message}
+        prompt = []
+        if conversation.summary:
+            prompt.append(
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation: {conversation.summary}",
+                }
+            )
+        budget = self.history_max_tokens - estimate_message_tokens(prompt + [new_message])
+        history = []
+        for turn in reversed(conversation.messages):
+            budget -= estimate_message_tokens([turn])
+            if budget < 0:
+                break
+            history.append(turn)
+        return prompt + history[::-1] + [new_message]
+
+    def _messages_to_summarize(self, conversation: Conversation) -> int:
+        """Number of oldest turns to fold into the summary, 0 while the history fits."""
+        tokens = [estimate_message_tokens([turn]) for turn in conversation.messages]
+        total = sum(tokens) + self.summary_max_tokens
+        if total <= self.history_max_tokens:
+            return 0
+        count = 0
+        # down to half the budget, so the summary isn't updated on every turn
+        while count < len(tokens) and total > self.history_max_tokens // 2:
+            total -= tokens[count]
+            count += 1
+        return count
+
+    async def aappend(self, conversation_id: str, messages: list[dict], llm=None):
+        """Appends the turns of an exchange, then updates the summary in the background."""
+        if self.disk:
+
+            def append(saved: Optional[Conversation]) -> Conversation:
+                conversation = saved or Conversation()
+                conversation.messages.extend(messages)
+                return conversation
+
+            conversation = await self._aupdate(conversation_id, append)
+        else:
+            conversation = await self.aget(conversation_id)
+            conversation.messages.extend(messages)
+            self._set_memory(conversation_id, conversation)
+        if (
+            llm is not None
+            and conversation_id not in self._summarizing
+            and self._messages_to_summarize(conversation)
+        ):
+            task = asyncio.create_task(self.asummarize(conversation_id, conversation, llm))
+            self._summarizing[conversation_id] = task
+            task.add_done_callback(lambda _: self._summarizing.pop(conversation_id, None))
+
+    async def asummarize(self, conversation_id: str, conversation: Conversation, llm):
+        """Folds the oldest turns into the summary with one call to ``llm``."""
+        count = self._messages_to_summarize(conversation)
+        if not count:
+            return
+        folded = conversation.messages[:count]
+        summarized_messages = conversation.summarized_messages
+        turns = "\n".join(f"{turn['role']}: {turn['content']}" for turn in folded)
+        try:
+            summary = await llm.a_generate_from_messages(
+                messages=[
+                    {
+                        "role": "system",
+                        "content": SUMMARY_PROMPT.format(
+                            max_words=int(self.summary_max_tokens * 0.75)
+                        ),
+                    },
+                    {
+                        "role": "user",
+                        "content": f"Current summary:\n{conversation.summary or '(empty)'}\n\n"
+                        f"New turns:\n{turns}",
+                    },
+                ]
+            )
+        except Exception as e:
+            # the turns stay verbatim, the next exchange tries again
+            logger.error(f"Could not summarize conversation {conversation_id}: {e}")
+            return
+        if not summary:
+            return
+        if not self.disk:
+            # turns appended meanwhile are after the folded ones
+            if self._get_memory(conversation_id) is conversation and conversation.fold(
+                summarized_messages, folded, summary
+            ):
+                self.summaries += 1
+            # else deleted or evicted meanwhile
+            return
+
+        def fold(saved: Optional[Conversation]) -> Optional[Conversation]:
+            # None if deleted meanwhile, by this worker or another one
+            if saved is not None and saved.fold(summarized_messages, folded, summary):
+                return saved
+            return None
+
+        # a delete arriving now waits for the update to finish before deleting from the disk
+        update = asyncio.ensure_future(self._aupdate(conversation_id, fold))
+        try:
+            updated = await asyncio.shield(update)
+        except asyncio.CancelledError:
+            await update
+            raise
+        if updated is not None:
+            self.summaries += 1
+
+    async def aclose(self):
+        """Waits for the summaries in progress, then closes the SQLite tier."""
+        if self._summarizing:
+            await asyncio.gather(*self._summarizing.values(), return_exceptions=True)
+        if self.disk:
+            self.disk.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "conversations": len(self._entries),
+                "max_conversations": self.max_conversations,
+                "evictions": self.evictions,
+                "summaries": self.summaries,
+                "summarizing": len(self._summarizing),
+            }
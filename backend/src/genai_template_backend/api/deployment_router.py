@@ -0,0 +1,294 @@
+"""Routing of the inference calls over a pool of equivalent deployments.
+
+Each deployment (e.g. an Azure region or a local Ollama) is an ``InferenceLLMConfig`` of its own,
+with its own concurrency cap and rate limiter. For each call the router picks the deployment with
+the lowest expected cost: the EWMA of its latency times its calls in flight plus one, inflated by
+the EWMA of its error rate. Deployments at their concurrency cap are only picked when all are.
+
+Connection errors, timeouts, 5xx and 429 answers fail the call over to the next deployment. A
+circuit breaker per deployment stops sending it calls after ``failure_threshold`` consecutive
+failures (or for the ``Retry-After`` of a 429), then lets one probe call through after
+``cooldown`` seconds: a success closes it again.
+
+``call`` and ``stream`` serve the async path, ``call_sync`` the sync one. The bookkeeping of the
+deployments is locked, sync calls run in other threads than the event loop.
+"""
+
+import functools
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from genai_template_backend.api.rate_limit import RateLimitExceeded, retry_after_seconds
+from genai_template_backend.api.tracing import span
+from genai_template_backend.env_settings import logger
+from genai_template_backend.lazy_imports import lazy_import
+
+litellm = lazy_import("litellm")
+
+
+@functools.cache
+def failover_exceptions() -> tuple[type[Exception], ...]:
+    """Errors of the deployment rather than of the request."""
+    return (
+        litellm.exceptions.RateLimitError,
+        litellm.exceptions.APIConnectionError,
+        litellm.exceptions.Timeout,
+        litellm.exceptions.InternalServerError,
+        litellm.exceptions.ServiceUnavailableError,
+    )
+
+
+class NoDeploymentAvailable(RuntimeError):
+    """Every deployment of the pool is drained by its circuit breaker."""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"No inference deployment available, retry in {retry_after:.1f}s")
+
+
+class CircuitBreaker:
+    """Closed, open for ``cooldown`` seconds after repeated failures, then half-open."""
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if not self.open_until:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until else "half_open"
+
+    def available(self) -> bool:
+        state = self.state
+        # a half-open breaker lets one probe call through at a time
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def on_call(self):
+        if self.state == "half_open":
+            self.probing = True
+
+    def on_success(self):
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    def on_failure(self, cooldown: Optional[float] = None):
+        self.consecutive_failures += 1
+        failed_probe = self.probing
+        self.probing = False
+        if (
+            cooldown is not None
+            or failed_probe
+            or (self.consecutive_failures >= self.failure_threshold)
+        ):
+            self.open_until = time.monotonic() + (self.cooldown if cooldown is None else cooldown)
+
+
+class Deployment:
+    """One deployment of the pool and its observed latency and error rate."""
+
+    def __init__(self, llm: Any, name: str, breaker: CircuitBreaker):
+        self.llm = llm
+        self.name = name
+        self.breaker = breaker
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+
+    @property
+    def saturated(self) -> bool:
+        return bool(self.llm.max_concurrency) and self.in_flight >= self.llm.max_concurrency
+
+    def cost(self, default_latency: float) -> float:
+        latency = self.latency if self.latency is not None else default_latency
+        return latency * (self.in_flight + 1) / max(1.0 - self.error_rate, 0.05)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "state": self.breaker.state,
+            "latency_ewma": self.latency,
+            "error_rate_ewma": self.error_rate,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "failures": self.failures,
+        }
+
+
+class DeploymentRouter:
+    """Spreads the calls over ``llms`` and fails over between them.
+
+    Args:
+        llms: ``InferenceLLMConfig`` of each deployment, the first one is the primary.
+        ewma_alpha: weight of the last observation in the latency and error rate averages.
+        failure_threshold: consecutive failures opening the circuit breaker of a deployment.
+        cooldown: seconds a breaker stays open before letting a probe call through.
+    """
+
+    def __init__(
+        self,
+        llms: list,
+        ewma_alpha: float = 0.3,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+    ):
+        if not llms:
+            raise ValueError("The deployment router needs at least one deployment")
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+        self.deployments = [
+            Deployment(
+                llm, f"{llm.model_name}@{llm.base_url}", CircuitBreaker(failure_threshold, cooldown)
+            )
+            for llm in llms
+        ]
+
+    def pick(self, exclude: tuple = ()) -> Optional[Deployment]:
+        """Returns the cheapest available deployment not in ``exclude``."""
+        candidates = [d for d in self.deployments if d not in exclude and d.breaker.available()]
+        if not candidates:
+            return None
+        # deployments never measured are assumed as fast as the fastest one and ties go to the
+        # least used deployment, so every deployment gets tried
+        known = [d.latency for d in self.deployments if d.latency is not None]
+        default_latency = min(known, default=1.0)
+        return min(candidates, key=lambda d: (d.saturated, d.cost(default_latency), d.calls))
+
+    def _ewma(self, average: Optional[float], value: float) -> float:
+        if average is None:
+            return value
+        return self.ewma_alpha * value + (1 - self.ewma_alpha) * average
+
+    def _start(self, tried: list[Deployment]) -> Optional[Deployment]:
+        """Picks the next deployment to try and counts the call on it."""
+        with self._lock:
+            deployment = self.pick(tuple(tried))
+            if deployment is not None:
+                tried.append(deployment)
+                deployment.breaker.on_call()
+                deployment.in_flight += 1
+                deployment.calls += 1
+            return deployment
+
+    def _end(self, deployment: Deployment):
+        with self._lock:
+            deployment.in_flight -= 1
+            deployment.breaker.probing = False
+
+    def _on_success(self, deployment: Deployment, latency: Optional[float] = None):
+        with self._lock:
+            deployment.breaker.on_success()
+            deployment.error_rate = self._ewma(deployment.error_rate, 0.0)
+            if latency is not None:
+                deployment.latency = self._ewma(deployment.latency, latency)
+
+    def _on_failure(self, deployment: Deployment, exception: BaseException):
+        cooldown = None
+        if isinstance(exception, litellm.exceptions.RateLimitError):
+            cooldown = retry_after_seconds(exception)
+        with self._lock:
+            deployment.failures += 1
+            deployment.error_rate = self._ewma(deployment.error_rate, 1.0)
+            deployment.breaker.on_failure(cooldown)
+        logger.warning(f"Deployment {deployment.name} failed, failing over: {exception}")
+
+    def _unavailable(self) -> NoDeploymentAvailable:
+        now = time.monotonic()
+        reopen = min(d.breaker.open_until for d in self.deployments)
+        return NoDeploymentAvailable(max(reopen - now, 0.0))
+
+    async def call(self, func: Callable[[Any], Awaitable]):
+        """Runs ``func(llm)`` on the best deployment, then on the next ones while they fail."""
+        tried: list[Deployment] = []
+        last_error: Optional[BaseException] = None
+        while (deployment := self._start(tried)) is not None:
+            start = time.perf_counter()
+            try:
+                with span("llm.deployment", deployment=deployment.name):
+                    res = await func(deployment.llm)
+            except RateLimitExceeded as e:
+                # out of the client-side budget of this deployment, not a failure of it
+                last_error = e
+                continue
+            except failover_exceptions() as e:
+                self._on_failure(deployment, e)
+                last_error = e
+                continue
+            except Exception:
+                # the deployment answered, the request itself is wrong
+                self._on_success(deployment)
+                raise
+            finally:
+                self._end(deployment)
+            self._on_success(deployment, time.perf_counter() - start)
+            return res
+        if last_error is not None:
+            raise last_error
+        raise self._unavailable()
+
+    def call_sync(self, func: Callable[[Any], Any]):
+        """Sync version of ``call``."""
+        tried: list[Deployment] = []
+        last_error: Optional[BaseException] = None
+        while (deployment := self._start(tried)) is not None:
+            start = time.perf_counter()
+            try:
+                with span("llm.deployment", deployment=deployment.name):
+                    res = func(deployment.llm)
+            except RateLimitExceeded as e:
+                last_error = e
+                continue
+            except failover_exceptions() as e:
+                self._on_failure(deployment, e)
+                last_error = e
+                continue
+            except Exception:
+                self._on_success(deployment)
+                raise
+            finally:
+                self._end(deployment)
+            self._on_success(deployment, time.perf_counter() - start)
+            return res
+        if last_error is not None:
+            raise last_error
+        raise self._unavailable()
+
+    async def stream(self, func: Callable[[Any], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Streaming variant of ``call``, fails over only until the first delta is sent."""
+        tried: list[Deployment] = []
+        last_error: Optional[BaseException] = None
+        while (deployment := self._start(tried)) is not None:
+            started = False
+            try:
+                async for delta in func(deployment.llm):
+                    started = True
+                    yield delta
+            except RateLimitExceeded as e:
+                if started:
+                    raise
+                last_error = e
+                continue
+            except failover_exceptions() as e:
+                self._on_failure(deployment, e)
+                if started:
+                    raise
+                last_error = e
+                continue
+            finally:
+                self._end(deployment)
+            # stream durations depend on the answer length, they aren't latency samples
+            self._on_success(deployment)
+            return
+        if last_error is not None:
+            raise last_error
+        raise self._unavailable()
+
+    def stats(self) -> list[dict]:
+        return [deployment.stats() for deployment in self.deployments]
@@ -0,0 +1,117 @@
+"""Micro-batching of concurrent single-text embedding calls.
+
+Concurrent ``EmbeddingLLMConfig.a_embed_text`` calls are queued for at most ``max_wait`` seconds
+(or until ``max_batch_size`` texts are waiting), then sent to the provider as one batch and each
+caller gets its own vector back.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+from genai_template_backend.env_settings import logger
+
+
+class EmbeddingBatcher:
+    """Collects single texts into batches for ``embed_batch``.
+
+    Args:
+        embed_batch: coroutine embedding a list of texts, results in input order.
+        max_batch_size: a batch is sent as soon as this many texts are waiting.
+        max_wait: maximum time in seconds the first text of a batch waits for others.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[list[str]], Awaitable[list[list[float]]]],
+        max_batch_size: int = 64,
+        max_wait: float = 0.005,
+    ):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: list[tuple[str, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+
+        # instrumentation used to tune max_wait / max_batch_size
+        self.batches = 0
+        self.items = 0
+        self.max_seen_batch_size = 0
+        self.queue_wait_seconds = 0.0
+        self.max_queue_wait_seconds = 0.0
+        self.batch_size_histogram: dict[int, int] = {}
+
+    async def embed(self, text: str) -> list[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = self._pending[: self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size :]
+            # waiters cancelled while queued don't need a vector
+            batch = [item for item in batch if not item[1].done()]
+            if batch:
+                task = asyncio.get_running_loop().create_task(self._run(batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    def _record(self, batch: list[tuple[str, asyncio.Future, float]]):
+        now = time.perf_counter()
+        waits = [now - enqueued_at for _, _, enqueued_at in batch]
+        size = len(batch)
+        self.batches += 1
+        self.items += size
+        self.max_seen_batch_size = max(self.max_seen_batch_size, size)
+        self.queue_wait_seconds += sum(waits)
+        self.max_queue_wait_seconds = max(self.max_queue_wait_seconds, max(waits))
+        bucket = 1 << (size - 1).bit_length()  # next power of two
+        self.batch_size_histogram[bucket] = self.batch_size_histogram.get(bucket, 0) + 1
+        logger.trace(f"Embedding batch of {size} texts, max queue wait {1000 * max(waits):.2f}ms.")
+
+    def _fail(self, batch: list[tuple[str, asyncio.Future, float]], error: BaseException):
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def _run(self, batch: list[tuple[str, asyncio.Future, float]]):
+        self._record(batch)
+        try:
+            vectors = await self.embed_batch([text for text, _, _ in batch])
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        if len(vectors) != len(batch):
+            error = RuntimeError(
+                f"The provider returned {len(vectors)} embeddings for a batch of {len(batch)} texts"
+            )
+            logger.error(str(error))
+            self._fail(batch, error)
+            return
+        for (_, future, _), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_seen_batch_size,
+            "mean_queue_wait_ms": (
+                1000 * self.queue_wait_seconds / self.items if self.items else 0.0
+            ),
+            "max_queue_wait_ms": 1000 * self.max_queue_wait_seconds,
+            "batch_size_histogram": dict(sorted(self.batch_size_histogram.items())),
+        }
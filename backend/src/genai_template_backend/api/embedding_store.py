@@ -0,0 +1,184 @@
+"""Persistent, content-addressed store of embeddings.
+
+Vectors are keyed by a 64 bits hash of ``(model name, text)`` and kept in a directory holding:
+
+- ``vectors.f32``: append-only float32 rows, memory-mapped read-only so millions of vectors are
+  served from the page cache without being copied into the process,
+- ``keys.u64``: append-only uint64 keys, row ``i`` of the vectors belongs to key ``i``. A row
+  only exists once its key is written, so this file is the commit log of the store,
+- ``meta.json``: the vector dimension,
+- ``.lock``: ``flock`` target serializing the writers of all the workers.
+
+The key index is a sorted uint64 array searched with ``np.searchsorted`` (about 16 bytes per
+vector), plus a small dict of the keys appended since it was last sorted.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+
+from genai_template_backend.env_settings import logger
+
+
+def embedding_key(model_name: str, text: str) -> int:
+    digest = hashlib.blake2b(f"{model_name}\0{text}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class EmbeddingStore:
+    """Append-only embedding store safe to share between the workers of a host.
+
+    Readers never take the file lock: they see the rows committed in ``keys.u64`` when they last
+    refreshed, and refresh when a lookup misses. Writers take an exclusive ``flock`` while
+    appending. Within the process, the lookups run in threads (``asyncio.to_thread``), so a
+    thread lock covers the refresh, the merge of the key index and the lookup of the rows.
+    """
+
+    # number of appended keys kept in the dict before they are merged in the sorted index
+    merge_threshold = 4096
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._keys_path = os.path.join(path, "keys.u64")
+        self._meta_path = os.path.join(path, "meta.json")
+        self._lock_path = os.path.join(path, ".lock")
+
+        self.dim: Optional[int] = None
+        self.size = 0
+        self._vectors: Optional[np.memmap] = None
+        self._sorted_keys = np.empty(0, dtype=np.uint64)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+        self._recent: dict[int, int] = {}
+        # reentrant: add_many refreshes while holding it
+        self._lock = threading.RLock()
+        self.refresh()
+        logger.info(f"Embedding store {path} opened with {self.size} vectors.")
+
+    def __len__(self) -> int:
+        """Number of vectors loaded at the last refresh."""
+        return self.size
+
+    @contextmanager
+    def _write_lock(self):
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _committed_rows(self) -> int:
+        try:
+            return os.path.getsize(self._keys_path) // 8
+        except FileNotFoundError:
+            return 0
+
+    def refresh(self) -> bool:
+        """Loads the rows appended since the last refresh, by this or another worker."""
+        with self._lock:
+            rows = self._committed_rows()
+            if rows == self.size:
+                return False
+            if self.dim is None:
+                with open(self._meta_path) as f:
+                    self.dim = json.load(f)["dim"]
+
+            new_keys = np.fromfile(
+                self._keys_path, dtype=np.uint64, count=rows - self.size, offset=8 * self.size
+            )
+            new_rows = np.arange(self.size, rows, dtype=np.int64)
+            if len(self._recent) + len(new_rows) > self.merge_threshold:
+                self._merge(new_keys, new_rows)
+            else:
+                self._recent.update(zip(new_keys.tolist(), new_rows.tolist()))
+            self.size = rows
+            self._vectors = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)
+            )
+            return True
+
+    def _merge(self, new_keys: np.ndarray, new_rows: np.ndarray):
+        """Merges the recent keys and ``new_keys`` into the sorted index."""
+        keys = np.concatenate(
+            [self._sorted_keys, np.fromiter(self._recent.keys(), np.uint64), new_keys]
+        )
+        rows = np.concatenate(
+            [self._sorted_rows, np.fromiter(self._recent.values(), np.int64), new_rows]
+        )
+        order = np.argsort(keys, kind="stable")
+        self._sorted_keys, self._sorted_rows = keys[order], rows[order]
+        self._recent = {}
+
+    def _find_rows(self, keys: list[int]) -> np.ndarray:
+        """Returns the row of each key, -1 for the missing ones."""
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if len(self._sorted_keys):
+            query = np.array(keys, dtype=np.uint64)
+            positions = np.searchsorted(self._sorted_keys, query)
+            positions = np.minimum(positions, len(self._sorted_keys) - 1)
+            found = self._sorted_keys[positions] == query
+            rows[found] = self._sorted_rows[positions[found]]
+        if self._recent:
+            for i, key in enumerate(keys):
+                if rows[i] < 0:
+                    rows[i] = self._recent.get(key, -1)
+        return rows
+
+    def get_many(self, model_name: str, texts: list[str]) -> list[Optional[np.ndarray]]:
+        """Returns the stored vector of each text, None for the missing ones.
+
+        The vectors are read-only views on the memory-mapped file.
+        """
+        keys = [embedding_key(model_name, text) for text in texts]
+        with self._lock:
+            rows = self._find_rows(keys)
+            if (rows < 0).any() and self.refresh():
+                rows = self._find_rows(keys)
+            vectors = self._vectors
+        return [vectors[row] if row >= 0 else None for row in rows.tolist()]
+
+    def add_many(self, model_name: str, texts: list[str], vectors: list[list[float]]):
+        """Appends the vectors of ``texts``, skipping the keys already stored."""
+        if not texts:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._write_lock():
+            self.refresh()
+            if self.dim is None:
+                self.dim = array.shape[1]
+                with open(self._meta_path, "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            elif array.shape[1] != self.dim:
+                raise ValueError(
+                    f"Store {self.path} holds {self.dim}d vectors, got {array.shape[1]}d vectors"
+                )
+
+            keys = [embedding_key(model_name, text) for text in texts]
+            new_keys, new_rows, seen = [], [], set()
+            for i, (key, row) in enumerate(zip(keys, self._find_rows(keys).tolist())):
+                if row < 0 and key not in seen:
+                    seen.add(key)
+                    new_keys.append(key)
+                    new_rows.append(i)
+            if not new_keys:
+                return
+
+            # vectors first, at the offset of the committed rows (overwriting any torn write),
+            # then the keys which commit them
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(4 * self.dim * self.size)
+                f.write(array[new_rows].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._keys_path, "ab") as f:
+                f.truncate(8 * self.size)
+                f.write(np.array(new_keys, dtype=np.uint64).tobytes())
+            self.refresh()
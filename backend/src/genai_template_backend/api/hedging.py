@@ -0,0 +1,160 @@
+"""Hedged provider calls, to cut the latency tail.
+
+When a call hasn't answered after the ``percentile`` of the recent call latencies, a duplicate is
+sent (to the best deployment at that time when a router is configured, often another one), the
+first answer wins and the other call is cancelled. Only the slowest calls are hedged, and a
+budget caps the hedges at ``max_rate`` of the calls so the extra cost stays bounded.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from genai_template_backend.api.metrics import LLM_HEDGE_LATENCY_SAVED, LLM_HEDGED_CALLS
+from genai_template_backend.api.tracing import current_span
+from genai_template_backend.env_settings import Settings
+
+
+class LatencyTracker:
+    """Percentiles of the last ``window`` call latencies, recomputed every ``refresh`` calls."""
+
+    def __init__(self, window: int = 1000, refresh: int = 16):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.refresh = refresh
+        self._since_refresh = 0
+        self._sorted = np.empty(0)
+
+    def __len__(self) -> int:
+        """Number of latencies in the window."""
+        return len(self.samples)
+
+    def record(self, latency: float):
+        self.samples.append(latency)
+        self._since_refresh += 1
+
+    def _sorted_samples(self) -> np.ndarray:
+        if self._since_refresh >= self.refresh or len(self._sorted) != len(self.samples):
+            self._sorted = np.sort(np.fromiter(self.samples, dtype=np.float64))
+            self._since_refresh = 0
+        return self._sorted
+
+    def percentile(self, q: float) -> float:
+        return float(np.percentile(self._sorted_samples(), q))
+
+    def expected_beyond(self, elapsed: float) -> float:
+        """Mean of the recent latencies longer than ``elapsed``, ``elapsed`` if there are none."""
+        samples = self._sorted_samples()
+        beyond = samples[np.searchsorted(samples, elapsed, side="right") :]
+        return float(beyond.mean()) if len(beyond) else elapsed
+
+
+class HedgeBudget:
+    """Each call earns ``max_rate`` of a hedge, a hedge spends one, ``burst`` at most saved."""
+
+    def __init__(self, max_rate: float = 0.05, burst: float = 10.0):
+        self.max_rate = max_rate
+        self.burst = burst
+        self.balance = 1.0
+
+    def on_call(self):
+        self.balance = min(self.balance + self.max_rate, self.burst)
+
+    def try_spend(self) -> bool:
+        # tolerance: ten calls at 0.1 earn a whole hedge
+        if self.balance < 1.0 - 1e-9:
+            return False
+        self.balance = max(self.balance - 1.0, 0.0)
+        return True
+
+
+class Hedger:
+    """Runs a call and hedges it when it is slower than usual.
+
+    Args:
+        model_name: label of the metrics.
+        percentile: percentile of the recent latencies after which a call is hedged.
+        min_delay: calls are never hedged before this many seconds.
+        max_rate: hedged share of the calls at most.
+        min_samples: latencies recorded before the first hedge.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        percentile: float = 95.0,
+        min_delay: float = 0.5,
+        max_rate: float = 0.05,
+        min_samples: int = 20,
+    ):
+        self.model_name = model_name
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker()
+        self.budget = HedgeBudget(max_rate)
+
+    @classmethod
+    def from_settings(cls, settings: Settings, model_name: str) -> Optional["Hedger"]:
+        if not settings.LLM_HEDGE_ENABLED:
+            return None
+        return cls(
+            model_name,
+            percentile=settings.LLM_HEDGE_PERCENTILE,
+            min_delay=settings.LLM_HEDGE_MIN_DELAY,
+            max_rate=settings.LLM_HEDGE_MAX_RATE,
+            min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+        )
+
+    def delay(self) -> Optional[float]:
+        """Seconds after which a call is hedged, None until enough latencies are known."""
+        if len(self.latencies) < self.min_samples:
+            return None
+        return max(self.latencies.percentile(self.percentile), self.min_delay)
+
+    async def run(self, call: Callable[[], Awaitable]):
+        self.budget.on_call()
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(call())
+        hedge: Optional[asyncio.Future] = None
+        try:
+            delay = self.delay()
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self.budget.try_spend():
+                outcome = "not_hedged" if done or delay is None else "budget_exhausted"
+                LLM_HEDGED_CALLS.inc(self.model_name, outcome)
+                res = await primary
+                self.latencies.record(time.perf_counter() - start)
+                return res
+
+            hedge_start = time.perf_counter()
+            parent = current_span()
+            if parent is not None:
+                parent.add_event("hedge", delay=delay)
+            hedge = asyncio.ensure_future(call())
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is None:
+                    continue
+                now = time.perf_counter()
+                if winner is primary:
+                    LLM_HEDGED_CALLS.inc(self.model_name, "primary_won")
+                    self.latencies.record(now - start)
+                else:
+                    LLM_HEDGED_CALLS.inc(self.model_name, "hedge_won")
+                    self.latencies.record(now - hedge_start)
+                    # the primary would have answered after the usual latency of the slow calls
+                    saved = self.latencies.expected_beyond(now - start) - (now - start)
+                    LLM_HEDGE_LATENCY_SAVED.observe(saved, self.model_name)
+                return winner.result()
+            # both calls failed
+            LLM_HEDGED_CALLS.inc(self.model_name, "failed")
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
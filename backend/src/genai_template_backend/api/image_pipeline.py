@@ -0,0 +1,244 @@
+"""Preprocessing of the uploaded images, in a process pool.
+
+Decoding, EXIF orientation, resizing and normalization are CPU bound and hold the GIL for most of
+their time, so they run in a ``ProcessPoolExecutor`` instead of on the event loop. The pixels
+don't travel back through the pool's pipe: each job writes its float32 ``(3, height, width)``
+array into a ``SharedMemory`` block the parent allocated, and only the metadata is pickled.
+
+The blocks, one per job in flight, also bound the work accepted: ``acquire`` waits at most
+``queue_timeout`` seconds for a free block, then raises ``PipelineSaturated``, so an upload is
+refused before its body is read when the pool can't keep up.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional
+
+import numpy as np
+
+from genai_template_backend.env_settings import Settings, logger
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+# EXIF orientations rotating the image by 90 or 270 degrees
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+class InvalidImage(ValueError):
+    """The upload is not an image Pillow can decode."""
+
+
+class PipelineSaturated(Exception):
+    """Every shared memory block is in use for longer than ``queue_timeout``."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("The image preprocessing pool is saturated, retry later")
+        self.retry_after = retry_after
+
+
+def preprocess(
+    path: str,
+    block_name: str,
+    width: int,
+    height: int,
+    mean: tuple[float, ...] = IMAGENET_MEAN,
+    std: tuple[float, ...] = IMAGENET_STD,
+) -> dict:
+    """Runs in a pool process: writes the normalized image at ``path`` into ``block_name``.
+
+    The image is turned upright from its EXIF orientation, then scaled and center-cropped to
+    ``width`` x ``height``. Returns the original size of the upright image.
+    """
+    # Pillow is only imported by the pool processes
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(path) as image:
+            transposed = image.getexif().get(0x0112, 1) in TRANSPOSED_ORIENTATIONS
+            original_size = image.size[::-1] if transposed else image.size
+            # JPEG: decode at the smallest scale still covering the target, much faster
+            image.draft("RGB", (height, width) if transposed else (width, height))
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            image = ImageOps.fit(image, (width, height), Image.Resampling.BILINEAR)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage(f"Could not decode the image: {e}") from None
+
+    scale = 1 / (255 * np.asarray(std, dtype=np.float32))
+    offset = np.asarray(mean, dtype=np.float32) / np.asarray(std, dtype=np.float32)
+    block = SharedMemory(name=block_name)
+    try:
+        output = np.ndarray((3, height, width), dtype=np.float32, buffer=block.buf)
+        # HWC uint8 to CHW float32, (pixel / 255 - mean) / std
+        np.multiply(np.asarray(image).transpose(2, 0, 1), scale[:, None, None], out=output)
+        output -= offset[:, None, None]
+        del output  # the block can't be closed while a view exports its buffer
+    finally:
+        block.close()
+    return {"original_width": original_size[0], "original_height": original_size[1]}
+
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ImagePipeline:
+    """Process pool preprocessing the uploads, with a bounded number of jobs in flight.
+
+    Args:
+        upload_dir: directory the uploads are streamed to.
+        width: width of the preprocessed images.
+        height: height of the preprocessed images.
+        max_workers: processes of the pool, ``os.cpu_count()`` if None.
+        max_pending: jobs accepted at once (queued or running), twice the processes if None.
+        queue_timeout: seconds an upload waits for a free slot before ``PipelineSaturated``.
+        max_images: preprocessed images kept in memory, the least recently used are evicted.
+    """
+
+    def __init__(
+        self,
+        upload_dir: str,
+        width: int = 768,
+        height: int = 1024,
+        max_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        queue_timeout: float = 1.0,
+        max_images: int = 8,
+    ):
+        self.upload_dir = upload_dir
+        os.makedirs(upload_dir, exist_ok=True)
+        self.width = width
+        self.height = height
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.max_workers
+        self.queue_timeout = queue_timeout
+        self.max_images = max_images
+        # preprocessed array and path of the upload, by image id
+        self.images: OrderedDict[str, tuple[np.ndarray, str]] = OrderedDict()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._blocks: list[SharedMemory] = []
+        self._free: Optional[asyncio.Queue] = None
+
+        self.processed = 0
+        self.rejected = 0
+        self.processing_seconds = 0.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "ImagePipeline":
+        return cls(
+            upload_dir=settings.IMAGE_UPLOAD_DIR,
+            width=settings.IMAGE_WIDTH,
+            height=settings.IMAGE_HEIGHT,
+            max_workers=settings.IMAGE_WORKERS,
+            max_pending=settings.IMAGE_MAX_PENDING,
+            queue_timeout=settings.IMAGE_QUEUE_TIMEOUT,
+            max_images=settings.IMAGE_CACHE_SIZE,
+        )
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process running threads (event loop, torch, to_thread) isn't safe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Image preprocessing pool started with {self.max_workers} processes")
+        return self._executor
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._blocks) - (self._free.qsize() if self._free is not None else 0)
+
+    async def acquire(self) -> SharedMemory:
+        """Reserves a slot for one image, raises ``PipelineSaturated`` if none frees up in time."""
+        if self._free is None:
+            self._free = asyncio.Queue()
+        if self._free.empty() and len(self._blocks) < self.max_pending:
+            block = SharedMemory(create=True, size=3 * self.height * self.width * 4)
+            self._blocks.append(block)
+            return block
+        try:
+            return await asyncio.wait_for(self._free.get(), self.queue_timeout)
+        except TimeoutError:
+            self.rejected += 1
+            raise PipelineSaturated(retry_after=self.queue_timeout) from None
+
+    def release(self, block: SharedMemory):
+        if self._free is not None:  # not closed
+            self._free.put_nowait(block)
+
+    async def preprocess(self, image_id: str, path: str, block: SharedMemory) -> dict:
+        """Preprocesses the image at ``path`` in the slot ``block``, then releases it.
+
+        The array is kept under ``image_id`` in ``self.images``, the upload is deleted when it is
+        evicted. Returns the metadata of the image.
+        """
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, preprocess, path, block.name, self.width, self.height
+        )
+        try:
+            metadata = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # the process may still be writing into the block, it is released once the job ends
+            future.add_done_callback(lambda _: self.release(block))
+            raise
+        except Exception:
+            self.release(block)
+            raise
+        # one copy out of the block, which is reused by the next upload
+        array = np.ndarray((3, self.height, self.width), dtype=np.float32, buffer=block.buf)
+        self.images[image_id] = (array.copy(), path)
+        del array
+        self.release(block)
+        while len(self.images) > self.max_images:
+            _, (_, evicted_path) = self.images.popitem(last=False)
+            remove_file(evicted_path)
+        elapsed = time.perf_counter() - start
+        self.processed += 1
+        self.processing_seconds += elapsed
+        return {**metadata, "width": self.width, "height": self.height, "seconds": elapsed}
+
+    def get(self, image_id: str) -> Optional[np.ndarray]:
+        """Returns the preprocessed ``(3, height, width)`` array of an upload, if still kept."""
+        entry = self.images.get(image_id)
+        if entry is None:
+            return None
+        self.images.move_to_end(image_id)
+        return entry[0]
+
+    def _remove_kept_uploads(self):
+        while self.images:
+            _, (_, path) = self.images.popitem()
+            remove_file(path)
+
+    async def aclose(self):
+        """Stops the pool, frees the shared memory blocks and deletes the kept uploads."""
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, cancel_futures=True)
+            self._executor = None
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks.clear()
+        self._free = None
+        # the arrays don't outlive the process, nothing would ever delete their uploads
+        await asyncio.to_thread(self._remove_kept_uploads)
+
+    def stats(self) -> dict:
+        return {
+            "processes": self.max_workers,
+            "in_flight": self.in_flight,
+            "max_pending": self.max_pending,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "mean_ms": 1000 * self.processing_seconds / self.processed if self.processed else 0.0,
+            "kept_images": len(self.images),
+        }
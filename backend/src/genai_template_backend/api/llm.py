@@ -1,20 +1,112 @@
-import ast
-from typing import Optional, Type
+import asyncio
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import AsyncIterator, Optional, Type
 
-import instructor
-import litellm
-from litellm import supports_response_schema, acompletion, completion, aembedding, embedding
-from pydantic import BaseModel, SecretStr, ConfigDict, model_validator
+from pydantic import BaseModel, SecretStr, ConfigDict, PrivateAttr, model_validator
 from typing_extensions import Self
 
 from tenacity import (
+    RetryCallState,
     retry,
     stop_after_attempt,
-    wait_fixed,
-    retry_if_exception_type,
+    retry_if_exception,
 )
 
+from genai_template_backend.api.cache import (
+    ResponseCache,
+    dump_cached_value,
+    load_cached_value,
+    make_cache_key,
+)
+from genai_template_backend.api.chunking import a_map_chunks, estimate_tokens, map_chunks
+from genai_template_backend.api.deployment_router import DeploymentRouter, NoDeploymentAvailable
+from genai_template_backend.api.embedding_batcher import EmbeddingBatcher
+from genai_template_backend.api.embedding_store import EmbeddingStore
+from genai_template_backend.api.hedging import Hedger
+from genai_template_backend.api.metrics import LLM_CACHE_LOOKUPS, LLM_RETRIES, track_llm_call
+from genai_template_backend.api.rate_limit import (
+    RateLimiter,
+    RateLimitExceeded,
+    estimate_message_tokens,
+    wait_retry_after,
+)
+from genai_template_backend.api.semantic_cache import SemanticCache
+from genai_template_backend.api.single_flight import SingleFlight
+from genai_template_backend.api.structured_output import (
+    instructor_client,
+    parse_structured_output,
+    response_format,
+)
+from genai_template_backend.api.token_budget import TokenBudget
+from genai_template_backend.api.tracing import current_span, span, traced
 from genai_template_backend.env_settings import logger
+from genai_template_backend.lazy_imports import lazy_import
+
+instructor = lazy_import("instructor")
+litellm = lazy_import("litellm")
+
+
+# litellm's functions are looked up at call time, ``from litellm import`` would load it on import
+def supports_response_schema(*args, **kwargs):
+    return litellm.supports_response_schema(*args, **kwargs)
+
+
+async def acompletion(*args, **kwargs):
+    return await litellm.acompletion(*args, **kwargs)
+
+
+def completion(*args, **kwargs):
+    return litellm.completion(*args, **kwargs)
+
+
+async def aembedding(*args, **kwargs):
+    return await litellm.aembedding(*args, **kwargs)
+
+
+def embedding(*args, **kwargs):
+    return litellm.embedding(*args, **kwargs)
+
+
+def provider_error(exception: BaseException) -> BaseException:
+    """Returns the error of the last attempt when instructor gave up, else ``exception``."""
+    if isinstance(exception, instructor.exceptions.InstructorRetryException) and exception.args:
+        last_error = exception.args[0]
+        if isinstance(last_error, BaseException):
+            return last_error
+    return exception
+
+
+def is_retryable(exception: BaseException) -> bool:
+    """Provider throttling is retried, also when it made instructor give up.
+
+    instructor already re-asks the outputs failing validation, its other failures (connection
+    errors, ...) are not retried again.
+    """
+    return isinstance(provider_error(exception), litellm.exceptions.RateLimitError)
+
+
+def before_retry_sleep(retry_state: RetryCallState):
+    """Logs the retry and pauses the other calls of the model when the provider throttles."""
+    llm, exception = retry_state.args[0], provider_error(retry_state.outcome.exception())
+    sleep = retry_state.next_action.sleep
+    LLM_RETRIES.inc(llm.model_name, type(exception).__name__)
+    parent = current_span()
+    if parent is not None:
+        parent.add_event(
+            "retry", attempt=retry_state.attempt_number, sleep=sleep, error=str(exception)
+        )
+    if isinstance(exception, litellm.exceptions.RateLimitError) and llm.rate_limiter is not None:
+        llm.rate_limiter.pause(sleep)
+    logger.warning(
+        f"{llm.model_name} call failed (attempt {retry_state.attempt_number}), "
+        f"retrying in {sleep:.1f}s: {exception}"
+    )
+
+
+def usage_tokens(response) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None)
 
 
 class InferenceLLMConfig(BaseModel):
@@ -32,12 +124,109 @@ class InferenceLLMConfig(BaseModel):
     seed: int = 1729
     max_tokens: Optional[int] = None
 
+    # maximum number of async provider calls in flight, None means unbounded
+    max_concurrency: Optional[int] = None
+    # exact-match response cache, shared by the sync and async paths
+    cache: Optional[ResponseCache] = None
+    # opt-in cache answering paraphrases of previous prompts, async path only
+    semantic_cache: Optional[SemanticCache] = None
+    # requests/min and tokens/min budget, shared by the clients of the model
+    rate_limiter: Optional[RateLimiter] = None
+    # completion tokens reserved in the tokens/min budget when max_tokens isn't set
+    completion_tokens_estimate: int = 256
+    # concurrent identical async requests share one provider call
+    single_flight: bool = True
+    # spreads the calls over a pool of deployments, each with its own client
+    router: Optional[DeploymentRouter] = None
+    # duplicates the async calls slower than usual, the first answer wins
+    hedger: Optional[Hedger] = None
+    # counts the prompts, fits them in the context window and sets max_tokens from the rest
+    token_budget: Optional[TokenBudget] = None
+    _semaphore: Optional[asyncio.Semaphore] = PrivateAttr(default=None)
+    _single_flight: Optional[SingleFlight] = PrivateAttr(default=None)
+
     @model_validator(mode="after")
     def init_client(self) -> Self:
         litellm.drop_params = True
+        litellm.suppress_debug_info = True
         self.supports_response_schema = supports_response_schema(self.model_name.split("/")[-1])
+        if self.max_concurrency:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.single_flight:
+            self._single_flight = SingleFlight()
         return self
 
+    def _concurrency_slot(self):
+        """Returns the async context manager bounding in-flight provider calls."""
+        return self._semaphore if self._semaphore is not None else nullcontext()
+
+    def _estimate_tokens(self, messages: list) -> int:
+        return estimate_message_tokens(messages) + (
+            self.max_tokens or self.completion_tokens_estimate
+        )
+
+    def _fit_prompt(self, messages: list) -> tuple[list, dict, int]:
+        """Fits ``messages`` in the context window of the model.
+
+        Returns the messages, the ``max_tokens`` argument of the call and the tokens reserved in
+        the rate limit budget.
+        """
+        if self.token_budget is None:
+            limits = {"max_tokens": self.max_tokens} if self.max_tokens else {}
+            return messages, limits, self._estimate_tokens(messages)
+        messages, prompt_tokens, max_tokens = self.token_budget.fit(messages, self.max_tokens)
+        # the completion rarely takes the whole window, reserve the usual length
+        tokens = prompt_tokens + (self.max_tokens or self.completion_tokens_estimate)
+        return messages, {"max_tokens": max_tokens}, tokens
+
+    async def _a_fit_prompt(self, messages: list) -> tuple[list, dict, int]:
+        """``_fit_prompt`` of the async calls, tokenizing in a thread off the event loop."""
+        if self.token_budget is None:
+            return self._fit_prompt(messages)
+        return await asyncio.to_thread(self._fit_prompt, messages)
+
+    @asynccontextmanager
+    async def _provider_slot(self, tokens: int = 0, operation: str = "completion"):
+        """Waits for the rate limit budget of the call, then for a concurrency slot.
+
+        Yields the ``LLMCall`` recording the metrics of the call. Its span includes the wait.
+        """
+        with span(f"llm.{operation}", model=self.model_name, estimated_tokens=tokens) as call_span:
+            waiting_since = time.perf_counter()
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(tokens)
+            async with self._concurrency_slot():
+                with track_llm_call(self.model_name, operation) as call:
+                    call_span.set_attribute("wait_seconds", call.start - waiting_since)
+                    yield call
+
+    @contextmanager
+    def _provider_slot_sync(self, tokens: int = 0, operation: str = "completion"):
+        """Sync version of ``_provider_slot``, the concurrency limit only bounds async calls."""
+        with span(f"llm.{operation}", model=self.model_name, estimated_tokens=tokens) as call_span:
+            waiting_since = time.perf_counter()
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire_sync(tokens)
+            with track_llm_call(self.model_name, operation) as call:
+                call_span.set_attribute("wait_seconds", call.start - waiting_since)
+                yield call
+
+    def _record_usage(self, call, estimated_tokens: int, response):
+        call.record_usage(response)
+        if self.rate_limiter is not None:
+            self.rate_limiter.record_usage(estimated_tokens, usage_tokens(response))
+
+    def _cache_key(self, messages: list, schema: Optional[Type[BaseModel]], **kwargs) -> str:
+        return make_cache_key(
+            model_name=self.model_name,
+            messages=messages,
+            schema=schema,
+            temperature=self.temperature,
+            seed=self.seed,
+            max_tokens=self.max_tokens,
+            **kwargs,
+        )
+
     def load_model(self, prompt: str, schema: Optional[Type[BaseModel]] = None, *args, **kwargs):
         pass
 
@@ -54,14 +243,71 @@ class InferenceLLMConfig(BaseModel):
             messages=messages, schema=schema, raw_response=raw_response, *args, **kwargs
         )
 
+    @traced("llm.generate")
+    async def a_generate_from_messages(
+        self,
+        messages: list,
+        schema: Optional[Type[BaseModel]] = None,
+        raw_response: bool = False,
+        *args,
+        **kwargs,
+    ):
+        # raw responses are provider objects and are never cached nor shared
+        if raw_response or (
+            self.cache is None and self.semantic_cache is None and self._single_flight is None
+        ):
+            return await self._a_generate_from_messages(
+                messages, schema, raw_response, *args, **kwargs
+            )
+
+        key = self._cache_key(messages, schema, **kwargs)
+        if self.cache is not None:
+            with span("cache.exact.get") as lookup:
+                cached = await self.cache.aget(key)
+                lookup.set_attribute("hit", cached is not None)
+            LLM_CACHE_LOOKUPS.inc(self.model_name, "exact", "miss" if cached is None else "hit")
+            if cached is not None:
+                return load_cached_value(cached, schema)
+
+        if self._single_flight is None:
+            return await self._a_generate_uncached(key, messages, schema, *args, **kwargs)
+        res = await self._single_flight.run(
+            key, lambda: self._a_generate_uncached(key, messages, schema, *args, **kwargs)
+        )
+        # the callers of a shared call must not see each other's changes to the instance
+        return res.model_copy(deep=True) if isinstance(res, BaseModel) else res
+
+    async def _a_generate_uncached(
+        self, key: str, messages: list, schema: Optional[Type[BaseModel]], *args, **kwargs
+    ):
+        """Semantic cache lookup then provider call, the answer is stored in both caches."""
+        prompt_vector = None
+        if self.semantic_cache is not None:
+            namespace = self._cache_key(messages[:-1], schema, **kwargs)
+            with span("cache.semantic.get") as lookup:
+                cached, prompt_vector = await self.semantic_cache.aget(namespace, messages)
+                lookup.set_attribute("hit", cached is not None)
+            LLM_CACHE_LOOKUPS.inc(self.model_name, "semantic", "miss" if cached is None else "hit")
+            if cached is not None:
+                return load_cached_value(cached, schema)
+
+        res = await self._a_generate_from_messages(messages, schema, False, *args, **kwargs)
+        if res is not None:
+            value = dump_cached_value(res, schema)
+            if self.cache is not None:
+                await self.cache.aset(key, value)
+            if prompt_vector is not None:
+                self.semantic_cache.add(namespace, prompt_vector, value)
+        return res
+
     @retry(
-        wait=wait_fixed(60),
+        wait=wait_retry_after(max=60),
         stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (litellm.exceptions.RateLimitError, instructor.exceptions.InstructorRetryException)
-        ),
+        retry=retry_if_exception(is_retryable),
+        before_sleep=before_retry_sleep,
     )
-    async def a_generate_from_messages(
+    @traced("llm.attempt")
+    async def _a_generate_from_messages(
         self,
         messages: list,
         schema: Optional[Type[BaseModel]] = None,
@@ -69,53 +315,124 @@ class InferenceLLMConfig(BaseModel):
         *args,
         **kwargs,
     ):
+        if self.hedger is not None:
+            return await self.hedger.run(
+                lambda: self._a_generate_routed(messages, schema, raw_response)
+            )
+        return await self._a_generate_routed(messages, schema, raw_response)
+
+    async def _a_generate_routed(
+        self, messages: list, schema: Optional[Type[BaseModel]] = None, raw_response: bool = False
+    ):
+        """One call, on the deployment picked by the router if there is one."""
+        if self.router is not None:
+            return await self.router.call(
+                lambda llm: llm._a_generate_once(messages, schema, raw_response)
+            )
+        return await self._a_generate_once(messages, schema, raw_response)
+
+    async def _a_generate_once(
+        self, messages: list, schema: Optional[Type[BaseModel]] = None, raw_response: bool = False
+    ):
+        """One provider call, on this client's deployment."""
+        messages, limits, tokens = await self._a_fit_prompt(messages)
         # check if model supports structured output
         if schema:
             if self.supports_response_schema:
-                res = await litellm.acompletion(
-                    model=self.model_name,
-                    api_key=self.api_key.get_secret_value(),
-                    base_url=self.base_url,
-                    messages=messages,
-                    response_format=schema,
-                    api_version=self.api_version,
-                )
+                async with self._provider_slot(tokens) as call:
+                    res = await litellm.acompletion(
+                        model=self.model_name,
+                        api_key=self.api_key.get_secret_value(),
+                        base_url=self.base_url,
+                        messages=messages,
+                        response_format=response_format(schema),
+                        api_version=self.api_version,
+                        **limits,
+                    )
+                self._record_usage(call, tokens, res)
                 if res.choices[0].finish_reason == "content_filter":
                     raise ValueError(f"Response filtred by content filter")
                 else:
-                    dict_res = ast.literal_eval(res.choices[0].message.content)
+                    output = parse_structured_output(schema, res.choices[0].message.content)
 
                     if raw_response:
                         return res
-                    return schema(**dict_res)
+                    return output
 
             else:
-                client = instructor.from_litellm(acompletion, mode=instructor.Mode.JSON)
-                output, raw_completion = await client.chat.completions.create_with_completion(
+                client = instructor_client(acompletion, instructor.Mode.JSON)
+                async with self._provider_slot(tokens) as call:
+                    output, raw_completion = await client.chat.completions.create_with_completion(
+                        model=self.model_name,
+                        api_key=self.api_key.get_secret_value(),
+                        base_url=self.base_url,
+                        messages=messages,
+                        response_model=schema,
+                        api_version=self.api_version,
+                        **limits,
+                    )
+                self._record_usage(call, tokens, raw_completion)
+
+                if raw_response:
+                    return raw_completion
+                return output
+
+        else:
+            async with self._provider_slot(tokens) as call:
+                res = await litellm.acompletion(
                     model=self.model_name,
                     api_key=self.api_key.get_secret_value(),
                     base_url=self.base_url,
                     messages=messages,
-                    response_model=schema,
                     api_version=self.api_version,
+                    **limits,
                 )
+            self._record_usage(call, tokens, res)
 
-                if raw_response:
-                    return raw_completion
-                return output
+            if raw_response:
+                return res
+            return res.choices[0].message.content
 
-        else:
+    async def a_stream_from_messages(
+        self,
+        messages: list,
+        *args,
+        **kwargs,
+    ) -> AsyncIterator[str]:
+        """Streaming variant of ``a_generate_from_messages``, yields the text deltas as they arrive.
+
+        The concurrency slot is held until the stream is exhausted. There is no retry: once tokens
+        have been sent to the caller the request can't be replayed transparently.
+        """
+        if self.router is not None:
+            async for delta in self.router.stream(lambda llm: llm.a_stream_from_messages(messages)):
+                yield delta
+            return
+
+        messages, limits, tokens = await self._a_fit_prompt(messages)
+        async with self._provider_slot(tokens, "stream") as call:
             res = await litellm.acompletion(
                 model=self.model_name,
                 api_key=self.api_key.get_secret_value(),
                 base_url=self.base_url,
                 messages=messages,
                 api_version=self.api_version,
+                stream=True,
+                **limits,
             )
-
-            if raw_response:
-                return res
-            return res.choices[0].message.content
+            deltas = 0
+            async for chunk in res:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason == "content_filter":
+                    raise ValueError(f"Response filtred by content filter")
+                if choice.delta.content:
+                    call.first_token()
+                    deltas += 1
+                    yield choice.delta.content
+            # providers send about one token per delta
+            call.record_tokens(estimate_message_tokens(messages), deltas)
 
     def generate(
         self,
@@ -130,14 +447,35 @@ class InferenceLLMConfig(BaseModel):
             messages=messages, schema=schema, raw_response=raw_response, *args, **kwargs
         )
 
+    def generate_from_messages(
+        self,
+        messages: list,
+        schema: Optional[Type[BaseModel]] = None,
+        raw_response: bool = False,
+        *args,
+        **kwargs,
+    ):
+        # raw responses are provider objects and are never cached
+        if self.cache is None or raw_response:
+            return self._generate_from_messages(messages, schema, raw_response, *args, **kwargs)
+
+        key = self._cache_key(messages, schema, **kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return load_cached_value(cached, schema)
+
+        res = self._generate_from_messages(messages, schema, raw_response, *args, **kwargs)
+        if res is not None:
+            self.cache.set(key, dump_cached_value(res, schema))
+        return res
+
     @retry(
-        wait=wait_fixed(60),
+        wait=wait_retry_after(max=60),
         stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (litellm.exceptions.RateLimitError, instructor.exceptions.InstructorRetryException)
-        ),
+        retry=retry_if_exception(is_retryable),
+        before_sleep=before_retry_sleep,
     )
-    def generate_from_messages(
+    def _generate_from_messages(
         self,
         messages: list,
         schema: Optional[Type[BaseModel]] = None,
@@ -146,30 +484,59 @@ class InferenceLLMConfig(BaseModel):
         **kwargs,
     ):
         try:
-            # check if model supports structured output
-            if schema:
-                if self.supports_response_schema:
+            if self.router is not None:
+                return self.router.call_sync(
+                    lambda llm: llm._generate_once(messages, schema, raw_response, *args, **kwargs)
+                )
+            return self._generate_once(messages, schema, raw_response, *args, **kwargs)
+        except (RateLimitExceeded, NoDeploymentAvailable):
+            raise
+        except Exception as e:
+            # provider throttling goes to the retry, as on the async path
+            if is_retryable(e):
+                raise
+            # todo handle cost if exception
+            logger.error(f"Error in generating response from LLM: {e}")
+            return None
+
+    def _generate_once(
+        self,
+        messages: list,
+        schema: Optional[Type[BaseModel]] = None,
+        raw_response: bool = False,
+        *args,
+        **kwargs,
+    ):
+        """One provider call, on this client's deployment."""
+        messages, limits, tokens = self._fit_prompt(messages)
+        kwargs = {**limits, **kwargs}
+        # check if model supports structured output
+        if schema:
+            if self.supports_response_schema:
+                with self._provider_slot_sync(tokens) as call:
                     res = litellm.completion(
                         model=self.model_name,
                         api_key=self.api_key.get_secret_value(),
                         base_url=self.base_url,
                         messages=messages,
-                        response_format=schema,
+                        response_format=response_format(schema),
                         api_version=self.api_version,
                         *args,
                         **kwargs,
                     )
-                    if res.choices[0].finish_reason == "content_filter":
-                        raise ValueError(f"Response filtred by content filter")
-                    else:
-                        dict_res = ast.literal_eval(res.choices[0].message.content)
+                self._record_usage(call, tokens, res)
+                if res.choices[0].finish_reason == "content_filter":
+                    raise ValueError(f"Response filtred by content filter")
+                else:
+                    output = parse_structured_output(schema, res.choices[0].message.content)
 
-                        if raw_response:
-                            return res
-                        return schema(**dict_res)
+                    if raw_response:
+                        return res
+                    return output
 
-                else:
-                    client = instructor.from_litellm(completion, mode=instructor.Mode.JSON)
+            else:
+                client = instructor_client(completion, instructor.Mode.JSON)
+                with self._provider_slot_sync(tokens) as call:
                     res, raw_completion = client.chat.completions.create_with_completion(
                         model=self.model_name,
                         api_key=self.api_key.get_secret_value(),
@@ -180,11 +547,13 @@ class InferenceLLMConfig(BaseModel):
                         *args,
                         **kwargs,
                     )
+                self._record_usage(call, tokens, raw_completion)
 
-                    if raw_response:
-                        return raw_completion
-                    return res
-            else:
+                if raw_response:
+                    return raw_completion
+                return res
+        else:
+            with self._provider_slot_sync(tokens) as call:
                 res = litellm.completion(
                     model=self.model_name,
                     api_key=self.api_key.get_secret_value(),
@@ -194,13 +563,10 @@ class InferenceLLMConfig(BaseModel):
                     *args,
                     **kwargs,
                 )
-                if raw_response:
-                    return res
-                return res.choices[0].message.content
-        except Exception as e:
-            # todo handle cost if exception
-            logger.error(f"Error in generating response from LLM: {e}")
-            return None
+            self._record_usage(call, tokens, res)
+            if raw_response:
+                return res
+            return res.choices[0].message.content
 
 
 class EmbeddingLLMConfig(InferenceLLMConfig):
@@ -212,44 +578,149 @@ class EmbeddingLLMConfig(InferenceLLMConfig):
     api_version: str = "2024-12-01-preview"  # used only if model is from azure openai
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
+    # concurrent a_embed_text calls are grouped into one provider request
+    micro_batch: bool = False
+    micro_batch_max_size: int = 64  # keep it under chunk_max_items
+    micro_batch_max_wait: float = 0.005
+    _batcher: Optional[EmbeddingBatcher] = PrivateAttr(default=None)
+
+    # embed_texts inputs are split into chunks fitting the provider limits
+    chunk_max_items: int = 256
+    chunk_max_tokens: int = 8000
+    chunk_max_in_flight: int = 4
+    chunk_attempts: int = 3
+
+    # persistent store checked before calling the provider, only misses are embedded
+    store: Optional[EmbeddingStore] = None
+
+    @model_validator(mode="after")
+    def init_batcher(self) -> Self:
+        if self.micro_batch:
+            self._batcher = EmbeddingBatcher(
+                self._a_embed_chunk,
+                max_batch_size=self.micro_batch_max_size,
+                max_wait=self.micro_batch_max_wait,
+            )
+        return self
+
     def load_model(self, prompt: str, schema: Optional[Type[BaseModel]] = None, *args, **kwargs):
         pass
 
+    def _store_lookup(self, texts: list[str]) -> tuple[list, list[str]]:
+        """Returns the stored vectors (None for misses) and the unique missing texts."""
+        vectors = self.store.get_many(self.model_name, texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        return vectors, missing
+
+    @staticmethod
+    def _merge_store_results(texts, vectors, missing, missing_vectors) -> list[list[float]]:
+        embedded = dict(zip(missing, missing_vectors))
+        return [
+            embedded[text] if vector is None else vector.tolist()
+            for text, vector in zip(texts, vectors)
+        ]
+
     def embed_text(self, text: str) -> list[float]:
-        response = embedding(
-            model=self.model_name,
-            api_base=self.base_url,
-            api_key=self.api_key.get_secret_value(),
-            input=[text],
-        )
+        if self.store is not None:
+            return self.embed_texts([text])[0]
+        return self._embed_text(text)
+
+    def _embed_text(self, text: str) -> list[float]:
+        with self._provider_slot_sync(estimate_tokens(text), "embedding") as call:
+            response = embedding(
+                model=self.model_name,
+                api_base=self.base_url,
+                api_key=self.api_key.get_secret_value(),
+                input=[text],
+            )
+            call.record_usage(response)
         return response.data[0]["embedding"]
 
     def embed_texts(self, texts: list[str]) -> list[list[float]]:
-        response = embedding(
-            model=self.model_name,
-            api_base=self.base_url,
-            api_key=self.api_key.get_secret_value(),
-            input=texts,
+        """Embeds ``texts`` in provider-sized chunks, run concurrently, results in input order.
+
+        Texts found in the store are not sent to the provider.
+        """
+        if self.store is None:
+            return self._embed_texts(texts)
+        vectors, missing = self._store_lookup(texts)
+        missing_vectors = self._embed_texts(missing) if missing else []
+        self.store.add_many(self.model_name, missing, missing_vectors)
+        return self._merge_store_results(texts, vectors, missing, missing_vectors)
+
+    def _embed_texts(self, texts: list[str]) -> list[list[float]]:
+        return map_chunks(
+            texts,
+            self._embed_chunk,
+            max_items=self.chunk_max_items,
+            max_tokens=self.chunk_max_tokens,
+            max_in_flight=self.chunk_max_in_flight,
+            attempts=self.chunk_attempts,
         )
-        return [data.embedding for data in response.data]
+
+    def _embed_chunk(self, texts: list[str]) -> list[list[float]]:
+        with self._provider_slot_sync(sum(map(estimate_tokens, texts)), "embedding") as call:
+            response = embedding(
+                model=self.model_name,
+                api_base=self.base_url,
+                api_key=self.api_key.get_secret_value(),
+                input=texts,
+            )
+            call.record_usage(response)
+        return [data["embedding"] for data in response.data]
 
     async def a_embed_text(self, text: str) -> list[float]:
-        response = await aembedding(
-            model=self.model_name,
-            api_base=self.base_url,
-            api_key=self.api_key.get_secret_value(),
-            input=[text],
-        )
+        if self.store is not None:
+            vectors, missing = await asyncio.to_thread(self._store_lookup, [text])
+            if not missing:
+                return vectors[0].tolist()
+            vector = await self._a_embed_text(text)
+            await asyncio.to_thread(self.store.add_many, self.model_name, [text], [vector])
+            return vector
+        return await self._a_embed_text(text)
+
+    async def _a_embed_text(self, text: str) -> list[float]:
+        if self._batcher is not None:
+            return await self._batcher.embed(text)
+        async with self._provider_slot(estimate_tokens(text), "embedding") as call:
+            response = await aembedding(
+                model=self.model_name,
+                api_base=self.base_url,
+                api_key=self.api_key.get_secret_value(),
+                input=[text],
+            )
+            call.record_usage(response)
         return response.data[0]["embedding"]
 
     async def a_embed_texts(self, texts: list[str]) -> list[list[float]]:
-        response = await aembedding(
-            model=self.model_name,
-            api_base=self.base_url,
-            api_key=self.api_key.get_secret_value(),
-            input=texts,
+        """Async version of ``embed_texts``, the store is read and written in a thread."""
+        if self.store is None:
+            return await self._a_embed_texts(texts)
+        vectors, missing = await asyncio.to_thread(self._store_lookup, texts)
+        missing_vectors = await self._a_embed_texts(missing) if missing else []
+        await asyncio.to_thread(self.store.add_many, self.model_name, missing, missing_vectors)
+        return self._merge_store_results(texts, vectors, missing, missing_vectors)
+
+    async def _a_embed_texts(self, texts: list[str]) -> list[list[float]]:
+        return await a_map_chunks(
+            texts,
+            self._a_embed_chunk,
+            max_items=self.chunk_max_items,
+            max_tokens=self.chunk_max_tokens,
+            max_in_flight=self.chunk_max_in_flight,
+            attempts=self.chunk_attempts,
         )
-        return [data.embedding for data in response.data]
+
+    async def _a_embed_chunk(self, texts: list[str]) -> list[list[float]]:
+        async with self._provider_slot(sum(map(estimate_tokens, texts)), "embedding") as call:
+            response = await aembedding(
+                model=self.model_name,
+                api_base=self.base_url,
+                api_key=self.api_key.get_secret_value(),
+                input=texts,
+            )
+            call.record_usage(response)
+        return [data["embedding"] for data in response.data]
 
     def get_model_name(self):
         return self.model_name
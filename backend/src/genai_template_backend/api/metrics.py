@@ -0,0 +1,389 @@
+"""Prometheus metrics of the backend, served as text at ``/metrics``.
+
+Every series (a metric and its label values) owns fixed slots in a flat buffer of doubles, so
+recording a sample is a dict lookup and a few in-place additions under a lock (samples also
+come from the threads of the sync paths and of ``asyncio.to_thread``), no object kept per sample.
+
+With ``METRICS_MULTIPROC_DIR`` set, the buffer of each worker process is a memory-mapped file
+of that directory, next to a json index of its series. ``/metrics`` served by any worker sums
+the files of all the workers. The gauges of dead workers are dropped, their counters and
+histograms are kept so they never go down. Empty the directory when the server restarts.
+"""
+
+import asyncio
+import glob
+import json
+import mmap
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Optional
+
+from genai_template_backend.env_settings import logger, settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 400, 800, 1600)
+
+
+class MetricsRegistry:
+    """Allocates the slots of the series and renders the Prometheus text format.
+
+    Args:
+        directory: directory of the per-process files, None to keep the values in memory.
+        max_slots: size of the buffer, each counter or gauge series takes one slot and each
+            histogram series ``len(buckets) + 2``.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_slots: int = 16384):
+        self.directory = directory
+        self.max_slots = max_slots
+        self.metrics: dict[str, "Metric"] = {}
+        self._series: list[dict] = []
+        self._next_slot = 0
+        # guards the allocation of the slots and the read-modify-write of the values
+        self.lock = threading.Lock()
+        self._open()
+        if directory:
+            os.register_at_fork(after_in_child=self._reopen_after_fork)
+
+    def _open(self):
+        self.pid = os.getpid()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"metrics_{self.pid}.f64")
+            with open(path, "wb") as f:
+                f.truncate(8 * self.max_slots)
+            with open(path, "r+b") as f:
+                self._buffer = mmap.mmap(f.fileno(), 8 * self.max_slots)
+        else:
+            self._buffer = bytearray(8 * self.max_slots)
+        self.values = memoryview(self._buffer).cast("d")
+
+    def _reopen_after_fork(self):
+        """A forked worker starts its own file, its series are created again on first use."""
+        for metric in self.metrics.values():
+            metric._children.clear()
+        self._series, self._next_slot = [], 0
+        self.lock = threading.Lock()  # another thread may have held it at the fork
+        self._open()
+
+    def _write_index(self):
+        path = os.path.join(self.directory, f"metrics_{self.pid}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self._series, f)
+        os.replace(f"{path}.tmp", path)
+
+    def allocate(self, metric: "Metric", labels: dict, size: int) -> int:
+        """Reserves ``size`` slots for a new series, the caller holds ``self.lock``."""
+        if self._next_slot + size > self.max_slots:
+            raise RuntimeError(f"Metrics buffer full ({self.max_slots} slots)")
+        slot = self._next_slot
+        self._next_slot += size
+        self._series.append({"name": metric.name, "labels": labels, "slot": slot})
+        if self.directory:
+            self._write_index()
+        return slot
+
+    def register(self, metric: "Metric") -> "Metric":
+        self.metrics[metric.name] = metric
+        return metric
+
+    def _snapshots(self):
+        """Yields ``(series, values, process is alive)`` of every process."""
+        if not self.directory:
+            yield self._series, self.values, True
+            return
+        for index_path in glob.glob(os.path.join(self.directory, "metrics_*.json")):
+            pid = int(os.path.basename(index_path)[len("metrics_") : -len(".json")])
+            try:
+                with open(index_path) as f:
+                    series = json.load(f)
+                with open(index_path[: -len(".json")] + ".f64", "rb") as f:
+                    values = memoryview(f.read()).cast("d")
+            except (OSError, ValueError):
+                continue
+            yield series, values, pid == self.pid or _is_alive(pid)
+
+    def render(self) -> str:
+        """Returns all the metrics in the Prometheus text exposition format."""
+        totals: dict[tuple, list[float]] = {}
+        for series_list, values, alive in self._snapshots():
+            for series in series_list:
+                metric = self.metrics.get(series["name"])
+                if metric is None or (metric.kind == "gauge" and not alive):
+                    continue
+                size = metric.slots_per_series
+                key = (metric.name, tuple(sorted(series["labels"].items())))
+                sample = values[series["slot"] : series["slot"] + size].tolist()
+                total = totals.setdefault(key, [0.0] * size)
+                for i, value in enumerate(sample):
+                    total[i] += value
+
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for (name, labels), total in sorted(totals.items()):
+                if name == metric.name:
+                    lines.extend(metric.render(dict(labels), total))
+        return "\n".join(lines) + "\n"
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Metric:
+    kind = ""
+    slots_per_series = 1
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        registry: Optional[MetricsRegistry] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.registry = registry if registry is not None else REGISTRY
+        self._children: dict[tuple, int] = {}
+        self.registry.register(self)
+
+    def _slot(self, label_values: tuple) -> int:
+        """Returns the first slot of the series, the caller holds ``self.registry.lock``."""
+        slot = self._children.get(label_values)
+        if slot is None:
+            labels = dict(zip(self.labelnames, map(str, label_values)))
+            slot = self.registry.allocate(self, labels, self.slots_per_series)
+            self._children[label_values] = slot
+        return slot
+
+    def _add(self, label_values: tuple, amount: float):
+        with self.registry.lock:
+            self.registry.values[self._slot(label_values)] += amount
+
+    def render(self, labels: dict, values: list[float]) -> list[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(values[0])}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float = 1.0):
+        self._add(label_values, amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *label_values, amount: float = 1.0):
+        self._add(label_values, amount)
+
+    def dec(self, *label_values, amount: float = 1.0):
+        self._add(label_values, -amount)
+
+    def set(self, value: float, *label_values):
+        with self.registry.lock:
+            self.registry.values[self._slot(label_values)] = value
+
+
+class Histogram(Metric):
+    """Histogram series laid out as: one count per bucket and +Inf, then the sum."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(float(bucket) for bucket in buckets)
+        self.slots_per_series = len(self.buckets) + 2
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, *label_values):
+        bucket = bisect_left(self.buckets, value)
+        with self.registry.lock:
+            slot = self._slot(label_values)
+            values = self.registry.values
+            values[slot + bucket] += 1
+            values[slot + len(self.buckets) + 1] += value
+
+    def render(self, labels: dict, values: list[float]) -> list[str]:
+        lines, cumulative = [], 0.0
+        for bound, count in zip(self.buckets + (float("inf"),), values):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _format_value(bound)
+            lines.append(
+                f"{self.name}_bucket{_format_labels({**labels, 'le': le})} "
+                f"{_format_value(cumulative)}"
+            )
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(values[-1])}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(cumulative)}")
+        return lines
+
+
+REGISTRY = MetricsRegistry(settings.METRICS_MULTIPROC_DIR)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Latency of the HTTP requests, streamed bodies included.",
+    ("method", "route", "status"),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served.")
+
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds",
+    "Latency of the provider calls.",
+    ("model", "operation", "outcome"),
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds", "Time to the first streamed token.", ("model",)
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_tokens_per_second",
+    "Completion tokens per second of the provider calls.",
+    ("model",),
+    buckets=TOKENS_PER_SECOND_BUCKETS,
+)
+LLM_PROMPT_TOKENS = Counter("llm_prompt_tokens_total", "Prompt tokens sent.", ("model",))
+LLM_COMPLETION_TOKENS = Counter(
+    "llm_completion_tokens_total", "Completion tokens received.", ("model",)
+)
+LLM_REQUESTS_IN_FLIGHT = Gauge(
+    "llm_requests_in_flight", "Provider calls in flight.", ("model", "operation")
+)
+LLM_RETRIES = Counter("llm_retries_total", "Retried provider calls.", ("model", "reason"))
+LLM_CACHE_LOOKUPS = Counter(
+    "llm_cache_lookups_total", "Response cache lookups.", ("model", "cache", "result")
+)
+LLM_HEDGED_CALLS = Counter(
+    "llm_hedged_calls_total",
+    "Hedging outcome: not_hedged, budget_exhausted, primary_won, hedge_won or failed.",
+    ("model", "outcome"),
+)
+LLM_HEDGE_LATENCY_SAVED = Histogram(
+    "llm_hedge_latency_saved_seconds",
+    "Estimated latency saved by the hedges that answered first.",
+    ("model",),
+)
+LLM_PROMPT_FITTED = Counter(
+    "llm_prompt_fitted_messages_total",
+    "Messages dropped or truncated to fit the prompts in the context window.",
+    ("model", "action"),
+)
+LLM_RATE_LIMIT_QUEUE_DEPTH = Gauge(
+    "llm_rate_limit_queue_depth", "Calls waiting for the rate limit budget.", ("model",)
+)
+LLM_RATE_LIMIT_THROTTLED = Counter(
+    "llm_rate_limit_throttled_total",
+    "Calls delayed or rejected by the rate limiter.",
+    ("model", "action"),
+)
+
+
+class LLMCall:
+    """Measures one provider call, see ``track_llm_call``."""
+
+    __slots__ = ("model", "start", "first_token_at")
+
+    def __init__(self, model: str):
+        self.model = model
+        self.start = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            LLM_TIME_TO_FIRST_TOKEN.observe(self.first_token_at - self.start, self.model)
+
+    def record_tokens(self, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+        if prompt_tokens:
+            LLM_PROMPT_TOKENS.inc(self.model, amount=prompt_tokens)
+        if completion_tokens:
+            LLM_COMPLETION_TOKENS.inc(self.model, amount=completion_tokens)
+            # generation speed, from the first token when the call was streamed
+            elapsed = time.perf_counter() - (self.first_token_at or self.start)
+            if elapsed > 0:
+                LLM_TOKENS_PER_SECOND.observe(completion_tokens / elapsed, self.model)
+
+    def record_usage(self, response):
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.record_tokens(
+                getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+            )
+
+
+@contextmanager
+def track_llm_call(model: str, operation: str):
+    """Counts the call in flight and records its latency and outcome."""
+    LLM_REQUESTS_IN_FLIGHT.inc(model, operation)
+    call = LLMCall(model)
+    outcome = "error"
+    try:
+        yield call
+        outcome = "success"
+    except asyncio.CancelledError:
+        # e.g. the losing call of a hedged request
+        outcome = "cancelled"
+        raise
+    finally:
+        LLM_REQUESTS_IN_FLIGHT.dec(model, operation)
+        LLM_REQUEST_DURATION.observe(time.perf_counter() - call.start, model, operation, outcome)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the latency of each request under its route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            # the template keeps the cardinality bounded, unmatched paths are grouped
+            path = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start, scope["method"], path, status
+            )
+
+
+if settings.METRICS_MULTIPROC_DIR:
+    logger.info(f"Metrics shared between workers in {settings.METRICS_MULTIPROC_DIR}")
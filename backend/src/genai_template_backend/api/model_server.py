@@ -0,0 +1,288 @@
+"""Dynamic batching of the calls to local torch models.
+
+Each model registered on the ``ModelServer`` gets a ``ModelWorker``: callers put their input in
+an asyncio queue and await their own output. A batching task takes the first queued input, then
+the next ones until ``max_batch_size`` are taken or ``max_wait`` seconds have passed, and runs the
+batch on a thread dedicated to the model, under ``torch.inference_mode``, on the device picked by
+``get_device_type``. The outputs are split back per caller. While a batch runs, the next callers
+queue up, so the batches grow with the load.
+
+torch is only imported when the first model runs, see ``lazy_imports``.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from genai_template_backend.env_settings import Settings, logger
+from genai_template_backend.lazy_imports import lazy_import
+from genai_template_backend.utils import get_device_type, set_seed
+
+torch = lazy_import("torch")
+
+
+def stack(inputs: list) -> Any:
+    """Default collate: one batch tensor from the tensors of the callers."""
+    return torch.stack(inputs)
+
+
+def unbind(outputs: Any) -> list:
+    """Default split: the rows of the output tensor, on the CPU."""
+    return list(outputs.cpu().unbind(0))
+
+
+def to_device(value: Any, device: str) -> Any:
+    """Moves the tensors of ``value`` (a tensor, tuple, list or dict of them) to ``device``."""
+    if isinstance(value, torch.Tensor):
+        return value.to(device, non_blocking=True)
+    if isinstance(value, (list, tuple)):
+        return type(value)(to_device(v, device) for v in value)
+    if isinstance(value, dict):
+        return {k: to_device(v, device) for k, v in value.items()}
+    return value
+
+
+class ModelWorker:
+    """Batches the calls to one model and runs them on its own thread.
+
+    Args:
+        name: name of the model, in the logs and the thread name.
+        model: the ``torch.nn.Module``, or a function building it, called on the worker thread.
+        max_batch_size: inputs run together at most.
+        max_wait: seconds the first input of a batch waits for others.
+        device: torch device, ``get_device_type()`` if None.
+        intra_op_threads: threads of torch's intra-op pool, which is shared by the whole process,
+            torch's default if None.
+        seed: seeds torch, numpy and random when the model is loaded, if not 0.
+        collate: builds the model input from the inputs of the callers, ``torch.stack`` by default.
+        split: splits the model output per caller, its rows by default.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: Any,
+        max_batch_size: int = 16,
+        max_wait: float = 0.005,
+        device: Optional[str] = None,
+        intra_op_threads: Optional[int] = None,
+        seed: int = 0,
+        collate: Callable[[list], Any] = stack,
+        split: Callable[[Any], list] = unbind,
+    ):
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.device = device
+        self.intra_op_threads = intra_op_threads
+        self.seed = seed
+        self.collate = collate
+        self.split = split
+        self._model = model
+        self._loaded = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"model-{name}")
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # instrumentation used to tune max_wait / max_batch_size
+        self.batches = 0
+        self.items = 0
+        self.max_seen_batch_size = 0
+        self.queue_wait_seconds = 0.0
+        self.inference_seconds = 0.0
+        self.batch_size_histogram: dict[int, int] = {}
+
+    def _load(self):
+        """Runs on the worker thread, before the first batch."""
+        if self.intra_op_threads:
+            torch.set_num_threads(self.intra_op_threads)
+        if self.seed:
+            set_seed(self.seed)
+        self.device = self.device or get_device_type()
+        model = self._model if isinstance(self._model, torch.nn.Module) else self._model()
+        self._model = model.to(self.device).eval()
+        self._loaded = True
+        logger.info(
+            f"Local model {self.name} loaded on {self.device} "
+            f"({torch.get_num_threads()} intra-op threads)"
+        )
+
+    def _forward(self, inputs: list) -> list:
+        if not self._loaded:
+            self._load()
+        with torch.inference_mode():
+            outputs = self._model(to_device(self.collate(inputs), self.device))
+            return self.split(outputs)
+
+    def _ensure_started(self):
+        # the queue and the batching task belong to the running event loop
+        if (
+            self._task is None
+            or self._task.done()
+            or self._task.get_loop() is not asyncio.get_running_loop()
+        ):
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(
+                self._serve(), name=f"model-{self.name}"
+            )
+
+    async def infer(self, item: Any) -> Any:
+        """Returns the output of the model for ``item``, computed in a batch with other calls."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, time.perf_counter()))
+        return await future
+
+    def _fail(self, batch: list, error: BaseException):
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def _shut_down_error(self) -> RuntimeError:
+        return RuntimeError(f"Local model {self.name} is shut down")
+
+    async def _next_batch(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        try:
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            # shut down while the batch forms, its callers are out of the queue already
+            self._fail(batch, self._shut_down_error())
+            raise
+        # callers cancelled while queued don't need an output
+        return [entry for entry in batch if not entry[1].done()]
+
+    async def _serve(self):
+        while True:
+            batch = await self._next_batch()
+            if batch:
+                await self._run(batch)
+
+    def _record(self, batch: list, start: float):
+        size = len(batch)
+        self.batches += 1
+        self.items += size
+        self.max_seen_batch_size = max(self.max_seen_batch_size, size)
+        self.queue_wait_seconds += sum(start - enqueued_at for _, _, enqueued_at in batch)
+        self.inference_seconds += time.perf_counter() - start
+        bucket = 1 << (size - 1).bit_length()  # next power of two
+        self.batch_size_histogram[bucket] = self.batch_size_histogram.get(bucket, 0) + 1
+
+    async def _run(self, batch: list):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            outputs = await loop.run_in_executor(
+                self._executor, self._forward, [item for item, _, _ in batch]
+            )
+        except asyncio.CancelledError:
+            # shut down while the batch runs
+            for _, future, _ in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"Local model {self.name} failed on a batch of {len(batch)}: {e}")
+            self._fail(batch, e)
+            return
+        finally:
+            self._record(batch, start)
+        if len(outputs) != len(batch):
+            error = RuntimeError(
+                f"Local model {self.name}: split returned {len(outputs)} outputs for a batch "
+                f"of {len(batch)} inputs"
+            )
+            logger.error(str(error))
+            self._fail(batch, error)
+            return
+        for (_, future, _), output in zip(batch, outputs):
+            if not future.done():
+                future.set_result(output)
+
+    async def aclose(self):
+        """Stops batching, fails the queued calls and waits for the running batch."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            self._fail([self._queue.get_nowait()], self._shut_down_error())
+        await asyncio.to_thread(self._executor.shutdown)
+
+    def stats(self) -> dict:
+        return {
+            "device": self.device,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_seen_batch_size,
+            "mean_queue_wait_ms": (
+                1000 * self.queue_wait_seconds / self.items if self.items else 0.0
+            ),
+            "mean_batch_ms": 1000 * self.inference_seconds / self.batches if self.batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_size_histogram.items())),
+        }
+
+
+class ModelServer:
+    """Registry of the local models, each served by its own ``ModelWorker``.
+
+    The arguments are the defaults of the workers, see ``ModelWorker``.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = 16,
+        max_wait: float = 0.005,
+        device: Optional[str] = None,
+        intra_op_threads: Optional[int] = None,
+        seed: int = 0,
+    ):
+        self.defaults = {
+            "max_batch_size": max_batch_size,
+            "max_wait": max_wait,
+            "device": device,
+            "intra_op_threads": intra_op_threads,
+            "seed": seed,
+        }
+        self.workers: dict[str, ModelWorker] = {}
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "ModelServer":
+        return cls(
+            max_batch_size=settings.LOCAL_MODEL_MAX_BATCH_SIZE,
+            max_wait=settings.LOCAL_MODEL_MAX_WAIT,
+            device=settings.LOCAL_MODEL_DEVICE,
+            intra_op_threads=settings.LOCAL_MODEL_INTRA_OP_THREADS,
+            seed=settings.LOCAL_MODEL_SEED,
+        )
+
+    def register(self, name: str, model: Any, **kwargs) -> ModelWorker:
+        """Serves ``model`` under ``name``, ``kwargs`` override the defaults of the server."""
+        if name in self.workers:
+            raise ValueError(f"A local model named {name!r} is already registered")
+        self.workers[name] = ModelWorker(name, model, **{**self.defaults, **kwargs})
+        return self.workers[name]
+
+    async def infer(self, name: str, item: Any) -> Any:
+        worker = self.workers.get(name)
+        if worker is None:
+            raise KeyError(f"No local model named {name!r}")
+        return await worker.infer(item)
+
+    async def aclose(self):
+        await asyncio.gather(*(worker.aclose() for worker in self.workers.values()))
+
+    def stats(self) -> dict:
+        return {name: worker.stats() for name, worker in self.workers.items()}
@@ -0,0 +1,245 @@
+"""Client-side rate limiting and retry backoff of the provider calls.
+
+A ``RateLimiter`` holds token buckets for the requests per minute and the tokens per minute of
+one model, shared by all the clients of that model in the worker. A call reserves its budget
+up front and sleeps exactly until the buckets cover it, so queued calls are released one after
+the other instead of all retrying in lockstep. When the wait would exceed ``max_wait`` the call
+is rejected at once with ``RateLimitExceeded``.
+
+When the provider still answers 429, ``wait_retry_after`` sleeps for its ``Retry-After`` (or
+an exponential backoff with jitter) and ``RateLimiter.pause`` holds back the other calls of the
+model for the same duration.
+"""
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from typing import Optional
+
+from tenacity import RetryCallState
+from tenacity.wait import wait_base, wait_exponential_jitter
+
+from genai_template_backend.api.metrics import LLM_RATE_LIMIT_QUEUE_DEPTH, LLM_RATE_LIMIT_THROTTLED
+from genai_template_backend.env_settings import logger
+
+
+class RateLimitExceeded(Exception):
+    """The call would wait more than ``max_wait`` for the rate limit budget."""
+
+    def __init__(self, model_name: str, retry_after: float):
+        super().__init__(f"Rate limit of {model_name} exhausted, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Bucket refilled at ``per_minute / 60`` units per second, holding at most ``capacity``.
+
+    Reservations may take the level below zero: it is the debt the next callers wait for.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` units are available."""
+        self._refill(now)
+        # a request larger than the whole bucket waits for a full bucket
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0.0) / self.rate
+
+    def take(self, amount: float):
+        self.level -= amount
+
+
+def estimate_message_tokens(messages: list) -> int:
+    """Cheap estimate of the prompt tokens, about 4 characters per token."""
+    characters = 0
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):  # multimodal content parts
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        characters += len(content) + 16  # role and message framing
+    return characters // 4 + 1
+
+
+class RateLimiter:
+    """Requests/min and tokens/min limits of one model.
+
+    Args:
+        model_name: name used in the logs and errors.
+        requests_per_minute: maximum requests per minute, None for no limit.
+        tokens_per_minute: maximum prompt + completion tokens per minute, None for no limit.
+        max_wait: calls that would wait longer than this many seconds are rejected.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_wait: float = 10.0,
+    ):
+        self.model_name = model_name
+        self.max_wait = max_wait
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+        # the sync clients call from threads
+        self._lock = threading.Lock()
+
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.provider_throttles = 0
+        self.wait_seconds = 0.0
+
+    def _reserve(self, tokens: int) -> float:
+        """Takes the budget of a call and returns how long it must wait before running."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self._paused_until - now, 0.0)
+            if self.requests is not None:
+                wait = max(wait, self.requests.wait_time(1, now))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.wait_time(tokens, now))
+            if wait > self.max_wait:
+                self.rejected += 1
+                LLM_RATE_LIMIT_THROTTLED.inc(self.model_name, "rejected")
+                raise RateLimitExceeded(self.model_name, wait)
+
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+            if wait > 0:
+                self.throttled += 1
+                self.wait_seconds += wait
+                LLM_RATE_LIMIT_THROTTLED.inc(self.model_name, "delayed")
+            return wait
+
+    def _enter_queue(self):
+        with self._lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            LLM_RATE_LIMIT_QUEUE_DEPTH.inc(self.model_name)
+
+    def _leave_queue(self):
+        with self._lock:
+            self.queue_depth -= 1
+            LLM_RATE_LIMIT_QUEUE_DEPTH.dec(self.model_name)
+
+    async def acquire(self, tokens: int = 0):
+        """Waits until the call fits in the limits, raises ``RateLimitExceeded`` if too long."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            self._enter_queue()
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._leave_queue()
+
+    def acquire_sync(self, tokens: int = 0):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            self._enter_queue()
+            try:
+                time.sleep(wait)
+            finally:
+                self._leave_queue()
+
+    def record_usage(self, estimated_tokens: int, used_tokens: Optional[int]):
+        """Corrects the tokens bucket with the usage reported by the provider."""
+        if self.tokens is None or used_tokens is None:
+            return
+        with self._lock:
+            self.tokens.take(used_tokens - estimated_tokens)
+
+    def pause(self, seconds: float):
+        """Holds back every call of the model, used when the provider answered 429."""
+        with self._lock:
+            self.provider_throttles += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logger.warning(f"{self.model_name} throttled by the provider, pausing calls {seconds:.1f}s")
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+            "provider_throttles": self.provider_throttles,
+            "wait_seconds": self.wait_seconds,
+        }
+
+
+_rate_limiters: dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(
+    model_name: str,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    max_wait: float = 10.0,
+) -> Optional[RateLimiter]:
+    """Returns the limiter shared by the clients of ``model_name``, None if it has no limits."""
+    if not requests_per_minute and not tokens_per_minute:
+        return None
+    if model_name not in _rate_limiters:
+        logger.info(
+            f"Rate limiting {model_name}: {requests_per_minute} requests/min, "
+            f"{tokens_per_minute} tokens/min"
+        )
+        _rate_limiters[model_name] = RateLimiter(
+            model_name, requests_per_minute, tokens_per_minute, max_wait
+        )
+    return _rate_limiters[model_name]
+
+
+def retry_after_seconds(exception: Optional[BaseException]) -> Optional[float]:
+    """Reads the ``Retry-After`` / ``retry-after-ms`` headers of a provider error."""
+    headers = getattr(exception, "litellm_response_headers", None) or getattr(
+        getattr(exception, "response", None), "headers", None
+    )
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:  # HTTP date
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class wait_retry_after(wait_base):
+    """Waits for the ``Retry-After`` of the error if there is one, else exponential backoff.
+
+    A little jitter is added to ``Retry-After`` so the clients don't come back all at once.
+    """
+
+    def __init__(self, initial: float = 1.0, max: float = 60.0, jitter: float = 1.0):
+        self.max = max
+        self.jitter = jitter
+        self.backoff = wait_exponential_jitter(initial=initial, max=max, jitter=jitter)
+
+    def __call__(self, retry_state: RetryCallState) -> float:
+        exception = retry_state.outcome.exception() if retry_state.outcome else None
+        retry_after = retry_after_seconds(exception)
+        if retry_after is not None:
+            return min(retry_after + random.uniform(0, self.jitter), self.max)
+        return self.backoff(retry_state)
@@ -1,8 +1,30 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+import asyncio
+import json
+import math
+import time
+import uuid
+from functools import lru_cache
+from typing import Any, Optional, Type, Union
 
-from genai_template_backend.api.llm import InferenceLLMConfig
-from genai_template_backend.env_settings import settings
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, create_model
+from tenacity import RetryError
+
+from genai_template_backend.api.clients import (
+    get_conversation_store,
+    get_embedding_llm,
+    get_inference_llm,
+)
+from genai_template_backend.api.conversations import ConversationStore
+from genai_template_backend.api.deployment_router import NoDeploymentAvailable
+from genai_template_backend.api.llm import EmbeddingLLMConfig, InferenceLLMConfig, provider_error
+from genai_template_backend.api.rate_limit import RateLimitExceeded, retry_after_seconds
+from genai_template_backend.api.token_budget import ContextWindowExceeded
+from genai_template_backend.env_settings import logger, settings
+from genai_template_backend.lazy_imports import lazy_import
+
+litellm = lazy_import("litellm")
 
 router = APIRouter()
 
@@ -15,22 +37,331 @@ class ChatResponse(BaseModel):
     response: str
 
 
+def get_conversation_id(http_request: Request) -> str:
+    """Returns the conversation id of the session, a new one for a new session."""
+    return http_request.session.setdefault("conversation_id", uuid.uuid4().hex)
+
+
 @router.post("/api/chat", response_model=ChatResponse)
-async def post_chat_message(request: ChatRequest):
-    llm = InferenceLLMConfig(
-        model_name=settings.INFERENCE_DEPLOYMENT_NAME,
-        api_key=settings.INFERENCE_API_KEY,
-        base_url=settings.INFERENCE_BASE_URL,
-        api_version=settings.INFERENCE_API_VERSION,
-    )
+async def post_chat_message(
+    request: ChatRequest,
+    http_request: Request,
+    llm: InferenceLLMConfig = Depends(get_inference_llm),
+    conversations: ConversationStore = Depends(get_conversation_store),
+):
+    """Answers the message, in the context of the conversation of the session."""
+    conversation_id = get_conversation_id(http_request)
+    conversation = await conversations.aget(conversation_id)
+    try:
+        response_text = await llm.a_generate_from_messages(
+            messages=conversations.prompt_messages(conversation, request.message),
+        )
+    except RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    except NoDeploymentAvailable as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    except ContextWindowExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except RetryError as e:
+        error = provider_error(unwrap_retry_error(e))
+        logger.error(f"Error in generating response from LLM: {error!r}")
+        if isinstance(error, litellm.exceptions.RateLimitError):
+            retry_after = retry_after_seconds(error)
+            if retry_after is None:
+                # the provider limits are per minute
+                retry_after = 60
+            raise HTTPException(
+                status_code=429,
+                detail=f"The model provider is rate limited: {error}",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+        response_text = None
+    except Exception as e:
+        logger.error(f"Error in generating response from LLM: {e}")
+        response_text = None
+
+    if not response_text or response_text.startswith("Error:"):
+        raise HTTPException(status_code=404, detail=response_text)
 
-    response_text = llm.generate_from_messages(
-        messages=[
+    await conversations.aappend(
+        conversation_id,
+        [
             {"role": "user", "content": request.message},
+            {"role": "assistant", "content": response_text},
         ],
+        llm,
     )
+    return ChatResponse(response=response_text)
 
-    if not response_text or response_text.startswith("Error:"):
-        raise HTTPException(status_code=404, detail=response_text)
 
-    return ChatResponse(response=response_text)
+@router.get("/api/chat/history")
+async def get_chat_history(
+    http_request: Request, conversations: ConversationStore = Depends(get_conversation_store)
+):
+    """Returns the summary and the latest turns of the conversation of the session."""
+    conversation = await conversations.aget(get_conversation_id(http_request))
+    return {
+        "summary": conversation.summary,
+        "messages": conversation.messages,
+        "summarized_messages": conversation.summarized_messages,
+    }
+
+
+@router.delete("/api/chat/history")
+async def delete_chat_history(
+    http_request: Request, conversations: ConversationStore = Depends(get_conversation_store)
+):
+    """Starts a new conversation for the session."""
+    await conversations.adelete(get_conversation_id(http_request))
+    return {"deleted": True}
+
+
+@router.get("/api/chat/cache")
+async def get_chat_cache_stats(llm: InferenceLLMConfig = Depends(get_inference_llm)):
+    """Returns the hit/miss counters of the response caches, ``null`` for the disabled ones.
+
+    ``single_flight.deduplicated`` counts the requests answered by an identical in-flight call.
+    """
+    return {
+        "response_cache": llm.cache.stats() if llm.cache else None,
+        "semantic_cache": llm.semantic_cache.stats() if llm.semantic_cache else None,
+        "single_flight": llm._single_flight.stats() if llm._single_flight else None,
+    }
+
+
+@router.get("/api/chat/rate-limit")
+async def get_chat_rate_limit_stats(
+    llm: InferenceLLMConfig = Depends(get_inference_llm),
+    embedding_llm: Optional[EmbeddingLLMConfig] = Depends(get_embedding_llm),
+):
+    """Returns the queue depth and throttle counters of the rate limiters, ``null`` if unlimited."""
+    return {
+        "inference": llm.rate_limiter.stats() if llm.rate_limiter else None,
+        "embeddings": (
+            embedding_llm.rate_limiter.stats()
+            if embedding_llm is not None and embedding_llm.rate_limiter
+            else None
+        ),
+    }
+
+
+@router.get("/api/chat/deployments")
+async def get_chat_deployments(llm: InferenceLLMConfig = Depends(get_inference_llm)):
+    """Returns the latency / error rate averages and circuit state of the routed deployments."""
+    return {"deployments": llm.router.stats() if llm.router is not None else []}
+
+
+def format_sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Formats ``data`` as a Server-Sent Event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@router.post("/api/chat/stream")
+async def post_chat_message_stream(
+    request: ChatRequest,
+    http_request: Request,
+    llm: InferenceLLMConfig = Depends(get_inference_llm),
+    conversations: ConversationStore = Depends(get_conversation_store),
+):
+    """Streams the answer as Server-Sent Events.
+
+    Each token delta is sent as ``data: {"delta": "..."}``. The stream ends with a ``done`` event
+    carrying the time-to-first-token and the total latency in seconds, or an ``error`` event.
+    """
+    start_time = time.perf_counter()
+    # before the response starts, so the session cookie is sent with it
+    conversation_id = get_conversation_id(http_request)
+    conversation = await conversations.aget(conversation_id)
+    messages = conversations.prompt_messages(conversation, request.message)
+
+    async def event_stream():
+        ttft = None
+        deltas = []
+        try:
+            async for delta in llm.a_stream_from_messages(messages=messages):
+                if ttft is None:
+                    ttft = time.perf_counter() - start_time
+                deltas.append(delta)
+                yield format_sse_event({"delta": delta})
+        except Exception as e:
+            logger.error(f"Error in streaming response from LLM: {e}")
+            yield format_sse_event({"detail": str(e)}, event="error")
+            return
+
+        # before the done event: the client may send the next message as soon as it gets it
+        await conversations.aappend(
+            conversation_id,
+            [
+                {"role": "user", "content": request.message},
+                {"role": "assistant", "content": "".join(deltas)},
+            ],
+            llm,
+        )
+        total = time.perf_counter() - start_time
+        logger.debug(f"Chat stream: time to first token {ttft}s, total {total}s.")
+        yield format_sse_event({"ttft": ttft, "total": total}, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class ChatBatchRequest(BaseModel):
+    """Prompts answered concurrently, optionally all with the same JSON ``schema``."""
+
+    model_config = ConfigDict(populate_by_name=True)
+
+    requests: list[ChatRequest] = Field(min_length=1)
+    response_schema: Optional[dict] = Field(default=None, alias="schema")
+    max_concurrency: Optional[int] = Field(default=None, ge=1)
+    stream: bool = False
+
+
+class ChatBatchItem(BaseModel):
+    index: int
+    response: Optional[Any] = None
+    error: Optional[str] = None
+
+
+class ChatBatchResponse(BaseModel):
+    results: list[ChatBatchItem]
+
+
+JSON_SCHEMA_TYPES = {"string": str, "integer": int, "number": float, "boolean": bool}
+
+
+@lru_cache(maxsize=64)
+def _model_from_json_schema(serialized_schema: str) -> Type[BaseModel]:
+    return json_schema_to_model(json.loads(serialized_schema))
+
+
+def json_schema_to_model(schema: dict, name: Optional[str] = None) -> Type[BaseModel]:
+    """Builds a pydantic model from a JSON schema of an object.
+
+    Only the common keywords are supported: ``properties``, ``required`` and the primitive,
+    ``array`` and ``object`` types.
+    """
+    if schema.get("type", "object") != "object" or "properties" not in schema:
+        raise ValueError("The schema must be an object with properties")
+
+    def field_type(field_name: str, property_schema: dict):
+        property_type = property_schema.get("type")
+        if isinstance(property_type, list):
+            # e.g. ["string", "null"], the nullable form
+            types = tuple(
+                field_type(field_name, {**property_schema, "type": t})
+                for t in property_type
+                if t != "null"
+            )
+            union = Union[types] if types else type(None)
+            return Optional[union] if "null" in property_type else union
+        if property_type in JSON_SCHEMA_TYPES:
+            return JSON_SCHEMA_TYPES[property_type]
+        if property_type == "array":
+            return list[field_type(field_name, property_schema.get("items", {}))]
+        if property_type == "object":
+            if "properties" in property_schema:
+                return json_schema_to_model(property_schema, field_name.title())
+            return dict
+        return Any
+
+    required = set(schema.get("required", []))
+    fields = {
+        field_name: (field_type(field_name, property_schema), ...)
+        if field_name in required
+        else (Optional[field_type(field_name, property_schema)], None)
+        for field_name, property_schema in schema["properties"].items()
+    }
+    return create_model(name or schema.get("title", "BatchResponse"), **fields)
+
+
+def model_from_json_schema(schema: dict) -> Type[BaseModel]:
+    """Memoized ``json_schema_to_model``, a batch builds its model once."""
+    return _model_from_json_schema(json.dumps(schema, sort_keys=True))
+
+
+def unwrap_retry_error(e: Exception) -> BaseException:
+    """Returns the error of the last attempt of a ``RetryError``, ``e`` otherwise."""
+    if isinstance(e, RetryError) and e.last_attempt.failed:
+        return e.last_attempt.exception()
+    return e
+
+
+async def generate_batch_item(
+    llm: InferenceLLMConfig,
+    index: int,
+    message: str,
+    schema: Optional[Type[BaseModel]],
+    semaphore: asyncio.Semaphore,
+) -> ChatBatchItem:
+    """Answers one prompt of a batch, failures are returned as the item error."""
+    async with semaphore:
+        try:
+            response = await llm.a_generate_from_messages(
+                messages=[{"role": "user", "content": message}], schema=schema
+            )
+        except Exception as e:
+            e = unwrap_retry_error(e)
+            logger.error(f"Error in generating batch item {index}: {e!r}")
+            return ChatBatchItem(index=index, error=str(e) or type(e).__name__)
+
+    if response is None or (isinstance(response, str) and response.startswith("Error:")):
+        return ChatBatchItem(index=index, error=response or "Empty response")
+    if isinstance(response, BaseModel):
+        response = response.model_dump(mode="json")
+    return ChatBatchItem(index=index, response=response)
+
+
+@router.post("/api/chat/batch", response_model=ChatBatchResponse)
+async def post_chat_batch(
+    request: ChatBatchRequest, llm: InferenceLLMConfig = Depends(get_inference_llm)
+):
+    """Answers a list of prompts with at most ``max_concurrency`` of them in flight.
+
+    Results are returned in the order of the requests, each with its own ``error``. With
+    ``stream``, the items are sent as NDJSON lines as soon as they complete.
+    """
+    if len(request.requests) > settings.LLM_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch holds at most {settings.LLM_BATCH_MAX_ITEMS} requests",
+        )
+    schema = None
+    if request.response_schema is not None:
+        try:
+            schema = model_from_json_schema(request.response_schema)
+        except (ValueError, TypeError) as e:
+            raise HTTPException(status_code=422, detail=f"Invalid schema: {e}")
+
+    max_concurrency = min(
+        request.max_concurrency or settings.LLM_BATCH_MAX_CONCURRENCY,
+        settings.LLM_BATCH_MAX_CONCURRENCY,
+    )
+    semaphore = asyncio.Semaphore(max_concurrency)
+    coroutines = [
+        generate_batch_item(llm, index, chat_request.message, schema, semaphore)
+        for index, chat_request in enumerate(request.requests)
+    ]
+
+    if not request.stream:
+        return ChatBatchResponse(results=await asyncio.gather(*coroutines))
+
+    async def item_stream():
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        try:
+            for next_item in asyncio.as_completed(tasks):
+                item = await next_item
+                yield item.model_dump_json() + "\n"
+        finally:
+            # the client went away, the remaining prompts are not needed anymore
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(item_stream(), media_type="application/x-ndjson")
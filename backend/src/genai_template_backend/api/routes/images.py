@@ -0,0 +1,215 @@
+import asyncio
+import math
+import os
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from genai_template_backend.api.clients import get_image_pipeline
+from genai_template_backend.api.image_pipeline import (
+    ImagePipeline,
+    InvalidImage,
+    PipelineSaturated,
+    remove_file,
+)
+from genai_template_backend.env_settings import logger, settings
+
+router = APIRouter()
+
+
+class UploadedImage(BaseModel):
+    id: str
+    filename: str
+    content_type: Optional[str] = None
+    size_bytes: int
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    preprocessing_ms: float
+
+
+class UploadImagesResponse(BaseModel):
+    images: list[UploadedImage]
+
+
+class MultipartEvents:
+    """Callbacks of the ``MultipartParser``, queued for the route to handle them asynchronously.
+
+    Events are ``("headers", {name: value})``, ``("data", bytes)`` and ``("end", None)``.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._headers = {}
+        self._field = b""
+        self._value = b""
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def on_headers_finished(self):
+        self.events.append(("headers", self._headers))
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        self.events.append(("data", data[start:end]))
+
+    def on_part_end(self):
+        self.events.append(("end", None))
+
+    def callbacks(self) -> dict:
+        return {name: getattr(self, name) for name in dir(self) if name.startswith("on_")}
+
+    def drain(self) -> list:
+        events, self.events = self.events, []
+        return events
+
+
+class Upload:
+    """A file part being written to disk, holding its slot of the preprocessing pipeline."""
+
+    def __init__(self, filename: str, content_type: Optional[str], path: str, block):
+        self.id = os.path.basename(path)
+        self.filename = filename
+        self.content_type = content_type
+        self.path = path
+        self.block = block
+        self.file = None
+        self.size_bytes = 0
+        self.task: Optional[asyncio.Task] = None
+
+
+def parse_boundary(request: Request) -> bytes:
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=415, detail="Expected a multipart/form-data body")
+    return options[b"boundary"]
+
+
+async def start_upload(headers: dict, pipeline: ImagePipeline, uploads: list) -> Optional[Upload]:
+    """Reserves a slot for a file part and opens its file, None for the other fields."""
+    _, options = parse_options_header(headers.get(b"content-disposition"))
+    if b"filename" not in options:
+        return None
+    if len(uploads) >= settings.IMAGE_MAX_FILES:
+        raise HTTPException(
+            status_code=413, detail=f"At most {settings.IMAGE_MAX_FILES} images per request"
+        )
+    # backpressure: waits for a free slot before reading the body of the file
+    block = await pipeline.acquire()
+    content_type = headers.get(b"content-type")
+    upload = Upload(
+        filename=options[b"filename"].decode(errors="replace"),
+        content_type=content_type.decode(errors="replace") if content_type else None,
+        path=os.path.join(pipeline.upload_dir, uuid.uuid4().hex),
+        block=block,
+    )
+    uploads.append(upload)
+    upload.file = await asyncio.to_thread(open, upload.path, "wb")
+    return upload
+
+
+async def discard(uploads: list[Upload], pipeline: ImagePipeline):
+    """Deletes the uploads of a failed request and frees their slots."""
+    for upload in uploads:
+        if upload.task is not None:
+            # the pipeline frees the slot of a started job once the job ends
+            await asyncio.gather(upload.task, return_exceptions=True)
+            pipeline.images.pop(upload.id, None)
+        else:
+            pipeline.release(upload.block)
+        if upload.file is not None:
+            upload.file.close()
+        remove_file(upload.path)
+
+
+@router.post("/api/images", response_model=UploadImagesResponse)
+async def upload_images(request: Request, pipeline: ImagePipeline = Depends(get_image_pipeline)):
+    """Stores the images of a multipart upload and preprocesses them for the try-on model.
+
+    The body is streamed to disk part by part, never held in memory. The preprocessing of a file
+    starts as soon as it is received, while the next ones are uploaded.
+    """
+    events = MultipartEvents()
+    parser = MultipartParser(parse_boundary(request), events.callbacks())
+    uploads: list[Upload] = []
+    upload = None
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except MultipartParseError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid multipart body: {e}")
+            pending = []
+            for event, value in events.drain():
+                if event == "headers":
+                    upload = await start_upload(value, pipeline, uploads)
+                elif upload is None:
+                    continue
+                elif event == "data":
+                    upload.size_bytes += len(value)
+                    if upload.size_bytes > settings.IMAGE_MAX_UPLOAD_BYTES:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"{upload.filename} is larger than "
+                            f"{settings.IMAGE_MAX_UPLOAD_BYTES} bytes",
+                        )
+                    pending.append(value)
+                else:
+                    # one write per chunk received, off the event loop
+                    await asyncio.to_thread(upload.file.write, b"".join(pending))
+                    pending.clear()
+                    await asyncio.to_thread(upload.file.close)
+                    upload.task = asyncio.create_task(
+                        pipeline.preprocess(upload.id, upload.path, upload.block)
+                    )
+                    upload = None
+            if upload is not None and pending:
+                await asyncio.to_thread(upload.file.write, b"".join(pending))
+        parser.finalize()
+        if upload is not None or not uploads:
+            raise HTTPException(status_code=400, detail="The body holds no complete image file")
+        results = await asyncio.gather(*(upload.task for upload in uploads))
+    except PipelineSaturated as e:
+        await discard(uploads, pipeline)
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    except InvalidImage as e:
+        await discard(uploads, pipeline)
+        raise HTTPException(status_code=422, detail=str(e))
+    except BaseException:
+        await discard(uploads, pipeline)
+        raise
+
+    logger.info(f"Preprocessed {len(uploads)} uploaded images, pipeline: {pipeline.stats()}")
+    return UploadImagesResponse(
+        images=[
+            UploadedImage(
+                id=upload.id,
+                filename=upload.filename,
+                content_type=upload.content_type,
+                size_bytes=upload.size_bytes,
+                width=result["width"],
+                height=result["height"],
+                original_width=result["original_width"],
+                original_height=result["original_height"],
+                preprocessing_ms=1000 * result["seconds"],
+            )
+            for upload, result in zip(uploads, results)
+        ]
+    )
@@ -0,0 +1,138 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field, model_validator
+
+from genai_template_backend.api.clients import get_embedding_llm, get_vector_index
+from genai_template_backend.api.llm import EmbeddingLLMConfig
+from genai_template_backend.api.vector_index import VectorIndex
+from genai_template_backend.env_settings import logger
+
+router = APIRouter()
+
+
+class SearchRequest(BaseModel):
+    """Either a text ``query`` or the ``item_id`` of an indexed item to find similar items to."""
+
+    query: Optional[str] = None
+    item_id: Optional[int] = None
+    k: int = Field(default=10, ge=1, le=100)
+
+    @model_validator(mode="after")
+    def check_one_target(self):
+        if (self.query is None) == (self.item_id is None):
+            raise ValueError("Exactly one of query and item_id must be set")
+        return self
+
+
+class SearchResult(BaseModel):
+    id: int
+    score: float
+
+
+class SearchResponse(BaseModel):
+    results: list[SearchResult]
+
+
+class IndexItem(BaseModel):
+    """Item to index, described by a text to embed or by its embedding."""
+
+    id: int
+    text: Optional[str] = None
+    vector: Optional[list[float]] = None
+
+    @model_validator(mode="after")
+    def check_one_source(self):
+        if (self.text is None) == (self.vector is None):
+            raise ValueError("Exactly one of text and vector must be set")
+        return self
+
+
+class IndexItemsRequest(BaseModel):
+    items: list[IndexItem] = Field(min_length=1)
+
+
+def require_embedding_llm(llm: Optional[EmbeddingLLMConfig]) -> EmbeddingLLMConfig:
+    if llm is None:
+        raise HTTPException(status_code=503, detail="No embedding model is configured")
+    return llm
+
+
+@router.post("/api/search", response_model=SearchResponse)
+async def search_similar_items(
+    request: SearchRequest,
+    index: VectorIndex = Depends(get_vector_index),
+    embedding_llm: Optional[EmbeddingLLMConfig] = Depends(get_embedding_llm),
+):
+    """Returns the ``k`` items closest to the query text or to an indexed item."""
+    vector = None
+    if request.query is not None:
+        vector = await require_embedding_llm(embedding_llm).a_embed_text(request.query)
+
+    def search():
+        # the item itself is its nearest neighbour
+        if vector is None:
+            item_vector = index.get(request.item_id)
+            if item_vector is None:
+                return None
+            return index.search(item_vector, request.k + 1)
+        return index.search(vector, request.k)
+
+    # the scan is CPU bound and the index lock may be held by a write, both would block the
+    # event loop: they run in a thread
+    found = await asyncio.to_thread(search)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Item {request.item_id} is not indexed")
+    ids, scores = found
+    results = [
+        SearchResult(id=item_id, score=score)
+        for item_id, score in zip(ids.tolist(), scores.tolist())
+        if item_id != request.item_id
+    ]
+    return SearchResponse(results=results[: request.k])
+
+
+@router.post("/api/search/items")
+async def index_items(
+    request: IndexItemsRequest,
+    index: VectorIndex = Depends(get_vector_index),
+    embedding_llm: Optional[EmbeddingLLMConfig] = Depends(get_embedding_llm),
+):
+    """Adds or replaces items in the index."""
+    items_to_embed = [item for item in request.items if item.text is not None]
+    if items_to_embed:
+        vectors = await require_embedding_llm(embedding_llm).a_embed_texts(
+            [item.text for item in items_to_embed]
+        )
+        for item, vector in zip(items_to_embed, vectors):
+            item.vector = vector
+
+    def add_items():
+        with index.shared_write():
+            index.add([item.id for item in request.items], [item.vector for item in request.items])
+        return len(index)
+
+    try:
+        size = await asyncio.to_thread(add_items)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    logger.debug(f"Indexed {len(request.items)} items, index size {size}.")
+    return {"indexed": len(request.items)}
+
+
+@router.delete("/api/search/items/{item_id}")
+async def delete_item(item_id: int, index: VectorIndex = Depends(get_vector_index)):
+    def delete_items():
+        with index.shared_write():
+            return index.delete([item_id])
+
+    deleted = await asyncio.to_thread(delete_items)
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"Item {item_id} is not indexed")
+    return {"deleted": deleted}
+
+
+@router.get("/api/search/stats")
+async def get_search_stats(index: VectorIndex = Depends(get_vector_index)):
+    return await asyncio.to_thread(index.stats)
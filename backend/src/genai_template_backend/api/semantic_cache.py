@@ -0,0 +1,231 @@
+"""Semantic cache of LLM responses.
+
+Paraphrased prompts miss the exact-match ``ResponseCache``. This cache embeds the last message of
+the conversation and returns the answer of the most similar previous prompt when their cosine
+similarity is above a threshold.
+
+Entries are tagged with a namespace: the exact cache key of everything but the last message (model,
+schema, sampling parameters and previous turns), so an answer is only reused in the same context.
+All the entries share one float32 matrix of normalized embeddings, a lookup is one matrix-vector
+product.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from genai_template_backend.env_settings import Settings, logger
+
+
+class SemanticIndex:
+    """Bounded matrix of normalized embeddings with their namespace and cached value.
+
+    The matrix grows by doubling up to ``capacity``, then the least recently used entry is
+    overwritten.
+    """
+
+    def __init__(self, dim: int, capacity: int, initial_size: int = 1024):
+        self.dim = dim
+        self.capacity = capacity
+        self.size = 0
+        rows = min(capacity, initial_size)
+        self.vectors = np.zeros((rows, dim), dtype=np.float32)
+        self.namespaces = np.full(rows, -1, dtype=np.int64)
+        self.last_used = np.zeros(rows, dtype=np.int64)
+        self.values: list[Optional[str]] = [None] * rows
+        self._clock = 0
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def _grow(self):
+        rows = min(self.capacity, 2 * len(self.vectors))
+        extra = rows - len(self.vectors)
+        self.vectors = np.concatenate([self.vectors, np.zeros((extra, self.dim), np.float32)])
+        self.namespaces = np.concatenate([self.namespaces, np.full(extra, -1, np.int64)])
+        self.last_used = np.concatenate([self.last_used, np.zeros(extra, np.int64)])
+        self.values.extend([None] * extra)
+
+    def search(self, vector: np.ndarray, namespace: int, masked: bool = True) -> tuple[int, float]:
+        """Returns the index and cosine similarity of the nearest entry of ``namespace``.
+
+        Returns ``(-1, -1.0)`` if the namespace has no entry. ``masked=False`` skips the namespace
+        filter when the caller knows every entry belongs to ``namespace``.
+        """
+        if self.size == 0:
+            return -1, -1.0
+        scores = self.vectors[: self.size] @ vector
+        if masked:
+            scores = np.where(self.namespaces[: self.size] == namespace, scores, -np.inf)
+        best = int(np.argmax(scores))
+        if scores[best] == -np.inf:
+            return -1, -1.0
+        return best, float(scores[best])
+
+    def get(self, index: int) -> str:
+        self.last_used[index] = self._tick()
+        return self.values[index]
+
+    def add(self, vector: np.ndarray, namespace: int, value: str) -> int:
+        """Stores ``value``, returns the namespace of the evicted entry, -1 if none was evicted."""
+        evicted = -1
+        if self.size == self.capacity:
+            index = int(np.argmin(self.last_used))
+            evicted = int(self.namespaces[index])
+        else:
+            if self.size == len(self.vectors):
+                self._grow()
+            index = self.size
+            self.size += 1
+        self.vectors[index] = vector
+        self.namespaces[index] = namespace
+        self.values[index] = value
+        self.last_used[index] = self._tick()
+        return evicted
+
+
+def normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class SemanticCache:
+    """Opt-in cache answering prompts that are close enough to a previous one.
+
+    Args:
+        embedding_llm: ``EmbeddingLLMConfig`` used to embed the prompts.
+        threshold: minimum cosine similarity for a hit.
+        capacity: maximum number of entries, all namespaces included.
+        offload_size: from this number of entries, async lookups run in a thread so the
+            matrix-vector product doesn't block the event loop.
+
+    A lock serializes the lookups and the updates, since offloaded lookups run in other threads.
+    """
+
+    def __init__(
+        self,
+        embedding_llm,
+        threshold: float = 0.95,
+        capacity: int = 10_000,
+        offload_size: int = 2_000,
+    ):
+        self.embedding_llm = embedding_llm
+        self.threshold = threshold
+        self.capacity = capacity
+        self.offload_size = offload_size
+        self.index: Optional[SemanticIndex] = None
+        # namespace key -> id stored in the index, and the number of entries of each id
+        self._namespace_ids: dict[str, int] = {}
+        self._namespace_keys: dict[int, str] = {}
+        self._namespace_counts: dict[int, int] = {}
+        self._next_namespace_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lookup_seconds = 0.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings, embedding_llm) -> Optional["SemanticCache"]:
+        if not settings.LLM_SEMANTIC_CACHE_ENABLED:
+            return None
+        if embedding_llm is None:
+            logger.warning("LLM semantic cache disabled: no embedding model is configured.")
+            return None
+        logger.info(
+            f"LLM semantic cache enabled: threshold={settings.LLM_SEMANTIC_CACHE_THRESHOLD}, "
+            f"capacity={settings.LLM_SEMANTIC_CACHE_CAPACITY}"
+        )
+        return cls(
+            embedding_llm,
+            threshold=settings.LLM_SEMANTIC_CACHE_THRESHOLD,
+            capacity=settings.LLM_SEMANTIC_CACHE_CAPACITY,
+            offload_size=settings.LLM_SEMANTIC_CACHE_OFFLOAD_SIZE,
+        )
+
+    def lookup(self, namespace: str, vector: np.ndarray) -> Optional[str]:
+        """Returns the cached value of the nearest prompt if it is above the threshold."""
+        start = time.perf_counter()
+        with self._lock:
+            namespace_id = self._namespace_ids.get(namespace)
+            value = None
+            if namespace_id is not None:
+                masked = self._namespace_counts[namespace_id] != self.index.size
+                best, score = self.index.search(vector, namespace_id, masked)
+                if score >= self.threshold:
+                    value = self.index.get(best)
+            self.lookup_seconds += time.perf_counter() - start
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def add(self, namespace: str, vector: np.ndarray, value: str):
+        with self._lock:
+            if self.index is None:
+                self.index = SemanticIndex(len(vector), self.capacity)
+            namespace_id = self._namespace_ids.get(namespace)
+            if namespace_id is None:
+                namespace_id = self._next_namespace_id
+                self._next_namespace_id += 1
+                self._namespace_ids[namespace] = namespace_id
+                self._namespace_keys[namespace_id] = namespace
+                self._namespace_counts[namespace_id] = 0
+            self._namespace_counts[namespace_id] += 1
+
+            evicted = self.index.add(vector, namespace_id, value)
+            if evicted >= 0:
+                self.evictions += 1
+                self._namespace_counts[evicted] -= 1
+                if self._namespace_counts[evicted] == 0:
+                    del self._namespace_counts[evicted]
+                    del self._namespace_ids[self._namespace_keys.pop(evicted)]
+
+    async def aget(
+        self, namespace: str, messages: list
+    ) -> tuple[Optional[str], Optional[np.ndarray]]:
+        """Embeds the last message and looks it up.
+
+        Returns:
+            the cached value, or None on a miss,
+            the prompt embedding to pass to ``add`` once the answer is known, None if the prompt
+            can't be cached (non text content, embedding error).
+        """
+        text = messages[-1].get("content") if messages else None
+        if not isinstance(text, str):
+            return None, None
+        try:
+            vector = normalize(await self.embedding_llm.a_embed_text(text))
+        except Exception as e:
+            logger.warning(f"Semantic cache skipped, could not embed the prompt: {e}")
+            return None, None
+        if self.index is not None and self.index.size >= self.offload_size:
+            return await asyncio.to_thread(self.lookup, namespace, vector), vector
+        return self.lookup(namespace, vector), vector
+
+    def clear(self):
+        with self._lock:
+            self.index = None
+            self._namespace_ids.clear()
+            self._namespace_keys.clear()
+            self._namespace_counts.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "mean_lookup_ms": 1000 * self.lookup_seconds / lookups if lookups else 0.0,
+            "size": self.index.size if self.index is not None else 0,
+            "capacity": self.capacity,
+            "namespaces": len(self._namespace_ids),
+        }
@@ -0,0 +1,57 @@
+"""Coalescing of identical in-flight calls.
+
+Concurrent calls with the same key share one execution: the first caller starts it as a task,
+the others wait on the same task and all get its result, or its exception.
+
+Each caller waits through ``asyncio.shield``, so cancelling one of them (e.g. its client
+disconnected) leaves the shared call running for the others. The shared call is only cancelled
+once every caller has gone.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class SingleFlight:
+    def __init__(self):
+        # key -> (shared task, number of callers waiting on it)
+        self._calls: dict[str, list] = {}
+        self.calls = 0
+        self.deduplicated = 0
+
+    def _forget(self, key: str, task: asyncio.Task):
+        call = self._calls.get(key)
+        if call is not None and call[0] is task:
+            del self._calls[key]
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Returns the result of ``call()``, shared with the concurrent calls of ``key``."""
+        entry = self._calls.get(key)
+        # a task left by another event loop (e.g. a closed one) can't be awaited from this one
+        if entry is None or entry[0].get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(call())
+            entry = [task, 0]
+            self._calls[key] = entry
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.calls += 1
+        else:
+            self.deduplicated += 1
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                # the last caller was cancelled, nobody needs the result anymore. The key is
+                # forgotten first: a new caller must start a fresh call, not join a cancelled one
+                self._forget(key, task)
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "deduplicated": self.deduplicated,
+        }
@@ -0,0 +1,50 @@
+"""Helpers of the structured-output (``schema``) path of the LLM clients.
+
+Everything derived from a schema only (instructor clients, ``response_format`` json schema,
+``TypeAdapter``) is built once and memoized, and model outputs are parsed and validated in one
+pass by pydantic's JSON parser.
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Callable
+
+from pydantic import TypeAdapter
+
+from genai_template_backend.lazy_imports import lazy_import
+
+instructor = lazy_import("instructor")
+
+# models without native structured output sometimes wrap the JSON in a markdown code block
+CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*```\s*$", re.DOTALL)
+
+
+@lru_cache(maxsize=None)
+def instructor_client(create: Callable, mode: "instructor.Mode | None" = None):
+    """Returns the instructor client patching ``create`` (e.g. ``litellm.acompletion``)."""
+    return instructor.from_litellm(create, mode=mode or instructor.Mode.JSON)
+
+
+@lru_cache(maxsize=None)
+def response_format(schema: type) -> dict:
+    """Returns the ``response_format`` json schema litellm would generate from ``schema``."""
+    from litellm.utils import type_to_response_format_param
+
+    return type_to_response_format_param(schema)
+
+
+@lru_cache(maxsize=None)
+def schema_adapter(schema: Any) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def parse_structured_output(schema: Any, content: str) -> Any:
+    """Parses and validates the JSON ``content`` of a completion as an instance of ``schema``.
+
+    Raises:
+        pydantic.ValidationError: if the content isn't valid JSON or doesn't match the schema.
+    """
+    fenced = CODE_FENCE.match(content)
+    if fenced:
+        content = fenced.group(1)
+    return schema_adapter(schema).validate_json(content)
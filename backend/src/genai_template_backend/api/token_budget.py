@@ -0,0 +1,246 @@
+"""Token counting and context window budgeting of the prompts.
+
+Prompts are counted with the tokenizer of the model (tiktoken, each encoding loaded once per
+process) before they are sent, so an over-long prompt is shortened, or rejected, locally instead
+of failing after a round trip to the provider, and ``max_tokens`` is set to what remains of the
+context window.
+
+Each message is tokenized once: the counts are memoized by the hash of the message, so the
+history resent with each turn of a conversation isn't tokenized again, and the messages missing
+from the memo are encoded in one batch.
+
+To fit the window, the low-priority messages (all but the system messages and the last message)
+are dropped oldest first, the last one dropped being truncated instead when that is enough. If the
+prompt still overflows, the system messages are truncated, the longest first. A prompt that still
+doesn't fit raises ``ContextWindowExceeded``.
+"""
+
+import functools
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from genai_template_backend.api.metrics import LLM_PROMPT_FITTED
+from genai_template_backend.env_settings import Settings, logger
+from genai_template_backend.lazy_imports import lazy_import
+
+litellm = lazy_import("litellm")
+tiktoken = lazy_import("tiktoken")
+
+# framing tokens of each message and of the reply, as counted by the OpenAI chat format
+MESSAGE_TOKENS = 3
+REPLY_TOKENS = 3
+# default encoding of litellm's token counter, bundled with litellm so it loads offline
+DEFAULT_ENCODING = "cl100k_base"
+TRUNCATION_MARKER = "\n[...]\n"
+# a message truncated below this many tokens is dropped instead
+MIN_TRUNCATED_TOKENS = 32
+
+
+class ContextWindowExceeded(ValueError):
+    """The protected messages of a prompt alone overflow the context window."""
+
+    def __init__(self, model_name: str, prompt_tokens: int, context_window: int):
+        super().__init__(
+            f"Prompt of {prompt_tokens} tokens too long for the {context_window} tokens "
+            f"context window of {model_name}"
+        )
+        self.prompt_tokens = prompt_tokens
+        self.context_window = context_window
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model_name: str) -> "tiktoken.Encoding":
+    """Returns the tiktoken encoding of ``model_name``, ``cl100k_base`` for the unknown models."""
+    try:
+        return tiktoken.encoding_for_model(model_name.split("/")[-1])
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def model_limits(model_name: str) -> tuple[Optional[int], Optional[int]]:
+    """Returns the context window and maximum completion tokens of litellm's model map."""
+    for name in (model_name, model_name.split("/", 1)[-1]):
+        info = litellm.model_cost.get(name)
+        if info:
+            return info.get("max_input_tokens") or info.get("max_tokens"), info.get(
+                "max_output_tokens"
+            )
+    return None, None
+
+
+def message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):  # multimodal content parts
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+class TokenCounter:
+    """Counts the tokens of messages, memoizing the count of each message by its hash.
+
+    Args:
+        model_name: model whose tokenizer is used.
+        cache_size: messages whose count is memoized, the least recently used are forgotten.
+    """
+
+    # below this many texts, a thread pool costs more than it saves
+    batch_threshold = 16
+
+    def __init__(self, model_name: str, cache_size: int = 10_000):
+        self.encoding = get_encoding(model_name)
+        self.cache_size = cache_size
+        self._counts: OrderedDict[int, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count_texts(self, texts: list[str]) -> list[int]:
+        if len(texts) < self.batch_threshold:
+            return [len(self.encoding.encode_ordinary(text)) for text in texts]
+        return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(texts)]
+
+    def message_tokens(self, messages: list) -> list[int]:
+        """Returns the tokens of each message, framing included."""
+        keys = [hash((message.get("role"), message_text(message))) for message in messages]
+        counts: list[Optional[int]] = []
+        with self._lock:
+            for key in keys:
+                count = self._counts.get(key)
+                if count is not None:
+                    self._counts.move_to_end(key)
+                counts.append(count)
+            missing = [i for i, count in enumerate(counts) if count is None]
+            self.hits += len(messages) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            encoded = self.count_texts([message_text(messages[i]) for i in missing])
+            with self._lock:
+                for i, count in zip(missing, encoded):
+                    counts[i] = count + MESSAGE_TOKENS
+                    self._counts[keys[i]] = counts[i]
+                while len(self._counts) > self.cache_size:
+                    self._counts.popitem(last=False)
+        return counts
+
+    def count(self, messages: list) -> int:
+        """Returns the prompt tokens of ``messages``."""
+        return sum(self.message_tokens(messages)) + REPLY_TOKENS
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Keeps the start and the end of ``text``, ``max_tokens`` tokens in all."""
+        tokens = self.encoding.encode_ordinary(text)
+        if len(tokens) <= max_tokens:
+            return text
+        kept = max(max_tokens - len(self.encoding.encode_ordinary(TRUNCATION_MARKER)), 0)
+        head = (kept + 1) // 2
+        tail = kept - head
+        return (
+            self.encoding.decode(tokens[:head])
+            + TRUNCATION_MARKER
+            + (self.encoding.decode(tokens[-tail:]) if tail else "")
+        )
+
+    def stats(self) -> dict:
+        return {"memoized": len(self._counts), "hits": self.hits, "misses": self.misses}
+
+
+class TokenBudget:
+    """Fits the prompts of a model in its context window and sizes their completion.
+
+    Args:
+        model_name: model whose tokenizer and limits are used.
+        context_window: prompt + completion tokens, from litellm's model map if not set.
+        max_output_tokens: completion tokens at most, from litellm's model map if not set.
+        min_output_tokens: completion tokens always left free by the prompt.
+        cache_size: messages whose token count is memoized.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        context_window: Optional[int] = None,
+        max_output_tokens: Optional[int] = None,
+        min_output_tokens: int = 256,
+        cache_size: int = 10_000,
+        default_context_window: int = 8192,
+    ):
+        known_window, known_output = model_limits(model_name)
+        self.model_name = model_name
+        self.context_window = context_window or known_window or default_context_window
+        self.max_output_tokens = max_output_tokens or known_output
+        self.min_output_tokens = min_output_tokens
+        self.counter = TokenCounter(model_name, cache_size)
+
+    @classmethod
+    def from_settings(cls, settings: Settings, model_name: str) -> Optional["TokenBudget"]:
+        if not settings.LLM_TOKEN_BUDGET_ENABLED:
+            return None
+        budget = cls(
+            model_name,
+            context_window=settings.LLM_CONTEXT_WINDOW,
+            max_output_tokens=settings.LLM_MAX_OUTPUT_TOKENS,
+            min_output_tokens=settings.LLM_MIN_OUTPUT_TOKENS,
+            cache_size=settings.LLM_TOKEN_COUNT_CACHE_SIZE,
+            default_context_window=settings.LLM_DEFAULT_CONTEXT_WINDOW,
+        )
+        logger.info(
+            f"Token budget of {model_name}: {budget.context_window} tokens context window, "
+            f"{budget.counter.encoding.name} tokenizer"
+        )
+        return budget
+
+    def fit(self, messages: list, max_tokens: Optional[int] = None) -> tuple[list, int, int]:
+        """Returns the messages fitting in the window, their tokens and the completion tokens.
+
+        ``max_tokens`` caps the completion, the completion takes what the prompt leaves otherwise.
+        """
+        counts = self.counter.message_tokens(messages)
+        limit = self.context_window - self.min_output_tokens
+        excess = sum(counts) + REPLY_TOKENS - limit
+        if excess > 0:
+            messages, counts = self._shorten(list(messages), counts, excess)
+        prompt_tokens = sum(counts) + REPLY_TOKENS
+        if prompt_tokens > limit:
+            raise ContextWindowExceeded(self.model_name, prompt_tokens, self.context_window)
+
+        completion_tokens = self.context_window - prompt_tokens
+        for cap in (max_tokens, self.max_output_tokens):
+            if cap:
+                completion_tokens = min(completion_tokens, cap)
+        return messages, prompt_tokens, completion_tokens
+
+    def _shorten(self, messages: list, counts: list[int], excess: int) -> tuple[list, list[int]]:
+        last = len(messages) - 1
+        low_priority = [i for i in range(last) if messages[i].get("role") != "system"]
+        system = sorted(
+            (i for i in range(last) if messages[i].get("role") == "system"),
+            key=lambda i: counts[i],
+            reverse=True,
+        )
+        dropped = set()
+        for i in low_priority + system:
+            if excess <= 0:
+                break
+            kept_tokens = counts[i] - MESSAGE_TOKENS - excess
+            truncated = None
+            if kept_tokens >= MIN_TRUNCATED_TOKENS and isinstance(messages[i].get("content"), str):
+                truncated = {
+                    **messages[i],
+                    "content": self.counter.truncate(messages[i]["content"], kept_tokens),
+                }
+            if truncated is not None:
+                messages[i] = truncated
+                (count,) = self.counter.message_tokens([truncated])
+                LLM_PROMPT_FITTED.inc(self.model_name, "truncated")
+            elif i in system:
+                # the instructions are never dropped
+                continue
+            else:
+                dropped.add(i)
+                count = 0
+                LLM_PROMPT_FITTED.inc(self.model_name, "dropped")
+            excess -= counts[i] - count
+            counts[i] = count
+        keep = [i for i in range(len(messages)) if i not in dropped]
+        return [messages[i] for i in keep], [counts[i] for i in keep]
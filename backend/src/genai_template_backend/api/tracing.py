@@ -0,0 +1,390 @@
+"""Lightweight request tracing.
+
+A span measures one operation (the route, a cache lookup, a provider call, a retry attempt).
+The current span is kept in a ``contextvars.ContextVar``, so spans opened while serving a
+request, in coroutines or in the tasks they start, become its children without passing anything
+around. Each trace is identified by the ``trace_id`` of its root span. The request id
+(``X-Request-ID``) is also the correlation id attached to every span of the request.
+
+Finished spans are queued and a background thread writes them in batches to a JSON lines file,
+one OTLP/JSON ``ExportTraceServiceRequest`` per line (the format of the OpenTelemetry
+collector file exporter). Nothing is written on the event loop.
+"""
+
+import atexit
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from genai_template_backend.env_settings import logger, settings
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+def new_trace_id() -> str:
+    return f"{random.getrandbits(128):032x}"
+
+
+def new_span_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+def current_span() -> Optional["Span"]:
+    return _current_span.get()
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+class Span:
+    """One timed operation, used as a context manager in sync and async code."""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_span_id",
+        "attributes",
+        "events",
+        "start_ns",
+        "end_ns",
+        "error",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        attributes: Optional[dict] = None,
+        trace_id: Optional[str] = None,
+        parent_span_id: Optional[str] = None,
+    ):
+        parent = _current_span.get()
+        self.name = name
+        self.trace_id = trace_id or (parent.trace_id if parent else new_trace_id())
+        self.parent_span_id = parent_span_id or (parent.span_id if parent else None)
+        self.span_id = new_span_id()
+        self.attributes = attributes or {}
+        request_id = _request_id.get()
+        if request_id:
+            self.attributes["request.id"] = request_id
+        self.events: list[tuple[str, int, dict]] = []
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error: Optional[str] = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        self.events.append((name, time.time_ns(), attributes))
+
+    def __enter__(self) -> "Span":
+        """Starts the span and makes it the current one."""
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        """Ends the span, records the exception if any, and queues it for export."""
+        self.end_ns = time.time_ns()
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # closed from another context, e.g. an async generator finalized by the loop
+            pass
+        tracer.export(self)
+        return False
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # internal
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": otlp_attributes(self.attributes),
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.events:
+            span["events"] = [
+                {"name": name, "timeUnixNano": str(ns), "attributes": otlp_attributes(attrs)}
+                for name, ns, attrs in self.events
+            ]
+        return span
+
+
+class _NoopSpan:
+    """Returned when tracing is disabled, costs one attribute lookup per span."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, **attributes):
+        pass
+
+    def __enter__(self):
+        """Returns the no-op span."""
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        """Does nothing, exceptions propagate."""
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_attributes(attributes: dict) -> list[dict]:
+    return [{"key": key, "value": otlp_value(value)} for key, value in attributes.items()]
+
+
+class JsonlSpanExporter:
+    """Writes the finished spans to ``path`` from a background thread.
+
+    Args:
+        path: JSON lines file, appended to.
+        max_batch_size: spans written per line at most, a full batch wakes the writer up.
+        flush_interval: seconds between two writes of a partial batch.
+        max_queue_size: spans beyond this are dropped instead of growing the memory.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_batch_size: int = 512,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 100_000,
+    ):
+        self.path = path
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.dropped = 0
+        self._queue: deque = deque()
+        self._wake_up = threading.Event()
+        # a flush and the writer thread don't write their lines at the same time
+        self._write_lock = threading.Lock()
+        self._stopped = False
+        self._resource = {
+            "attributes": otlp_attributes(
+                {"service.name": "genai_template_backend", "process.pid": os.getpid()}
+            )
+        }
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        # deque.append is atomic, the event loop never waits on the writer
+        if len(self._queue) >= self.max_queue_size:
+            self.dropped += 1
+            return
+        self._queue.append(span)
+        if len(self._queue) >= self.max_batch_size:
+            self._wake_up.set()
+
+    def _write_batches(self):
+        with self._write_lock:
+            self._write_queued()
+
+    def _write_queued(self):
+        while self._queue:
+            batch = []
+            while self._queue and len(batch) < self.max_batch_size:
+                batch.append(self._queue.popleft().to_otlp())
+            request = {
+                "resourceSpans": [
+                    {
+                        "resource": self._resource,
+                        "scopeSpans": [
+                            {"scope": {"name": "genai_template_backend"}, "spans": batch}
+                        ],
+                    }
+                ]
+            }
+            with open(self.path, "a") as f:
+                f.write(json.dumps(request, separators=(",", ":")) + "\n")
+
+    def _run(self):
+        while not self._stopped:
+            self._wake_up.wait(self.flush_interval)
+            self._wake_up.clear()
+            try:
+                self._write_batches()
+            except Exception as e:
+                logger.error(f"Could not write spans to {self.path}: {e}")
+
+    def flush(self):
+        """Writes the queued spans now, the exporter keeps running."""
+        self._write_batches()
+
+    def shutdown(self):
+        self._stopped = True
+        self._wake_up.set()
+        self._thread.join(timeout=5)
+        self._write_batches()
+
+
+class Tracer:
+    """Creates the spans, or no-op spans when no exporter is configured."""
+
+    def __init__(self):
+        self.exporter: Optional[JsonlSpanExporter] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def configure(self, path: Optional[str], **exporter_kwargs):
+        """Starts exporting the spans to ``path``, None disables tracing."""
+        self.shutdown()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.exporter = JsonlSpanExporter(path, **exporter_kwargs)
+            logger.info(f"Tracing spans exported to {path}")
+
+    def span(self, name: str, **attributes):
+        if self.exporter is None:
+            return NOOP_SPAN
+        return Span(name, attributes)
+
+    def export(self, span: Span):
+        if self.exporter is not None:
+            self.exporter.export(span)
+
+    def flush(self):
+        """Writes the spans finished so far, e.g. when the app shuts down."""
+        if self.exporter is not None:
+            self.exporter.flush()
+
+    def shutdown(self):
+        """Stops the exporter and disables tracing, ``configure`` starts it again."""
+        if self.exporter is not None:
+            self.exporter.shutdown()
+            self.exporter = None
+
+    def _restart_after_fork(self):
+        """The writer thread doesn't survive a fork, a forked worker starts its own."""
+        if self.exporter is not None:
+            self.exporter = JsonlSpanExporter(
+                self.exporter.path,
+                max_batch_size=self.exporter.max_batch_size,
+                flush_interval=self.exporter.flush_interval,
+                max_queue_size=self.exporter.max_queue_size,
+            )
+
+
+tracer = Tracer()
+tracer.configure(settings.TRACING_EXPORT_PATH)
+atexit.register(tracer.shutdown)
+os.register_at_fork(after_in_child=tracer._restart_after_fork)
+
+
+def span(name: str, **attributes):
+    """Opens a child span of the current span.
+
+    Example: ``with span("cache.get", key=key):``.
+    """
+    return tracer.span(name, **attributes)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator wrapping each call of a sync or async function in a span."""
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(span_name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def parse_traceparent(header: Optional[str]) -> tuple[Optional[str], Optional[str]]:
+    """Returns the trace and parent span ids of a W3C ``traceparent`` header."""
+    parts = (header or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of each request.
+
+    The request id comes from the ``X-Request-ID`` header, or is generated, and is sent back
+    in the response. An incoming ``traceparent`` header continues the caller's trace.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode() or new_span_id()
+        trace_id, parent_span_id = parse_traceparent(headers.get(b"traceparent", b"").decode())
+        request_token = _request_id.set(request_id)
+        root = Span(
+            scope["method"],
+            {"http.method": scope["method"], "http.target": scope["path"]},
+            trace_id=trace_id,
+            parent_span_id=parent_span_id,
+        )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode())
+                ]
+            await send(message)
+
+        try:
+            with root:
+                try:
+                    await self.app(scope, receive, send_wrapper)
+                finally:
+                    route = scope.get("route")
+                    root.name = f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+        finally:
+            _request_id.reset(request_token)
@@ -0,0 +1,643 @@
+"""Vector indexes for similarity search over the catalog embeddings.
+
+Two indexes share the same interface (``add`` / ``delete`` / ``search`` / ``save`` / ``load``):
+
+- ``FlatIndex``: exact top-k, one matrix-vector product over all the vectors. Best up to about
+  100k items.
+- ``IVFIndex``: inverted file index. A k-means coarse quantizer splits the vectors in ``n_lists``
+  cells, a query only scans the ``n_probe`` cells whose centroid is the closest. Recall is traded
+  for latency with ``n_probe``.
+
+Vectors are normalized on insertion, scores are cosine similarities. Items are identified by
+int64 ids, adding an existing id replaces its vector.
+
+Each uvicorn worker holds its own copy of the index. With ``VECTOR_INDEX_PATH`` set, the index
+is shared through two files:
+
+- the snapshot, a ``.npz`` file written by ``save``,
+- ``<path>.log``: the adds and deletes applied since the snapshot, append-only. Its header holds
+  the generation of the snapshot it applies to.
+
+Writes go through ``shared_write``: under an exclusive ``flock``, the index catches up with the
+log, applies the writes and appends them to the log. Once the log grows past ``compact_ratio``
+of the snapshot, the writer compacts: it saves a new snapshot and starts an empty log. Before
+each request the index ``refresh``es: it replays the records appended since it last read the
+log, and only reloads the snapshot after a compaction.
+"""
+
+import fcntl
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+
+from genai_template_backend.env_settings import Settings, logger
+
+
+def file_version(path: str) -> Optional[tuple[int, int, int]]:
+    """Identifies the content of ``path`` (replaced atomically by ``save``), None if missing."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+# generation of the snapshot the log applies to
+LOG_HEADER = struct.Struct("<q")
+# b"a" (add) or b"d" (delete), number of ids, dimension of the vectors (0 for a delete)
+RECORD_HEADER = struct.Struct("<cqq")
+
+
+def encode_record(op: bytes, ids: np.ndarray, vectors: Optional[np.ndarray] = None) -> bytes:
+    dim = vectors.shape[1] if vectors is not None else 0
+    parts = [RECORD_HEADER.pack(op, len(ids), dim), ids.astype(np.int64).tobytes()]
+    if vectors is not None:
+        parts.append(vectors.astype(np.float32).tobytes())
+    return b"".join(parts)
+
+
+def decode_records(data: bytes) -> tuple[list[tuple[bytes, np.ndarray, np.ndarray]], int]:
+    """Returns the complete ``(op, ids, vectors)`` records of ``data`` and the bytes they span.
+
+    A record another worker is still writing is left for the next read.
+    """
+    records, offset = [], 0
+    while offset + RECORD_HEADER.size <= len(data):
+        op, count, dim = RECORD_HEADER.unpack_from(data, offset)
+        ids_offset = offset + RECORD_HEADER.size
+        end = ids_offset + 8 * count + 4 * count * dim
+        if end > len(data):
+            break
+        ids = np.frombuffer(data, np.int64, count, ids_offset)
+        vectors = np.frombuffer(data, np.float32, count * dim, ids_offset + 8 * count)
+        records.append((op, ids, vectors.reshape(count, dim)))
+        offset = end
+    return records, offset
+
+
+class ReadWriteLock:
+    """Many readers or one writer, the writer may take the lock again.
+
+    Waiting writers block the new readers, so a stream of searches doesn't starve the writes.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._depth = 0
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            if self._writer == threading.get_ident():
+                # the writer reads what it holds
+                self._depth += 1
+                reading = False
+            else:
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+                self._readers += 1
+                reading = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                if reading:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._condition.notify_all()
+                else:
+                    self._depth -= 1
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer != me:
+                self._waiting_writers += 1
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+                self._waiting_writers -= 1
+                self._writer = me
+            self._depth += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._depth -= 1
+                if not self._depth:
+                    self._writer = None
+                    self._condition.notify_all()
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the positions of the ``k`` best scores, best first."""
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class VectorList:
+    """Growable block of vectors and their ids, deletion swaps the last row in the hole."""
+
+    def __init__(self, dim: int, initial_size: int = 16):
+        self.size = 0
+        self.vectors = np.empty((initial_size, dim), dtype=np.float32)
+        self.ids = np.empty(initial_size, dtype=np.int64)
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray):
+        end = self.size + len(ids)
+        if end > len(self.ids):
+            rows = max(end, 2 * len(self.ids))
+            extra = rows - self.size
+            self.vectors = np.concatenate(
+                [self.vectors[: self.size], np.empty((extra, self.vectors.shape[1]), np.float32)]
+            )
+            self.ids = np.concatenate([self.ids[: self.size], np.empty(extra, np.int64)])
+        self.vectors[self.size : end] = vectors
+        self.ids[self.size : end] = ids
+        self.size = end
+
+    def delete(self, ids: np.ndarray) -> int:
+        """Deletes the rows of ``ids``, returns the number of deleted rows."""
+        rows = np.flatnonzero(np.isin(self.ids[: self.size], ids))
+        for row in rows[::-1]:
+            last = self.size - 1
+            self.vectors[row] = self.vectors[last]
+            self.ids[row] = self.ids[last]
+            self.size = last
+        return len(rows)
+
+    def find(self, item_id: int) -> Optional[np.ndarray]:
+        rows = np.flatnonzero(self.ids[: self.size] == item_id)
+        return self.vectors[rows[0]].copy() if len(rows) else None
+
+
+class VectorIndex:
+    """Base class of the indexes, thread-safe so searches can run in worker threads.
+
+    Searches share a read lock and run in parallel (numpy releases the GIL in the products), the
+    updates take the write lock.
+    """
+
+    kind = ""
+    # the log is compacted once it is larger than this fraction of the snapshot
+    compact_ratio = 0.5
+    # and larger than this many bytes, so a small index isn't saved on every write
+    compact_min_bytes = 16 * 1024 * 1024
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim
+        self._lock = ReadWriteLock()
+        # file the index is shared through by the workers, see ``shared_write``
+        self.path: Optional[str] = None
+        self._version: Optional[tuple[int, int, int]] = None
+        self._generation = 0
+        # end of the log records applied to the index
+        self._log_offset = LOG_HEADER.size
+        # serializes the reads of the shared files and the updates of the offsets above
+        self._refresh_lock = threading.Lock()
+        # writes of the running ``shared_write``, per thread
+        self._journal = threading.local()
+
+    def __len__(self) -> int:
+        """Number of indexed items."""
+        return sum(vector_list.size for vector_list in self._lists())
+
+    def _lists(self) -> list[VectorList]:
+        raise NotImplementedError
+
+    def _check_dim(self, vectors: np.ndarray):
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._allocate()
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Index holds {self.dim}d vectors, got {vectors.shape[1]}d vectors")
+
+    def _allocate(self):
+        raise NotImplementedError
+
+    def _insert(self, ids: np.ndarray, vectors: np.ndarray):
+        raise NotImplementedError
+
+    def add(self, ids, vectors):
+        """Adds or replaces the vectors of ``ids``."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            raise ValueError("No items to add")
+        vectors = normalize_rows(vectors)
+        if len(ids) != len(vectors):
+            raise ValueError(f"Got {len(ids)} ids for {len(vectors)} vectors")
+        if len(np.unique(ids)) != len(ids):
+            raise ValueError("Duplicate ids in the same add")
+        with self._lock.write():
+            self._apply(b"a", ids, vectors)
+            self._record(b"a", ids, vectors)
+
+    def delete(self, ids) -> int:
+        """Deletes ``ids``, returns the number of deleted items."""
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock.write():
+            deleted = self._apply(b"d", ids)
+            if deleted:
+                self._record(b"d", ids)
+            return deleted
+
+    def _apply(self, op: bytes, ids: np.ndarray, vectors: Optional[np.ndarray] = None) -> int:
+        """Applies an add or a delete, returns the number of deleted items."""
+        if op == b"a":
+            self._check_dim(vectors)
+        deleted = sum(vector_list.delete(ids) for vector_list in self._lists() if vector_list.size)
+        if op == b"a":
+            self._insert(ids, vectors)
+        return deleted
+
+    def _record(self, op: bytes, ids: np.ndarray, vectors: Optional[np.ndarray] = None):
+        records = getattr(self._journal, "records", None)
+        if records is not None:
+            records.append(encode_record(op, ids, vectors))
+
+    def get(self, item_id: int) -> Optional[np.ndarray]:
+        """Returns the normalized vector of ``item_id``, None if it isn't indexed."""
+        with self._lock.read():
+            for vector_list in self._lists():
+                vector = vector_list.find(item_id)
+                if vector is not None:
+                    return vector
+        return None
+
+    def _candidate_lists(self, query: np.ndarray) -> list[VectorList]:
+        raise NotImplementedError
+
+    def search(self, query, k: int = 10) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the ids and cosine similarities of the ``k`` nearest items, best first."""
+        query = normalize_rows(query)[0]
+        with self._lock.read():
+            if self.dim is None:
+                return np.empty(0, np.int64), np.empty(0, np.float32)
+            lists = [l for l in self._candidate_lists(query) if l.size]
+            if not lists:
+                return np.empty(0, np.int64), np.empty(0, np.float32)
+            if len(lists) == 1:
+                vectors, ids = lists[0].vectors[: lists[0].size], lists[0].ids[: lists[0].size]
+                scores = vectors @ query
+            else:
+                scores = np.concatenate([l.vectors[: l.size] @ query for l in lists])
+                ids = np.concatenate([l.ids[: l.size] for l in lists])
+            best = top_k(scores, k)
+            return ids[best], scores[best]
+
+    def _state(self) -> dict:
+        raise NotImplementedError
+
+    def save(self, path: str):
+        """Writes the index to ``path`` (a ``.npz`` file), atomically."""
+        with self._lock.read():
+            lists = self._lists()
+            state = {
+                "kind": np.array(self.kind),
+                "dim": np.array(self.dim or 0),
+                "generation": np.array(self._generation),
+                "list_sizes": np.array([l.size for l in lists], dtype=np.int64),
+                "ids": np.concatenate([l.ids[: l.size] for l in lists] or [np.empty(0, np.int64)]),
+                "vectors": np.concatenate(
+                    [l.vectors[: l.size] for l in lists] or [np.empty((0, 0), np.float32)]
+                ),
+                **self._state(),
+            }
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f"{path}.tmp.npz"
+            np.savez(tmp_path, **state)
+            os.replace(tmp_path, path)
+
+    @property
+    def _log_path(self) -> str:
+        return f"{self.path}.log"
+
+    def refresh(self) -> bool:
+        """Catches up with the writes of the other workers, returns True if any was applied.
+
+        Replays the new records of the log, after reloading the snapshot if it was compacted.
+        """
+        if self.path is None:
+            return False
+        with self._refresh_lock:
+            version = file_version(self.path)
+            reloaded = version is not None and version != self._version
+            if reloaded:
+                self._reload(version)
+            return self._replay_log() or reloaded
+
+    def _reload(self, version: tuple[int, int, int]):
+        loaded = VectorIndex.load(self.path, n_probe=getattr(self, "n_probe", None))
+        if type(loaded) is not type(self):
+            raise ValueError(f"{self.path} holds a {loaded.kind} index, not a {self.kind} index")
+        kept = ("_lock", "path", "_version", "_log_offset", "_refresh_lock", "_journal")
+        with self._lock.write():
+            vars(self).update({k: v for k, v in vars(loaded).items() if k not in kept})
+            self._version = version
+            self._log_offset = LOG_HEADER.size
+
+    def _read_log(self) -> tuple[Optional[int], bytes]:
+        """Returns the generation of the log and its bytes past ``_log_offset``."""
+        try:
+            with open(self._log_path, "rb") as f:
+                (generation,) = LOG_HEADER.unpack(f.read(LOG_HEADER.size))
+                if generation != self._generation:
+                    # another worker compacted since, the next refresh reloads the snapshot
+                    return generation, b""
+                f.seek(self._log_offset)
+                return generation, f.read()
+        except FileNotFoundError:
+            return None, b""
+
+    def _replay_log(self) -> bool:
+        _, data = self._read_log()
+        records, size = decode_records(data)
+        if not records:
+            return False
+        with self._lock.write():
+            for op, ids, vectors in records:
+                self._apply(op, ids, vectors)
+            self._log_offset += size
+        return True
+
+    def _commit(self, records: list[bytes]):
+        """Appends the writes to the log, or compacts if the log has grown too large."""
+        data = b"".join(records)
+        with self._refresh_lock:
+            try:
+                snapshot_size = os.path.getsize(self.path)
+            except FileNotFoundError:
+                snapshot_size = None
+            generation, _ = self._read_log()
+            log_size = self._log_offset + len(data)
+            if (
+                snapshot_size is None
+                or generation != self._generation
+                or log_size > max(self.compact_min_bytes, self.compact_ratio * snapshot_size)
+            ):
+                self._compact()
+                return
+            with open(self._log_path, "r+b") as f:
+                # drops the tail of a record torn by a writer that crashed
+                f.truncate(self._log_offset)
+                f.seek(self._log_offset)
+                f.write(data)
+            self._log_offset = log_size
+
+    def _compact(self):
+        """Saves a snapshot of the index and starts an empty log on top of it."""
+        self._generation += 1
+        self.save(self.path)
+        tmp_path = f"{self._log_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(LOG_HEADER.pack(self._generation))
+        os.replace(tmp_path, self._log_path)
+        self._version = file_version(self.path)
+        self._log_offset = LOG_HEADER.size
+        logger.info(f"Vector index {self.path} compacted: {len(self)} items.")
+
+    @contextmanager
+    def shared_write(self):
+        """Applies the writes of the block on top of the latest state, then appends them to the log.
+
+        The ``flock`` serializes the writers of all the workers, so each one writes on top of the
+        items added by the others. A no-op without ``self.path``.
+        """
+        if self.path is None:
+            yield self
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                self._journal.records = []
+                try:
+                    yield self
+                finally:
+                    # the writes applied before an error are in the index, they are logged too
+                    records = self._journal.records
+                    del self._journal.records
+                    if records:
+                        self._commit(records)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def load(path: str, n_probe: Optional[int] = None) -> "VectorIndex":
+        """Loads an index saved by ``save``, ``n_probe`` overrides the saved one of an IVF index."""
+        with np.load(path) as state:
+            kind = str(state["kind"])
+            dim = int(state["dim"]) or None
+            if kind == FlatIndex.kind:
+                index = FlatIndex()
+            elif kind == IVFIndex.kind:
+                index = IVFIndex(
+                    n_lists=int(state["n_lists"]), n_probe=n_probe or int(state["n_probe"])
+                )
+                if state["centroids"].size:
+                    index.centroids = state["centroids"]
+            else:
+                raise ValueError(f"Unknown vector index kind {kind!r} in {path}")
+            index._generation = int(state["generation"]) if "generation" in state else 0
+            if dim:
+                index.dim = dim
+                index._allocate()
+                offsets = np.cumsum(np.concatenate([[0], state["list_sizes"]]))
+                ids, vectors = state["ids"], state["vectors"]
+                for vector_list, start, end in zip(index._lists(), offsets[:-1], offsets[1:]):
+                    vector_list.append(ids[start:end], vectors[start:end])
+        logger.info(f"Vector index {path} loaded: {kind}, {len(index)} items.")
+        return index
+
+    @staticmethod
+    def from_settings(settings: Settings) -> "VectorIndex":
+        """Loads ``VECTOR_INDEX_PATH`` if it exists, else builds an empty index shared through it."""
+        path = settings.VECTOR_INDEX_PATH
+        if path and os.path.exists(path):
+            index = VectorIndex.load(path, n_probe=settings.VECTOR_INDEX_N_PROBE)
+            n_lists = settings.VECTOR_INDEX_IVF_LISTS
+            if isinstance(index, IVFIndex) and n_lists and index.n_lists != n_lists:
+                logger.warning(
+                    f"{path} holds an IVF index of {index.n_lists} cells, "
+                    f"VECTOR_INDEX_IVF_LISTS={settings.VECTOR_INDEX_IVF_LISTS} is ignored"
+                )
+            index._version = file_version(path)
+        elif settings.VECTOR_INDEX_IVF_LISTS:
+            index = IVFIndex(
+                n_lists=settings.VECTOR_INDEX_IVF_LISTS, n_probe=settings.VECTOR_INDEX_N_PROBE
+            )
+        else:
+            index = FlatIndex()
+        index.path = path
+        index.refresh()
+        return index
+
+    def stats(self) -> dict:
+        return {"kind": self.kind, "dim": self.dim, "size": len(self)}
+
+
+class FlatIndex(VectorIndex):
+    """Exact search over all the vectors."""
+
+    kind = "flat"
+
+    def __init__(self, dim: Optional[int] = None):
+        super().__init__(dim)
+        self._list: Optional[VectorList] = None
+        if dim is not None:
+            self._allocate()
+
+    def _allocate(self):
+        self._list = VectorList(self.dim)
+
+    def _lists(self) -> list[VectorList]:
+        return [self._list] if self._list is not None else []
+
+    def _insert(self, ids: np.ndarray, vectors: np.ndarray):
+        self._list.append(ids, vectors)
+
+    def _candidate_lists(self, query: np.ndarray) -> list[VectorList]:
+        return self._lists()
+
+    def _state(self) -> dict:
+        return {}
+
+
+class IVFIndex(VectorIndex):
+    """Inverted file index with a k-means coarse quantizer.
+
+    Until it is trained, the index keeps the vectors in a single list searched exhaustively. It
+    trains itself on the indexed vectors once it holds ``train_factor * n_lists`` of them, or
+    when ``train`` is called.
+
+    Args:
+        n_lists: number of k-means cells.
+        n_probe: number of cells scanned per query.
+        train_factor: number of vectors per cell needed to train automatically.
+        max_train_size: k-means runs on a random sample of at most this many vectors.
+    """
+
+    kind = "ivf"
+
+    def __init__(
+        self,
+        dim: Optional[int] = None,
+        n_lists: int = 1024,
+        n_probe: int = 16,
+        train_factor: int = 39,
+        max_train_size: int = 256 * 1024,
+    ):
+        super().__init__(dim)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_factor = train_factor
+        self.max_train_size = max_train_size
+        self.centroids: Optional[np.ndarray] = None
+        self._untrained: Optional[VectorList] = None
+        self._cells: list[VectorList] = []
+        if dim is not None:
+            self._allocate()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _allocate(self):
+        if self.is_trained:
+            self._cells = [VectorList(self.dim) for _ in range(self.n_lists)]
+            self._untrained = None
+        else:
+            self._untrained = VectorList(self.dim)
+
+    def _lists(self) -> list[VectorList]:
+        return self._cells if self.is_trained else [l for l in [self._untrained] if l is not None]
+
+    def assign(self, vectors: np.ndarray, batch_size: int = 16384) -> np.ndarray:
+        """Returns the nearest centroid of each vector."""
+        cells = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch_size):
+            cells[start : start + batch_size] = np.argmax(
+                vectors[start : start + batch_size] @ self.centroids.T, axis=1
+            )
+        return cells
+
+    def _insert(self, ids: np.ndarray, vectors: np.ndarray):
+        if not self.is_trained:
+            self._untrained.append(ids, vectors)
+            if self._untrained.size >= self.train_factor * self.n_lists:
+                self.train()
+            return
+        cells = self.assign(vectors)
+        order = np.argsort(cells, kind="stable")
+        bounds = np.searchsorted(cells[order], np.arange(self.n_lists + 1))
+        for cell, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if end > start:
+                self._cells[cell].append(ids[order[start:end]], vectors[order[start:end]])
+
+    def train(self, iterations: int = 10, seed: int = 0):
+        """Runs spherical k-means on the indexed vectors and redistributes them in the cells."""
+        with self._lock.write():
+            if self._untrained is None or self._untrained.size < self.n_lists:
+                raise ValueError(f"Training {self.n_lists} cells needs {self.n_lists} vectors")
+            vectors = self._untrained.vectors[: self._untrained.size]
+            ids = self._untrained.ids[: self._untrained.size]
+            rng = np.random.default_rng(seed)
+            sample = vectors
+            if len(vectors) > self.max_train_size:
+                sample = vectors[rng.choice(len(vectors), self.max_train_size, replace=False)]
+
+            self.centroids = sample[rng.choice(len(sample), self.n_lists, replace=False)].copy()
+            for _ in range(iterations):
+                cells = self.assign(sample)
+                order = np.argsort(cells, kind="stable")
+                counts = np.bincount(cells, minlength=self.n_lists)
+                starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+                empty = counts == 0
+                sums = np.empty_like(self.centroids)
+                sums[~empty] = np.add.reduceat(sample[order], starts[~empty])
+                # empty cells restart from random vectors
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+                self.centroids = normalize_rows(sums)
+
+            logger.info(f"IVF index trained: {self.n_lists} cells on {len(sample)} vectors.")
+            self._allocate()
+            self._insert(ids, vectors)
+
+    def _candidate_lists(self, query: np.ndarray) -> list[VectorList]:
+        if not self.is_trained:
+            return self._lists()
+        probes = top_k(self.centroids @ query, self.n_probe)
+        return [self._cells[cell] for cell in probes]
+
+    def _state(self) -> dict:
+        return {
+            "n_lists": np.array(self.n_lists),
+            "n_probe": np.array(self.n_probe),
+            "centroids": self.centroids if self.is_trained else np.empty((0, 0), np.float32),
+        }
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "n_lists": self.n_lists,
+            "n_probe": self.n_probe,
+            "trained": self.is_trained,
+        }
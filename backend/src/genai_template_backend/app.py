@@ -1,3 +1,5 @@
+import asyncio
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi import APIRouter
@@ -5,12 +7,16 @@ from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 import os
 
-from fastapi.responses import Response
+from fastapi.responses import PlainTextResponse, Response
 
 from contextlib import asynccontextmanager
 
-from genai_template_backend.api.routes import chat
+from genai_template_backend.api.clients import close_llm_clients, init_llm_clients
+from genai_template_backend.api.metrics import REGISTRY, MetricsMiddleware
+from genai_template_backend.api.tracing import TracingMiddleware, tracer
+from genai_template_backend.api.routes import chat, images, search
 from genai_template_backend.env_settings import logger, settings
+from genai_template_backend.lazy_imports import warm_up
 
 
 @asynccontextmanager
@@ -18,9 +24,17 @@ async def lifespan(app: FastAPI):
     """This function is called when the server starts."""
     # Startup logic
     logger.info("Application startup: Initializing resources concurrently...")
+    if settings.WARMUP_IMPORTS:
+        # off the event loop, the first request doesn't pay for the deferred imports
+        durations = await asyncio.to_thread(warm_up)
+        logger.info(f"Deferred imports loaded in {sum(durations.values()):.2f}s: {durations}")
+    init_llm_clients(app)
 
     yield
     # Shutdown logic
+    await close_llm_clients(app)
+    # not shut down: the app may be started again in this process (tests, reloads)
+    tracer.flush()
     logger.info("Application shutdown.")
 
 
@@ -36,6 +50,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     SessionMiddleware,
     secret_key=os.environ.get("SESSION_SECRET", "change_this_secret"),
@@ -43,6 +59,9 @@ app.add_middleware(
     https_only=False,  # Set to True in production with HTTPS
 )
 
+# outermost, so the root span covers the other middlewares
+app.add_middleware(TracingMiddleware)
+
 
 router = APIRouter()
 
@@ -59,6 +78,12 @@ async def favicon():
     return Response(content=b"", media_type="image/x-icon")
 
 
+# Prometheus metrics, summed over the workers when METRICS_MULTIPROC_DIR is set
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 @router.get("/api/")
 async def root():
     return {"message": f"API is running."}
@@ -66,6 +91,8 @@ async def root():
 
 app.include_router(router, prefix="/api", tags=["root"])
 app.include_router(chat.router, tags=["chat"])
+app.include_router(search.router, tags=["search"])
+app.include_router(images.router, tags=["images"])
 
 
 if __name__ == "__main__":
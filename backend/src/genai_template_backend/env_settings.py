@@ -1,12 +1,13 @@
 import ast
+import os
 import sys
+import tempfile
 import timeit
 
-from typing import Optional
+from typing import Literal, Optional
 
-import litellm
 from loguru import logger as loguru_logger
-from pydantic import SecretStr
+from pydantic import BaseModel, SecretStr
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -14,11 +15,27 @@ class BaseEnvironmentVariables(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
 
+class InferenceDeployment(BaseModel):
+    """Extra deployment of the inference model, see ``INFERENCE_DEPLOYMENTS``."""
+
+    model_name: str
+    base_url: str
+    api_key: SecretStr = SecretStr("")
+    api_version: str = "2025-02-01-preview"
+    # concurrency cap of the deployment, LLM_MAX_CONCURRENCY if not set
+    max_concurrency: Optional[int] = None
+    rate_limit_rpm: Optional[int] = None
+    rate_limit_tpm: Optional[int] = None
+
+
 class InferenceEnvironmentVariables(BaseEnvironmentVariables):
     INFERENCE_BASE_URL: str
     INFERENCE_API_KEY: SecretStr
     INFERENCE_DEPLOYMENT_NAME: str
     INFERENCE_API_VERSION: str = "2025-02-01-preview"
+    # JSON list of deployments sharing the load with the one above, e.g.
+    # [{"model_name": "azure/gpt-4o", "base_url": "https://...", "api_key": "..."}]
+    INFERENCE_DEPLOYMENTS: list[InferenceDeployment] = []
 
 
 class EmbeddingsEnvironmentVariables(BaseEnvironmentVariables):
@@ -26,17 +43,158 @@ class EmbeddingsEnvironmentVariables(BaseEnvironmentVariables):
     EMBEDDINGS_API_KEY: Optional[SecretStr] = "tt"
     EMBEDDINGS_DEPLOYMENT_NAME: Optional[str] = None
     EMBEDDINGS_API_VERSION: str = "2025-02-01-preview"
+    # group concurrent single-text embedding calls into one provider request
+    EMBEDDINGS_MICRO_BATCH_ENABLED: bool = True
+    EMBEDDINGS_MICRO_BATCH_MAX_SIZE: int = 64
+    EMBEDDINGS_MICRO_BATCH_MAX_WAIT: float = 0.005
+    # embed_texts inputs are split into chunks fitting the provider limits
+    EMBEDDINGS_CHUNK_MAX_ITEMS: int = 256
+    EMBEDDINGS_CHUNK_MAX_TOKENS: int = 8000
+    EMBEDDINGS_CHUNK_MAX_IN_FLIGHT: int = 4
+    # directory of the persistent embedding store, one sub-directory per model
+    EMBEDDINGS_STORE_PATH: Optional[str] = None
+    # client-side budget of the embeddings model, unlimited if not set
+    EMBEDDINGS_RATE_LIMIT_RPM: Optional[int] = None
+    EMBEDDINGS_RATE_LIMIT_TPM: Optional[int] = None
 
 
 class APIEnvironmentVariables(BaseEnvironmentVariables):
     BACKEND_HOST: str = "0.0.0.0"
     BACKEND_PORT: str = "8000"
+    # directory shared by the workers for the /metrics values, per worker if not set
+    METRICS_MULTIPROC_DIR: Optional[str] = None
+    # JSON lines file receiving the tracing spans (OTLP/JSON), tracing is off if not set
+    TRACING_EXPORT_PATH: Optional[str] = None
+    # import litellm & co. at startup, otherwise on the first request using them
+    WARMUP_IMPORTS: bool = True
+
+
+class LLMClientEnvironmentVariables(BaseEnvironmentVariables):
+    # maximum number of provider calls in flight per worker
+    LLM_MAX_CONCURRENCY: int = 64
+    # shared httpx connection pool used by litellm
+    LLM_HTTP_MAX_CONNECTIONS: int = 100
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    LLM_HTTP_TIMEOUT: float = 600.0
+    LLM_HTTP_CONNECT_TIMEOUT: float = 5.0
+    # /api/chat/batch: maximum prompts per batch and prompts of one batch in flight
+    LLM_BATCH_MAX_ITEMS: int = 256
+    LLM_BATCH_MAX_CONCURRENCY: int = 8
+    # client-side budget of the inference model, unlimited if not set. Calls that would wait
+    # more than LLM_RATE_LIMIT_MAX_WAIT seconds for it are rejected
+    LLM_RATE_LIMIT_RPM: Optional[int] = None
+    LLM_RATE_LIMIT_TPM: Optional[int] = None
+    LLM_RATE_LIMIT_MAX_WAIT: float = 10.0
+    # prompts are counted with the model's tokenizer and fitted in its context window (from
+    # litellm's model map, LLM_DEFAULT_CONTEXT_WINDOW for unknown models), the oldest history
+    # first; max_tokens is set from what remains, leaving at least LLM_MIN_OUTPUT_TOKENS.
+    # Opt-in: the completions then run up to the whole window left instead of the provider default
+    LLM_TOKEN_BUDGET_ENABLED: bool = False
+    LLM_CONTEXT_WINDOW: Optional[int] = None
+    LLM_DEFAULT_CONTEXT_WINDOW: int = 8192
+    LLM_MAX_OUTPUT_TOKENS: Optional[int] = None
+    LLM_MIN_OUTPUT_TOKENS: int = 256
+    # messages whose token count is memoized, per model
+    LLM_TOKEN_COUNT_CACHE_SIZE: int = 10000
+    # routing over INFERENCE_DEPLOYMENTS: weight of the last call in the latency / error rate
+    # averages, failures in a row draining a deployment and seconds before it is probed again
+    LLM_ROUTER_EWMA_ALPHA: float = 0.3
+    LLM_ROUTER_FAILURE_THRESHOLD: int = 3
+    LLM_ROUTER_COOLDOWN: float = 30.0
+    # hedging: calls slower than this percentile of the recent latencies (and than the min
+    # delay) are duplicated, for at most LLM_HEDGE_MAX_RATE of the calls
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_MIN_DELAY: float = 0.5
+    LLM_HEDGE_MAX_RATE: float = 0.05
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    # record the provider calls to LLM_CASSETTE_PATH, or replay them from it, off if not set
+    LLM_CASSETTE_MODE: Optional[Literal["record", "replay"]] = None
+    LLM_CASSETTE_PATH: str = ".cache/llm.cassette"
+    # replayed calls take their recorded duration times this factor, 0 answers immediately
+    LLM_CASSETTE_TIMING: float = 0.0
+
+
+class LLMCacheEnvironmentVariables(BaseEnvironmentVariables):
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_MAX_SIZE: int = 1024
+    LLM_CACHE_TTL: float = 3600.0
+    # sqlite file of the persistent tier, memory only if not set
+    LLM_CACHE_PATH: Optional[str] = None
+    # semantic cache, needs the embeddings model
+    LLM_SEMANTIC_CACHE_ENABLED: bool = False
+    LLM_SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    LLM_SEMANTIC_CACHE_CAPACITY: int = 10_000
+    # from this number of entries, the lookups run in a thread instead of on the event loop
+    LLM_SEMANTIC_CACHE_OFFLOAD_SIZE: int = 2_000
+    # concurrent identical requests share one provider call
+    LLM_SINGLE_FLIGHT_ENABLED: bool = True
+
+
+class ConversationEnvironmentVariables(BaseEnvironmentVariables):
+    # chat history kept server-side per session, least recently used evicted first
+    CONVERSATION_MAX_SESSIONS: int = 10_000
+    # seconds of inactivity after which a conversation is forgotten
+    CONVERSATION_TTL: float = 86_400.0
+    # sqlite file of the persistent tier, memory only if not set
+    CONVERSATION_PATH: Optional[str] = None
+    # tokens of history sent with each message, older turns are summarized
+    CONVERSATION_HISTORY_MAX_TOKENS: int = 2000
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 256
+
+
+class LocalModelEnvironmentVariables(BaseEnvironmentVariables):
+    # calls to the local torch models are batched: up to LOCAL_MODEL_MAX_BATCH_SIZE inputs, the
+    # first one waiting at most LOCAL_MODEL_MAX_WAIT seconds for the others
+    LOCAL_MODEL_MAX_BATCH_SIZE: int = 16
+    LOCAL_MODEL_MAX_WAIT: float = 0.005
+    # torch device of the local models, picked by utils.get_device_type if not set
+    LOCAL_MODEL_DEVICE: Optional[str] = None
+    # threads of torch's intra-op pool (whole process), torch's default if not set
+    LOCAL_MODEL_INTRA_OP_THREADS: Optional[int] = None
+    # seeds torch, numpy and random when a model is loaded, if not 0
+    LOCAL_MODEL_SEED: int = 0
+
+
+class ImageEnvironmentVariables(BaseEnvironmentVariables):
+    # directory the uploads of /api/images are streamed to
+    IMAGE_UPLOAD_DIR: str = os.path.join(tempfile.gettempdir(), "genai_template_uploads")
+    IMAGE_MAX_UPLOAD_BYTES: int = 20 * 1024 * 1024
+    IMAGE_MAX_FILES: int = 4
+    # size of the preprocessed images (3, IMAGE_HEIGHT, IMAGE_WIDTH)
+    IMAGE_WIDTH: int = 768
+    IMAGE_HEIGHT: int = 1024
+    # preprocessing processes, os.cpu_count() if not set
+    IMAGE_WORKERS: Optional[int] = None
+    # images accepted at once (queued or preprocessed), twice the processes if not set; an upload
+    # waits at most IMAGE_QUEUE_TIMEOUT seconds for a free slot, then gets a 503
+    IMAGE_MAX_PENDING: Optional[int] = None
+    IMAGE_QUEUE_TIMEOUT: float = 1.0
+    # preprocessed images kept in memory (about 9 MB each at 768x1024), their uploads are
+    # deleted when they are evicted or the server stops
+    IMAGE_CACHE_SIZE: int = 8
+
+
+class VectorIndexEnvironmentVariables(BaseEnvironmentVariables):
+    # .npz snapshot the search index is loaded from at startup, shared by the workers of a host.
+    # The writes are appended to <path>.log, compacted into the snapshot once it grows large
+    VECTOR_INDEX_PATH: Optional[str] = None
+    # number of IVF cells, 0 for exact search
+    VECTOR_INDEX_IVF_LISTS: int = 0
+    VECTOR_INDEX_N_PROBE: int = 16
 
 
 class Settings(
     InferenceEnvironmentVariables,
     EmbeddingsEnvironmentVariables,
     APIEnvironmentVariables,
+    LLMClientEnvironmentVariables,
+    LLMCacheEnvironmentVariables,
+    ConversationEnvironmentVariables,
+    LocalModelEnvironmentVariables,
+    ImageEnvironmentVariables,
+    VectorIndexEnvironmentVariables,
 ):
     """Settings class for the application.
 
@@ -61,8 +219,6 @@ def initialize():
     settings = Settings()
     loguru_logger.remove()
 
-    litellm.suppress_debug_info = True
-
     if settings.DEV_MODE:
         loguru_logger.add(sys.stderr, level="TRACE")
     else:
@@ -0,0 +1,45 @@
+"""Deferred imports of the heavy dependencies.
+
+``litellm`` alone takes seconds to import. The modules of the backend bind it with
+``lazy_import`` instead of ``import``: the module is only executed on the first access to one of
+its attributes, so importing the app (or a script using the settings) stays fast and a uvicorn
+worker starts serving sooner. ``warm_up`` imports them for real, the ``lifespan`` hook calls it
+in a thread so the first request doesn't pay for the imports.
+"""
+
+import importlib
+import importlib.util
+import sys
+import time
+from types import ModuleType
+
+# imported by ``warm_up``, in this order
+HEAVY_MODULES = ("tiktoken", "litellm", "instructor")
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Returns the module ``name``, executed on the first access to one of its attributes."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def warm_up(modules: tuple[str, ...] = HEAVY_MODULES) -> dict[str, float]:
+    """Imports ``modules`` for real, returns the seconds spent on each one."""
+    durations = {}
+    for name in modules:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        # a lazy module is executed by its first attribute access
+        getattr(module, "__name__")
+        durations[name] = time.perf_counter() - start
+    return durations
@@ -1,6 +1,9 @@
 import random
-import numpy as np
-import torch
+
+from genai_template_backend.lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+torch = lazy_import("torch")
 
 
 def set_seed(seed_value: int):
@@ -0,0 +1,101 @@
+"""Concurrency benchmark of the ``/api/chat`` route.
+
+The provider is replaced by litellm's ``mock_response`` with a fixed latency, so the numbers only
+measure how many chats one worker can serve at the same time. Two variants are compared:
+
+- ``blocking``: the previous implementation, calling the sync ``generate_from_messages`` inside
+  the async route, which blocks the event loop for the whole round-trip.
+- ``async``: the current route, using the shared client and ``a_generate_from_messages``.
+
+Usage:
+    uv run --project backend python benchmarks/bench_chat_concurrency.py --latency 0.2
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+import litellm
+from fastapi import FastAPI
+
+from genai_template_backend.api.clients import build_inference_llm
+from genai_template_backend.api.routes.chat import ChatRequest, ChatResponse
+from genai_template_backend.app import app
+from genai_template_backend.env_settings import settings
+
+
+def patch_provider(latency: float):
+    """Replaces the litellm provider calls with mocked responses taking ``latency`` seconds."""
+    original_acompletion = litellm.acompletion
+    original_completion = litellm.completion
+
+    async def fake_acompletion(*args, **kwargs):
+        await asyncio.sleep(latency)
+        return await original_acompletion(*args, mock_response="Hello from the mock!", **kwargs)
+
+    def fake_completion(*args, **kwargs):
+        time.sleep(latency)
+        return original_completion(*args, mock_response="Hello from the mock!", **kwargs)
+
+    litellm.acompletion = fake_acompletion
+    litellm.completion = fake_completion
+
+
+def build_blocking_app() -> FastAPI:
+    """Rebuilds the previous, event-loop blocking, version of the chat route."""
+    blocking_app = FastAPI()
+
+    @blocking_app.post("/api/chat", response_model=ChatResponse)
+    async def post_chat_message(request: ChatRequest):
+        llm = build_inference_llm(settings)
+        response_text = llm.generate_from_messages(
+            messages=[{"role": "user", "content": request.message}]
+        )
+        return ChatResponse(response=response_text)
+
+    return blocking_app
+
+
+async def run_load(target_app: FastAPI, concurrency: int, total_requests: int) -> float:
+    """Sends ``total_requests`` chats with ``concurrency`` in flight and returns requests/sec."""
+    transport = httpx.ASGITransport(app=target_app)
+    queue = asyncio.Queue()
+    for i in range(total_requests):
+        queue.put_nowait(i)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as c:
+
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                response = await c.post("/api/chat", json={"message": f"Hello {i}"})
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return total_requests / elapsed
+
+
+async def main(latency: float, levels: list[int], requests_per_level: int):
+    patch_provider(latency)
+    blocking_app = build_blocking_app()
+
+    print(f"provider latency: {latency * 1000:.0f} ms, {requests_per_level} requests per level")
+    print(f"{'in-flight':>10} | {'blocking req/s':>15} | {'async req/s':>12}")
+    async with app.router.lifespan_context(app):
+        for concurrency in levels:
+            blocking_rps = await run_load(blocking_app, concurrency, requests_per_level)
+            async_rps = await run_load(app, concurrency, requests_per_level)
+            print(f"{concurrency:>10} | {blocking_rps:>15.1f} | {async_rps:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.2, help="mocked provider latency (s)")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--requests", type=int, default=64, help="requests sent per level")
+    args = parser.parse_args()
+    asyncio.run(main(args.latency, args.levels, args.requests))
@@ -0,0 +1,106 @@
+"""Render cost of one new chat message in the NiceGUI ``Chat`` component, by history length.
+
+The component is built in a headless NiceGUI client (no browser, no websocket). For each history
+length, a chat holding that many messages receives ``--samples`` new ones and the benchmark
+reports, per message: the Python time to update the element tree, the elements created, and the
+size of the update the client would send over the websocket (the JSON of the outbox, as the
+outbox loop serializes it).
+
+Two strategies are compared:
+
+- ``rebuild``: the previous behavior, clearing the messages container and creating every
+  message element again on each refresh.
+- ``incremental``: ``Chat.add_message``, one element per new message and only the latest
+  ``--window`` messages mounted.
+
+Usage:
+    uv run --project frontend python benchmarks/bench_chat_render.py --levels 10 100 1000
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+from nicegui import Client
+from nicegui.page import page
+
+from genai_template_frontend.components.chat import Chat
+
+
+def flush(client: Client) -> int:
+    """Empties the outbox of ``client``, returns the bytes of the update it held."""
+    data = {
+        element_id: None if element is None else element._to_dict()
+        for element_id, element in client.outbox.updates.items()
+    }
+    client.outbox.updates.clear()
+    return len(json.dumps(data, default=str)) if data else 0
+
+
+def rebuild(chat: Chat):
+    """Previous behavior: clears the container and renders every message again."""
+    chat.messages_container.clear()
+    with chat.messages_container:
+        for message in chat.messages:
+            chat._render_message(message)
+
+
+def bench(strategy: str, history: int, samples: int, window: int) -> dict:
+    client = Client(page("/"), request=None)
+    with client:
+        chat = Chat(mounted_messages=window)
+        chat.build()
+        for i in range(history):
+            if strategy == "incremental":
+                chat.add_message("user" if i % 2 == 0 else "bot", f"message {i} " * 8)
+            else:
+                chat.messages.append({"role": "user", "text": f"message {i} " * 8, "timestamp": ""})
+        if strategy == "rebuild":
+            rebuild(chat)
+        flush(client)
+
+        durations, created, sizes = [], [], []
+        for i in range(samples):
+            next_id = client.next_element_id
+            start = time.perf_counter()
+            if strategy == "incremental":
+                chat.add_message("user", f"new message {i} " * 8)
+            else:
+                chat.messages.append({"role": "user", "text": f"new {i} " * 8, "timestamp": ""})
+                rebuild(chat)
+            durations.append(time.perf_counter() - start)
+            created.append(client.next_element_id - next_id)
+            sizes.append(flush(client))
+        mounted = len(chat.messages_container.default_slot.children)
+    client.remove_all_elements()
+    return {
+        "strategy": strategy,
+        "history": history,
+        "ms_per_message": 1000 * float(np.median(durations)),
+        "elements_created": float(np.median(created)),
+        "update_kb": float(np.median(sizes)) / 1024,
+        "mounted_messages": mounted,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--samples", type=int, default=20, help="new messages timed per level")
+    parser.add_argument("--window", type=int, default=50, help="messages kept mounted")
+    args = parser.parse_args()
+
+    print(
+        f"{'strategy':>12} | {'history':>7} | {'ms/msg':>8} | {'created':>7} | "
+        f"{'update KB':>9} | {'mounted':>7}"
+    )
+    for history in args.levels:
+        for strategy in ("rebuild", "incremental"):
+            result = bench(strategy, history, args.samples, args.window)
+            print(
+                f"{result['strategy']:>12} | {result['history']:>7} | "
+                f"{result['ms_per_message']:>8.2f} | {result['elements_created']:>7.0f} | "
+                f"{result['update_kb']:>9.1f} | "
+                f"{result['mounted_messages']:>7}"
+            )
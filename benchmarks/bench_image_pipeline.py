@@ -0,0 +1,142 @@
+"""Preprocessing throughput of uploaded images and the event loop stalls it causes.
+
+``--images`` JPEG photos of ``--source-size`` are preprocessed to ``--size`` three ways:
+
+- ``event-loop``: decoded and resized in the coroutine, as a naive route would.
+- ``pool-pickle``: in a process pool, the array pickled back through the pool's pipe.
+- ``pool-shm``: through ``ImagePipeline``, the array written to shared memory.
+
+For each, the benchmark reports the images per second and the longest delay of a 1 ms ticker
+running on the event loop at the same time, i.e. how long the other requests would wait.
+
+Usage:
+    uv run --project backend python benchmarks/bench_image_pipeline.py --images 64 --workers 4
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from PIL import Image
+
+from genai_template_backend.api.image_pipeline import ImagePipeline, PipelineSaturated, preprocess
+
+
+def preprocess_to_array(path: str, width: int, height: int) -> np.ndarray:
+    """Preprocesses in a private block and returns a copy of the array, pickled by the pool."""
+    block = SharedMemory(create=True, size=3 * height * width * 4)
+    try:
+        preprocess(path, block.name, width, height)
+        return np.ndarray((3, height, width), dtype=np.float32, buffer=block.buf).copy()
+    finally:
+        block.close()
+        block.unlink()
+
+
+def write_images(directory: str, count: int, size: tuple[int, int]) -> list[str]:
+    rng = np.random.default_rng(0)
+    # smooth noise compresses like a photo, not like flat color
+    small = rng.integers(0, 256, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize(size, Image.Resampling.BICUBIC)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"{i}.jpg")
+        image.save(path, format="JPEG", quality=90)
+        paths.append(path)
+    return paths
+
+
+async def max_loop_delay(stop: asyncio.Event) -> float:
+    """Longest lateness of a 1 ms sleep until ``stop`` is set."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        worst = max(worst, time.perf_counter() - start - 0.001)
+    return worst
+
+
+async def run(strategy: str, paths: list[str], args: argparse.Namespace, directory: str):
+    width, height = args.size
+    if strategy == "pool-shm":
+        pipeline = ImagePipeline(
+            os.path.join(directory, "uploads"), width, height, max_workers=args.workers
+        )
+        # the processes are started before timing
+        await asyncio.gather(
+            *(upload(pipeline, f"warm-{i}", paths[0]) for i in range(args.workers))
+        )
+    elif strategy == "pool-pickle":
+        executor = ProcessPoolExecutor(
+            args.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(executor, preprocess_to_array, paths[0], width, height)
+                for _ in range(args.workers)
+            )
+        )
+
+    async def one(i: int, path: str):
+        if strategy == "event-loop":
+            preprocess_to_array(path, width, height)
+            await asyncio.sleep(0)
+        elif strategy == "pool-pickle":
+            await loop.run_in_executor(executor, preprocess_to_array, path, width, height)
+        else:
+            await upload(pipeline, str(i), path)
+
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(max_loop_delay(stop))
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i, path) for i, path in enumerate(paths)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    delay = await ticker
+
+    if strategy == "pool-shm":
+        await pipeline.aclose()
+    elif strategy == "pool-pickle":
+        executor.shutdown()
+    return len(paths) / elapsed, delay
+
+
+async def upload(pipeline: ImagePipeline, image_id: str, path: str):
+    # the route waits for a slot the same way, without the 503 after queue_timeout
+    while True:
+        try:
+            block = await pipeline.acquire()
+            break
+        except PipelineSaturated:
+            continue
+    # a copy, as the route writes the body: the pipeline deletes the uploads it evicts
+    upload_path = os.path.join(pipeline.upload_dir, image_id)
+    await asyncio.to_thread(shutil.copyfile, path, upload_path)
+    await pipeline.preprocess(image_id, upload_path, block)
+
+
+async def main(args: argparse.Namespace):
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_images(directory, args.images, tuple(args.source_size))
+        print(f"{'strategy':>12} | {'img/s':>7} | {'max loop delay ms':>17}")
+        for strategy in ("event-loop", "pool-pickle", "pool-shm"):
+            throughput, delay = await run(strategy, paths, args, directory)
+            print(f"{strategy:>12} | {throughput:>7.1f} | {1000 * delay:>17.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--source-size", type=int, nargs=2, default=[3024, 4032])
+    parser.add_argument("--size", type=int, nargs=2, default=[768, 1024], help="width height")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    asyncio.run(main(parser.parse_args()))
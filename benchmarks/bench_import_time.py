@@ -0,0 +1,179 @@
+"""Cold-start import time of the backend app and the frontend, from ``python -X importtime``.
+
+Each target module is imported ``--runs`` times in a fresh interpreter. The report gives the
+median import time (the sum of the self times of every module imported, interpreter start-up
+excluded) and wall time of the process, then the slowest modules and the time per top-level
+package of the median run, which shows at once a heavy dependency imported eagerly again.
+
+``--save`` writes the results to a JSON file, ``--baseline`` compares them with a saved run and
+exits with an error when the import time of a target grows by more than ``--max-regression``, or
+is above ``--budget`` seconds.
+
+Usage:
+    uv run --all-packages python benchmarks/bench_import_time.py \
+        --save benchmarks/results/import_time.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIRECTORIES = (
+    os.path.join(ROOT, "backend", "src"),
+    os.path.join(ROOT, "frontend", "src"),
+)
+DEFAULT_TARGETS = ("genai_template_backend.app", "genai_template_frontend.main")
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """Returns the ``(module, self_us, cumulative_us)`` of each ``-X importtime`` line."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():  # header line
+            continue
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def import_once(target: str) -> tuple[float, float, list[tuple[str, int, int]]]:
+    """Imports ``target`` in a new interpreter, returns the import time, wall time and modules."""
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(
+        [*SOURCE_DIRECTORIES, *filter(None, [env.get("PYTHONPATH")])]
+    )
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    if process.returncode:
+        raise RuntimeError(f"Importing {target} failed:\n{process.stderr[-2000:]}")
+    modules = parse_importtime(process.stderr)
+    return sum(self_us for _, self_us, _ in modules) / 1e6, wall, modules
+
+
+def measure(target: str, runs: int, top: int) -> dict:
+    samples = [import_once(target) for _ in range(runs)]
+    samples.sort(key=lambda sample: sample[0])
+    import_time, _, modules = samples[len(samples) // 2]
+
+    packages = defaultdict(int)
+    for name, self_us, _ in modules:
+        packages[name.split(".")[0]] += self_us
+    slowest = sorted(modules, key=lambda module: module[2], reverse=True)[:top]
+    return {
+        "target": target,
+        "runs": runs,
+        "import_time": import_time,
+        "wall_time": statistics.median(wall for _, wall, _ in samples),
+        "modules": len(modules),
+        "slowest": [
+            {"module": name, "self": self_us / 1e6, "cumulative": cumulative_us / 1e6}
+            for name, self_us, cumulative_us in slowest
+        ],
+        "packages": {
+            name: self_us / 1e6
+            for name, self_us in sorted(packages.items(), key=lambda p: p[1], reverse=True)[:top]
+        },
+    }
+
+
+def print_result(result: dict):
+    print(
+        f"\n{result['target']}: import {1000 * result['import_time']:.0f} ms, "
+        f"process {1000 * result['wall_time']:.0f} ms, {result['modules']} modules "
+        f"(median of {result['runs']} runs)"
+    )
+    print(f"  {'slowest modules':<56} | {'self ms':>8} | {'cumul. ms':>9}")
+    for module in result["slowest"]:
+        print(
+            f"  {module['module'][:56]:<56} | {1000 * module['self']:>8.1f} | "
+            f"{1000 * module['cumulative']:>9.1f}"
+        )
+    print(f"  {'top-level packages':<56} | {'self ms':>8}")
+    for name, seconds in result["packages"].items():
+        print(f"  {name[:56]:<56} | {1000 * seconds:>8.1f}")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def check(results: list[dict], baseline: Optional[str], max_regression: float, budget) -> bool:
+    """Prints the changes since the baseline run, returns False on a regression."""
+    before = {}
+    if baseline:
+        with open(baseline) as f:
+            before = {r["target"]: r for r in json.load(f)["results"]}
+        print(f"\ncompared with {baseline} (regression above {max_regression:.0%}):")
+
+    passed = True
+    for result in results:
+        messages = []
+        if result["target"] in before:
+            change = result["import_time"] / before[result["target"]]["import_time"] - 1
+            messages.append(f"import time {change:+.1%}")
+            if change > max_regression:
+                messages.append("REGRESSION")
+                passed = False
+        if budget is not None and result["import_time"] > budget:
+            messages.append(f"OVER THE {budget:.2f}s BUDGET")
+            passed = False
+        if messages:
+            print(f"{result['target']:>32} | {' | '.join(messages)}")
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--targets", nargs="+", default=list(DEFAULT_TARGETS))
+    parser.add_argument("--runs", type=int, default=5, help="imports per target")
+    parser.add_argument("--top", type=int, default=15, help="modules and packages listed")
+    parser.add_argument("--save", help="JSON file the results are written to")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--budget", type=float, help="maximum import time of a target, seconds")
+    args = parser.parse_args()
+
+    results = []
+    for target in args.targets:
+        result = measure(target, args.runs, args.top)
+        print_result(result)
+        results.append(result)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "python": sys.version.split()[0],
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"results saved to {args.save}")
+
+    passed = check(results, args.baseline, args.max_regression, args.budget)
+    sys.exit(0 if passed else 1)
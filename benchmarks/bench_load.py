@@ -0,0 +1,334 @@
+"""Load test of the app against a local OpenAI-compatible stub provider.
+
+Starts ``stub_llm_server.py`` in a subprocess, points the inference and embedding models at it,
+then serves the app with uvicorn and drives it at each concurrency level. The app, the load
+generator and the lag monitor share one event loop (``httpx.ASGITransport`` would buffer the
+streamed responses). The stub has a fixed latency, so the numbers measure the app's own overhead:
+throughput, p50 / p95 / p99 latency (and time to first token when streaming) and the event loop
+lag, sampled by a task sleeping ``--lag-interval`` seconds; the client's own work is included.
+
+Scenarios:
+
+- ``chat``: ``POST /api/chat``.
+- ``stream``: ``POST /api/chat/stream``, read to the end.
+- ``search``: ``POST /api/search`` with a text query (single embedding path), after indexing
+  ``--index-items`` texts through ``POST /api/search/items`` (chunked embedding path).
+
+``--save`` writes the results to a JSON file, ``--baseline`` compares them with a saved run and
+exits with an error when the throughput drops, or the p99 latency grows, by more than
+``--max-regression``.
+
+Usage:
+    uv run --project backend python benchmarks/bench_load.py --scenarios chat stream \
+        --levels 1 16 64 --save benchmarks/results/load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Optional
+
+import httpx
+import numpy as np
+import uvicorn
+
+from stub_llm_server import add_stub_arguments
+
+STUB_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_llm_server.py")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub_server(args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    """Starts the stub provider and waits until it answers."""
+    port = free_port()
+    stub_args = [
+        f"--{name.replace('_', '-')}={getattr(args, name)}"
+        for name in (
+            "latency",
+            "token_rate",
+            "completion_tokens",
+            "error_rate",
+            "rate_limit_rate",
+            "retry_after",
+            "embedding_dim",
+        )
+    ]
+    process = subprocess.Popen([sys.executable, STUB_SERVER, f"--port={port}", *stub_args])
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{url}/health", timeout=1).raise_for_status()
+            return process, url
+        except httpx.HTTPError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("The stub LLM server did not start")
+
+
+def configure_environment(stub_url: str):
+    """Points the app at the stub, must run before the app is imported."""
+    os.environ.update(
+        {
+            "INFERENCE_BASE_URL": f"{stub_url}/v1",
+            "INFERENCE_DEPLOYMENT_NAME": "openai/stub-chat",
+            "INFERENCE_API_KEY": "stub",
+            "EMBEDDINGS_BASE_URL": f"{stub_url}/v1",
+            "EMBEDDINGS_DEPLOYMENT_NAME": "openai/stub-embedding",
+            "EMBEDDINGS_API_KEY": "stub",
+            # every request must reach the provider
+            "LLM_CACHE_ENABLED": "false",
+            "LLM_SEMANTIC_CACHE_ENABLED": "false",
+            "EMBEDDINGS_STORE_PATH": "",
+            "VECTOR_INDEX_PATH": "",
+            "DEV_MODE": "false",
+        }
+    )
+
+
+class LoopLagMonitor:
+    """Measures how late a task sleeping ``interval`` seconds wakes up."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lags: list[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(time.perf_counter() - start - self.interval)
+
+    def __enter__(self):
+        """Starts sampling the lag on the running loop."""
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        """Stops sampling."""
+        self._task.cancel()
+
+
+async def chat_request(client: httpx.AsyncClient, i: int) -> tuple[bool, Optional[float]]:
+    response = await client.post("/api/chat", json={"message": f"Hello {i}"})
+    return response.status_code == 200, None
+
+
+async def stream_request(client: httpx.AsyncClient, i: int) -> tuple[bool, Optional[float]]:
+    start = time.perf_counter()
+    ttft, ok = None, False
+    async with client.stream("POST", "/api/chat/stream", json={"message": f"Hello {i}"}) as r:
+        async for line in r.aiter_lines():
+            if ttft is None and line.startswith("data:"):
+                ttft = time.perf_counter() - start
+            if line.startswith("event: done"):
+                ok = True
+            elif line.startswith("event: error"):
+                ok = False
+    return ok and r.status_code == 200, ttft
+
+
+async def search_request(client: httpx.AsyncClient, i: int) -> tuple[bool, Optional[float]]:
+    response = await client.post("/api/search", json={"query": f"linen shirt {i}", "k": 10})
+    return response.status_code == 200, None
+
+
+SCENARIOS = {"chat": chat_request, "stream": stream_request, "search": search_request}
+
+
+async def index_items(client: httpx.AsyncClient, count: int, batch_size: int = 256):
+    for first in range(0, count, batch_size):
+        items = [
+            {"id": i, "text": f"catalog item {i}"}
+            for i in range(first, min(first + batch_size, count))
+        ]
+        response = await client.post("/api/search/items", json={"items": items})
+        response.raise_for_status()
+
+
+def percentiles(values: list[float], prefix: str) -> dict:
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {f"{prefix}_p50": p50, f"{prefix}_p95": p95, f"{prefix}_p99": p99}
+
+
+async def run_level(
+    client: httpx.AsyncClient, scenario: str, concurrency: int, total: int, lag_interval: float
+) -> dict:
+    send = SCENARIOS[scenario]
+    next_request = iter(range(total))
+    latencies, ttfts, errors = [], [], 0
+
+    async def worker():
+        nonlocal errors
+        for i in next_request:
+            start = time.perf_counter()
+            try:
+                ok, ttft = await send(client, i)
+            except httpx.HTTPError:
+                ok, ttft = False, None
+            latencies.append(time.perf_counter() - start)
+            if ttft is not None:
+                ttfts.append(ttft)
+            errors += not ok
+
+    with LoopLagMonitor(lag_interval) as monitor:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput": total / elapsed,
+        **percentiles(latencies, "latency"),
+        **percentiles(ttfts, "ttft"),
+        **percentiles(monitor.lags, "loop_lag"),
+        "loop_lag_max": max(monitor.lags, default=0.0),
+    }
+
+
+def print_result(result: dict):
+    ttft = f"{1000 * result['ttft_p50']:>9.1f}" if "ttft_p50" in result else f"{'-':>9}"
+    print(
+        f"{result['scenario']:>8} | {result['concurrency']:>6} | {result['throughput']:>8.1f} | "
+        f"{1000 * result['latency_p50']:>8.1f} | {1000 * result['latency_p95']:>8.1f} | "
+        f"{1000 * result['latency_p99']:>8.1f} | {ttft} | "
+        f"{1000 * result['loop_lag_p99']:>9.2f} | {1000 * result['loop_lag_max']:>9.2f} | "
+        f"{result['errors']:>6}"
+    )
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_with_baseline(results: list[dict], path: str, max_regression: float) -> bool:
+    """Prints the changes since the baseline run, returns False if one is a regression."""
+    with open(path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    print(f"\ncompared with {path} (regression above {max_regression:.0%}):")
+    passed = True
+    for result in results:
+        before = baseline.get((result["scenario"], result["concurrency"]))
+        if before is None:
+            continue
+        throughput = result["throughput"] / before["throughput"] - 1
+        p99 = result["latency_p99"] / before["latency_p99"] - 1
+        regression = throughput < -max_regression or p99 > max_regression
+        passed &= not regression
+        print(
+            f"{result['scenario']:>8} | {result['concurrency']:>6} | throughput {throughput:+.1%} "
+            f"| p99 {p99:+.1%}{' | REGRESSION' if regression else ''}"
+        )
+    return passed
+
+
+async def main(args: argparse.Namespace) -> bool:
+    # imported here, the settings are read from the environment set by configure_environment
+    from genai_template_backend.app import app
+
+    results = []
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    limits = httpx.Limits(max_connections=max(args.levels), max_keepalive_connections=None)
+    # no cookies: each request is a new visitor, not another turn of one shared conversation
+    cookies = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=None, cookies=cookies
+        ) as c:
+            if "search" in args.scenarios:
+                await index_items(c, args.index_items)
+
+            print(
+                f"{'scenario':>8} | {'in-fl.':>6} | {'req/s':>8} | {'p50 ms':>8} | {'p95 ms':>8} | "
+                f"{'p99 ms':>8} | {'ttft ms':>9} | {'lag p99':>9} | {'lag max':>9} | {'errors':>6}"
+            )
+            for scenario in args.scenarios:
+                # warm-up: connections, lazy imports, model metadata
+                await run_level(c, scenario, 4, 8, args.lag_interval)
+                for concurrency in args.levels:
+                    total = max(args.requests, concurrency)
+                    result = await run_level(c, scenario, concurrency, total, args.lag_interval)
+                    print_result(result)
+                    results.append(result)
+    finally:
+        server.should_exit = True
+        await serving
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        stub = {name: getattr(args, name) for name in ("latency", "token_rate", "error_rate")}
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "stub": stub,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"results saved to {args.save}")
+
+    if args.baseline:
+        return compare_with_baseline(results, args.baseline, args.max_regression)
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=["chat"])
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--requests", type=int, default=256, help="requests sent per level")
+    parser.add_argument("--index-items", type=int, default=1000, help="items of the search index")
+    parser.add_argument("--lag-interval", type=float, default=0.01)
+    parser.add_argument("--save", help="JSON file the results are written to")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.1)
+    parser.add_argument("--stub-url", help="use a stub server already running at this url")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    stub_process = None
+    if args.stub_url:
+        stub_url = args.stub_url
+    else:
+        stub_process, stub_url = start_stub_server(args)
+    try:
+        configure_environment(stub_url)
+        passed = asyncio.run(main(args))
+    finally:
+        if stub_process is not None:
+            stub_process.terminate()
+            stub_process.wait()
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,100 @@
+"""Throughput of a local torch model served by ``ModelServer``, by maximum batch size.
+
+A small convolutional network on ``--image-size`` RGB images stands in for a try-on model. For
+each maximum batch size, ``--concurrency`` callers send ``--requests`` single images in a closed
+loop and the benchmark reports the throughput, the p50 / p99 latency of a call and the batches
+actually formed. Runs on the CPU unless ``--device`` says otherwise.
+
+Usage:
+    uv run --project backend python benchmarks/bench_model_batching.py --batch-sizes 1 4 16 32 \
+        --threads 4
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+import torch
+
+from genai_template_backend.api.model_server import ModelServer
+
+
+def dummy_model() -> torch.nn.Module:
+    return torch.nn.Sequential(
+        torch.nn.Conv2d(3, 16, 3, stride=2, padding=1),
+        torch.nn.ReLU(),
+        torch.nn.Conv2d(16, 32, 3, stride=2, padding=1),
+        torch.nn.ReLU(),
+        torch.nn.Conv2d(32, 64, 3, stride=2, padding=1),
+        torch.nn.ReLU(),
+        torch.nn.AdaptiveAvgPool2d(1),
+        torch.nn.Flatten(),
+        torch.nn.Linear(64, 128),
+    )
+
+
+async def run_level(args: argparse.Namespace, max_batch_size: int) -> dict:
+    server = ModelServer(
+        max_batch_size=max_batch_size,
+        max_wait=args.max_wait,
+        device=args.device,
+        intra_op_threads=args.threads,
+    )
+    worker = server.register("dummy", dummy_model)
+    image = torch.rand(3, args.image_size, args.image_size)
+    # warm-up: model loading and the first allocations
+    await asyncio.gather(*(server.infer("dummy", image) for _ in range(max_batch_size)))
+    worker.batches = worker.items = 0
+    worker.batch_size_histogram.clear()
+    worker.queue_wait_seconds = worker.inference_seconds = 0.0
+
+    next_request = iter(range(args.requests))
+    latencies = []
+
+    async def caller():
+        for _ in next_request:
+            start = time.perf_counter()
+            await server.infer("dummy", image)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    stats = worker.stats()
+    await server.aclose()
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return {
+        "max_batch_size": max_batch_size,
+        "throughput": args.requests / elapsed,
+        "latency_p50": p50,
+        "latency_p99": p99,
+        "mean_batch_size": stats["mean_batch_size"],
+        "mean_batch_ms": stats["mean_batch_ms"],
+    }
+
+
+async def main(args: argparse.Namespace):
+    print(
+        f"{'max batch':>9} | {'img/s':>8} | {'p50 ms':>8} | {'p99 ms':>8} | "
+        f"{'mean batch':>10} | {'batch ms':>8}"
+    )
+    for max_batch_size in args.batch_sizes:
+        result = await run_level(args, max_batch_size)
+        print(
+            f"{result['max_batch_size']:>9} | {result['throughput']:>8.1f} | "
+            f"{1000 * result['latency_p50']:>8.1f} | {1000 * result['latency_p99']:>8.1f} | "
+            f"{result['mean_batch_size']:>10.1f} | {result['mean_batch_ms']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=64, help="callers in flight")
+    parser.add_argument("--image-size", type=int, default=128)
+    parser.add_argument("--max-wait", type=float, default=0.005)
+    parser.add_argument("--threads", type=int, help="torch intra-op threads")
+    parser.add_argument("--device", default="cpu")
+    asyncio.run(main(parser.parse_args()))
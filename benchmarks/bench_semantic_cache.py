@@ -0,0 +1,77 @@
+"""Hit rate and lookup latency of the semantic cache at 10k / 100k cached prompts.
+
+Prompts are synthetic normalized embeddings. Half of the queries are paraphrases of a cached
+prompt (the cached vector plus noise, cosine similarity around ``--paraphrase-similarity``), the
+other half are unrelated prompts that must miss.
+
+Usage:
+    uv run --project backend python benchmarks/bench_semantic_cache.py --sizes 10000 100000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from genai_template_backend.api.semantic_cache import SemanticCache, normalize
+
+
+def paraphrase(vector: np.ndarray, similarity: float, rng: np.random.Generator) -> np.ndarray:
+    """Returns a unit vector whose cosine similarity with ``vector`` is ``similarity``."""
+    noise = rng.standard_normal(vector.shape).astype(np.float32)
+    noise = normalize(noise - noise.dot(vector) * vector)
+    return normalize(similarity * vector + np.sqrt(1 - similarity**2) * noise)
+
+
+def run(size: int, dim: int, queries: int, threshold: float, similarity: float, seed: int):
+    rng = np.random.default_rng(seed)
+    cache = SemanticCache(embedding_llm=None, threshold=threshold, capacity=size)
+    vectors = rng.standard_normal((size, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    for i, vector in enumerate(vectors):
+        cache.add("bench", vector, f"answer {i}")
+
+    latencies, paraphrase_hits, false_hits = [], 0, 0
+    for q in range(queries):
+        if q % 2 == 0:
+            target = int(rng.integers(size))
+            query = paraphrase(vectors[target], similarity, rng)
+        else:
+            target = None
+            query = normalize(rng.standard_normal(dim))
+
+        start = time.perf_counter()
+        value = cache.lookup("bench", query)
+        latencies.append(time.perf_counter() - start)
+
+        if target is not None and value == f"answer {target}":
+            paraphrase_hits += 1
+        elif target is None and value is not None:
+            false_hits += 1
+
+    latencies_ms = 1000 * np.array(latencies)
+    stats = cache.stats()
+    print(
+        f"{size:>8} | {stats['hit_rate']:>8.2%} | {paraphrase_hits / (queries / 2):>15.2%} | "
+        f"{false_hits:>10} | {np.percentile(latencies_ms, 50):>8.3f} | "
+        f"{np.percentile(latencies_ms, 99):>8.3f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=384, help="embedding size (all-minilm: 384)")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--paraphrase-similarity", type=float, default=0.97)
+    parser.add_argument("--seed", type=int, default=1729)
+    args = parser.parse_args()
+
+    print(f"dim={args.dim}, threshold={args.threshold}, {args.queries} queries (50% paraphrases)")
+    print(
+        f"{'entries':>8} | {'hit rate':>8} | {'paraphrase hits':>15} | "
+        f"{'false hits':>10} | {'p50 ms':>8} | {'p99 ms':>8}"
+    )
+    for size in args.sizes:
+        run(size, args.dim, args.queries, args.threshold, args.paraphrase_similarity, args.seed)
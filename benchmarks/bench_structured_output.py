@@ -0,0 +1,107 @@
+"""Parse + validate throughput of structured outputs, for nested schemas.
+
+Compares the former path (``ast.literal_eval`` then ``schema(**dict)``) with ``json.loads`` then
+``schema.model_validate`` and with ``parse_structured_output`` (pydantic's JSON parser,
+validation in the same pass). Also times the ``response_format`` json schema generation, with
+and without memoization.
+
+Usage:
+    uv run --project backend python benchmarks/bench_structured_output.py --garments 1 10 100
+"""
+
+import argparse
+import ast
+import json
+import timeit
+from typing import Optional
+
+from litellm.utils import type_to_response_format_param
+from pydantic import BaseModel
+
+from genai_template_backend.api.structured_output import parse_structured_output, response_format
+
+
+class Color(BaseModel):
+    name: str
+    hex: str
+
+
+class Garment(BaseModel):
+    name: str
+    category: str
+    price: float
+    colors: list[Color]
+    sizes: list[str]
+    # true / null JSON literals: not python literals
+    in_stock: bool
+    discount: Optional[float]
+
+
+class Outfit(BaseModel):
+    title: str
+    occasion: str
+    garments: list[Garment]
+    tags: list[str]
+
+
+def outfit_json(garments: int) -> str:
+    garment = {
+        "name": "linen shirt",
+        "category": "top",
+        "price": 49.9,
+        "colors": [{"name": "white", "hex": "#ffffff"}, {"name": "sand", "hex": "#c2b280"}],
+        "sizes": ["S", "M", "L"],
+        "in_stock": True,
+        "discount": None,
+    }
+    return json.dumps(
+        {
+            "title": "Summer wedding",
+            "occasion": "wedding",
+            "garments": [garment] * garments,
+            "tags": ["summer", "light", "elegant"],
+        }
+    )
+
+
+def literal_eval_parse(content: str) -> Outfit:
+    # the former path: python literals only, JSON true/false/null are not accepted
+    python_literal = content.replace("true", "True").replace("false", "False")
+    return Outfit(**ast.literal_eval(python_literal.replace("null", "None")))
+
+
+def json_loads_parse(content: str) -> Outfit:
+    return Outfit.model_validate(json.loads(content))
+
+
+def run(garments: int, repeat: int):
+    content = outfit_json(garments)
+    assert literal_eval_parse(content) == parse_structured_output(Outfit, content)
+    for name, parse in [
+        ("ast.literal_eval", literal_eval_parse),
+        ("json.loads", json_loads_parse),
+        ("model_validate_json", lambda c: parse_structured_output(Outfit, c)),
+    ]:
+        seconds = min(timeit.repeat(lambda: parse(content), number=repeat, repeat=3)) / repeat
+        print(
+            f"{garments:>8} | {len(content):>8} | {name:>20} | {1e6 * seconds:>10.1f} | "
+            f"{1 / seconds:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--garments", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'garments':>8} | {'bytes':>8} | {'parser':>20} | {'us/parse':>10} | {'parses/s':>10}")
+    for garments in args.garments:
+        run(garments, max(args.repeat // garments, 10))
+
+    uncached = min(timeit.repeat(lambda: type_to_response_format_param(Outfit), number=100)) / 100
+    cached = min(timeit.repeat(lambda: response_format(Outfit), number=100)) / 100
+    print(
+        f"response_format json schema: {1e6 * uncached:.1f}us generated, "
+        f"{1e6 * cached:.2f}us memoized"
+    )
@@ -0,0 +1,84 @@
+"""Recall@k and latency of the IVF index against exact search, on synthetic vectors.
+
+Vectors are drawn around random cluster centers, as catalog embeddings are, and the queries are
+perturbed catalog vectors. The ground truth is the exact top-k of ``FlatIndex``.
+
+Usage:
+    uv run --project backend python benchmarks/bench_vector_index.py --size 1000000 --dim 128
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from genai_template_backend.api.vector_index import FlatIndex, IVFIndex
+
+
+def synthetic_vectors(size: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, 100_000):  # bounded temporary memory
+        end = min(size, start + 100_000)
+        vectors[start:end] = centers[rng.integers(clusters, size=end - start)]
+        vectors[start:end] += rng.standard_normal((end - start, dim), dtype=np.float32)
+    return vectors
+
+
+def timed_search(index, queries: np.ndarray, k: int) -> tuple[list[np.ndarray], np.ndarray]:
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query, k)[0])
+        latencies.append(time.perf_counter() - start)
+    return results, 1000 * np.array(latencies)
+
+
+def report(name: str, recall: float, latencies_ms: np.ndarray):
+    print(
+        f"{name:>14} | {recall:>9.2%} | {np.percentile(latencies_ms, 50):>8.3f} | "
+        f"{np.percentile(latencies_ms, 99):>8.3f} | {1000 / latencies_ms.mean():>8.0f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=128, help="1M x 384d vectors need ~1.5GB")
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=1024)
+    parser.add_argument("--n-probes", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--seed", type=int, default=1729)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = synthetic_vectors(args.size, args.dim, args.clusters, rng)
+    ids = np.arange(args.size)
+    queries = vectors[rng.integers(args.size, size=args.queries)]
+    queries = queries + 0.2 * rng.standard_normal(queries.shape, dtype=np.float32)
+
+    start = time.perf_counter()
+    flat = FlatIndex()
+    flat.add(ids, vectors)
+    print(f"flat index built in {time.perf_counter() - start:.1f}s")
+    ground_truth, flat_latencies = timed_search(flat, queries, args.k)
+    del flat
+
+    start = time.perf_counter()
+    ivf = IVFIndex(n_lists=args.n_lists)
+    ivf.add(ids, vectors)
+    del vectors
+    print(f"ivf index built (k-means + assignment) in {time.perf_counter() - start:.1f}s")
+
+    print(f"{args.size} vectors, dim={args.dim}, {args.queries} queries, recall@{args.k}")
+    print(f"{'index':>14} | {'recall':>9} | {'p50 ms':>8} | {'p99 ms':>8} | {'qps':>8}")
+    report("flat", 1.0, flat_latencies)
+    for n_probe in args.n_probes:
+        ivf.n_probe = n_probe
+        results, latencies = timed_search(ivf, queries, args.k)
+        recall = np.mean(
+            [len(np.intersect1d(r, t)) / args.k for r, t in zip(results, ground_truth)]
+        )
+        report(f"ivf n_probe={n_probe}", recall, latencies)
@@ -0,0 +1,203 @@
+"""Local OpenAI-compatible stub of the LLM provider, for the load benchmarks.
+
+Serves ``/v1/chat/completions`` (plain and streamed) and ``/v1/embeddings`` with a configurable
+latency, generation speed and error / rate limit rates, so the app can be load tested without a
+provider and without its latency varying from one run to the next. Point ``INFERENCE_BASE_URL``
+(and ``EMBEDDINGS_BASE_URL``) at ``http://<host>:<port>/v1`` with an ``openai/`` model name.
+
+Usage:
+    uv run --project backend python benchmarks/stub_llm_server.py --port 8011 --latency 0.1
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class StubConfig:
+    """Behaviour of the stub.
+
+    Attributes:
+        latency: seconds before the first token (or before the embeddings).
+        token_rate: completion tokens generated per second after the first one, 0 for instant.
+        completion_tokens: tokens of each completion.
+        error_rate: share of the requests answered with a 500.
+        rate_limit_rate: share of the requests answered with a 429 and a ``Retry-After``.
+        retry_after: seconds sent in the ``Retry-After`` header of the 429s.
+        embedding_dim: dimension of the (deterministic, per text) embeddings.
+    """
+
+    latency: float = 0.1
+    token_rate: float = 500.0
+    completion_tokens: int = 32
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    embedding_dim: int = 256
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def error_response(config: StubConfig):
+    """Returns the injected 429 / 500 of this request, if any."""
+    draw = random.random()
+    if draw < config.rate_limit_rate:
+        return JSONResponse(
+            {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+            status_code=429,
+            headers={"Retry-After": str(config.retry_after)},
+        )
+    if draw < config.rate_limit_rate + config.error_rate:
+        return JSONResponse(
+            {"error": {"message": "Injected failure", "type": "server_error"}}, status_code=500
+        )
+    return None
+
+
+def embed(text: str, dim: int) -> np.ndarray:
+    rng = np.random.default_rng(zlib.crc32(text.encode()))
+    vector = rng.standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI()
+    stats = {"completions": 0, "streams": 0, "embeddings": 0, "errors": 0}
+
+    @app.get("/health")
+    async def health():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        failure = error_response(config)
+        if failure is not None:
+            stats["errors"] += 1
+            return failure
+
+        prompt_tokens = sum(count_tokens(str(m.get("content", ""))) for m in body["messages"])
+        words = [f"word{i} " for i in range(config.completion_tokens)]
+        token_delay = 1 / config.token_rate if config.token_rate > 0 else 0.0
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+        }
+        header = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body["model"]}
+
+        if not body.get("stream"):
+            stats["completions"] += 1
+            await asyncio.sleep(config.latency + token_delay * (len(words) - 1))
+            return {
+                **header,
+                "object": "chat.completion",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(words)},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+
+        stats["streams"] += 1
+
+        def chunk(delta: dict, finish_reason=None, **extra) -> str:
+            choice = {"index": 0, "delta": delta, "finish_reason": finish_reason}
+            payload = {**header, "object": "chat.completion.chunk", "choices": [choice], **extra}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            await asyncio.sleep(config.latency)
+            yield chunk({"role": "assistant", "content": ""})
+            for i, word in enumerate(words):
+                if i and token_delay:
+                    await asyncio.sleep(token_delay)
+                yield chunk({"content": word})
+            yield chunk({}, "stop", usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        failure = error_response(config)
+        if failure is not None:
+            stats["errors"] += 1
+            return failure
+
+        stats["embeddings"] += 1
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(config.latency)
+        vectors = [embed(str(text), config.embedding_dim) for text in texts]
+        # the openai SDK asks for base64 unless an encoding_format is set
+        if body.get("encoding_format") == "base64":
+            encoded = [base64.b64encode(vector.tobytes()).decode() for vector in vectors]
+        else:
+            encoded = [vector.tolist() for vector in vectors]
+        prompt_tokens = sum(count_tokens(str(text)) for text in texts)
+        return {
+            "object": "list",
+            "model": body["model"],
+            "data": [
+                {"object": "embedding", "index": i, "embedding": vector}
+                for i, vector in enumerate(encoded)
+            ],
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    return app
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    """Adds one ``--option`` per ``StubConfig`` field, shared with the load benchmark."""
+    defaults = StubConfig()
+    parser.add_argument("--latency", type=float, default=defaults.latency)
+    parser.add_argument("--token-rate", type=float, default=defaults.token_rate)
+    parser.add_argument("--completion-tokens", type=int, default=defaults.completion_tokens)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate)
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after)
+    parser.add_argument("--embedding-dim", type=int, default=defaults.embedding_dim)
+
+
+def stub_config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        latency=args.latency,
+        token_rate=args.token_rate,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        embedding_dim=args.embedding_dim,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8011)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(stub_config_from_args(args)),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
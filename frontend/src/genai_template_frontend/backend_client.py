@@ -0,0 +1,92 @@
+"""Async http client to the backend, shared by all the browser sessions of the process."""
+
+from http.cookiejar import DefaultCookiePolicy
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from genai_template_frontend.utils import Settings, aiter_sse_events, logger, settings
+
+
+class BackendSession:
+    """Backend session cookie of one ``Chat``, the backend keeps its conversation under it."""
+
+    def __init__(self, cookie_name: str):
+        self.cookie_name = cookie_name
+        self.cookie: Optional[str] = None
+
+    def headers(self) -> dict:
+        return {"Cookie": f"{self.cookie_name}={self.cookie}"} if self.cookie else {}
+
+    def update(self, response: httpx.Response):
+        cookie = response.cookies.get(self.cookie_name)
+        if cookie:
+            self.cookie = cookie
+
+
+class BackendClient:
+    """Pooled keep-alive client to the backend.
+
+    A single instance is opened at app startup and closed at shutdown, so every ``Chat`` reuses
+    the same connections instead of opening a new one per message. Connection failures are
+    retried by the transport, the request itself is never replayed.
+
+    The client is shared by all the browser sessions, so it never stores cookies: each ``Chat``
+    sends its own ``BackendSession``.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self.start()
+        return self._client
+
+    def start(self):
+        limits = httpx.Limits(
+            max_connections=self.settings.BACKEND_MAX_CONNECTIONS,
+            max_keepalive_connections=self.settings.BACKEND_MAX_KEEPALIVE_CONNECTIONS,
+        )
+        self._client = httpx.AsyncClient(
+            base_url=self.settings.BACKEND_URL,
+            timeout=httpx.Timeout(
+                timeout=self.settings.BACKEND_TIMEOUT, connect=self.settings.BACKEND_CONNECT_TIMEOUT
+            ),
+            limits=limits,
+            transport=httpx.AsyncHTTPTransport(
+                retries=self.settings.BACKEND_RETRIES, limits=limits
+            ),
+        )
+        self._client.cookies.jar.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        logger.info(f"Backend client ready: {self.settings.BACKEND_URL}")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def new_session(self) -> BackendSession:
+        return BackendSession(self.settings.BACKEND_SESSION_COOKIE)
+
+    async def stream_chat(
+        self, message: str, session: Optional[BackendSession] = None
+    ) -> AsyncIterator[tuple[str, dict]]:
+        """Sends ``message`` to ``/api/chat/stream`` and yields the ``(event, data)`` SSE events.
+
+        Only the new message is sent, the backend adds the history of the ``session``.
+        """
+        headers = session.headers() if session is not None else {}
+        async with self.client.stream(
+            "POST", "/api/chat/stream", json={"message": message}, headers=headers
+        ) as res:
+            res.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+            if session is not None:
+                session.update(res)
+            async for event in aiter_sse_events(res.aiter_lines()):
+                yield event
+
+
+backend_client = BackendClient(settings)
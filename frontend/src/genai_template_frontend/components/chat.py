@@ -1,18 +1,101 @@
-import asyncio
 import datetime
+import time
+from collections import deque
+from typing import Optional
 
-import requests
+import httpx
 from nicegui import ui
+from nicegui.events import ScrollEventArguments
 
-from genai_template_frontend.utils import settings, logger
+from genai_template_frontend.backend_client import backend_client
+from genai_template_frontend.utils import logger, settings
+
+USER_AVATAR = "https://robohash.org/user?set=set2"
+BOT_AVATAR = "https://robohash.org/bot?set=set2"
 
 
 class Chat:
-    def __init__(self):
+    """Chat panel rendering the messages incrementally.
+
+    A new message creates its own element only, the mounted ones are never rebuilt. Past
+    ``mounted_messages`` the oldest elements are removed from the page (the messages stay in
+    ``self.messages``) and mounted back ``page_size`` at a time when the user scrolls to the top.
+    A reply still being streamed is never unmounted, the window waits for it to complete.
+    """
+
+    def __init__(self, mounted_messages: Optional[int] = None, page_size: Optional[int] = None):
         self.messages = []
+        self.mounted_messages = mounted_messages or settings.CHAT_MOUNTED_MESSAGES
+        self.page_size = page_size or settings.CHAT_HISTORY_PAGE_SIZE
+        # the backend keeps the conversation history under this session
+        self.backend_session = backend_client.new_session()
         self.text_input = None
         self.scroll_area = None
-        self._render_chat_messages_fn = None  # To hold the refreshable function instance
+        self.messages_container = None
+        self._placeholder = None  # Shown until the first message
+        self._older_button = None  # Shown while older messages are unmounted
+        # elements of the mounted messages, which are self.messages[self._first_mounted:]
+        self._mounted: deque[ui.chat_message] = deque()
+        self._first_mounted = 0
+        # ids of the messages whose reply is being streamed into their element
+        self._streaming: set[int] = set()
+
+    def _render_message(self, message: dict) -> tuple[ui.chat_message, ui.html]:
+        sent = message["role"] == "user"
+        with ui.chat_message(
+            sent=sent, stamp=message["timestamp"], avatar=USER_AVATAR if sent else BOT_AVATAR
+        ) as element:
+            content = ui.html(message["text"])
+        return element, content
+
+    def add_message(self, role: str, text: str = "") -> tuple[dict, ui.html]:
+        """Appends a message to the page, returns it and its content element."""
+        message = {
+            "role": role,
+            "text": text,
+            "timestamp": datetime.datetime.now().strftime("%H:%M"),
+        }
+        self.messages.append(message)
+        if self._placeholder is not None:
+            self._placeholder.delete()
+            self._placeholder = None
+        with self.messages_container:
+            element, content = self._render_message(message)
+        self._mounted.append(element)
+        self._unmount_oldest()
+        return message, content
+
+    def _unmount_oldest(self):
+        """Unmounts the oldest messages past ``mounted_messages``, up to a streamed reply."""
+        while (
+            len(self._mounted) > self.mounted_messages
+            and id(self.messages[self._first_mounted]) not in self._streaming
+        ):
+            self._mounted.popleft().delete()
+            self._first_mounted += 1
+        self._older_button.set_visibility(self._first_mounted > 0)
+
+    def load_older(self) -> int:
+        """Mounts back the previous page of messages at the top, returns how many."""
+        start = max(self._first_mounted - self.page_size, 0)
+        older = []
+        with self.messages_container:
+            for index, message in enumerate(self.messages[start : self._first_mounted]):
+                element, _ = self._render_message(message)
+                element.move(target_index=index)
+                older.append(element)
+        self._mounted.extendleft(reversed(older))
+        self._first_mounted = start
+        self._older_button.set_visibility(self._first_mounted > 0)
+        return len(older)
+
+    def _on_scroll(self, e: ScrollEventArguments):
+        if e.vertical_position > 0 or self._first_mounted == 0:
+            return
+        mounted = len(self._mounted)
+        loaded = self.load_older()
+        # keep the message on screen where it was, assuming messages of the average height
+        self.scroll_area.scroll_to(pixels=e.vertical_size / mounted * loaded)
 
     async def _send_message_and_reply(self):
         user_text = self.text_input.value.strip()
@@ -20,48 +103,60 @@ class Chat:
             ui.notify("Message cannot be empty!", type="warning")
             return
 
-        self.messages.append(
-            {
-                "role": "user",
-                "text": user_text,
-                "timestamp": datetime.datetime.now().strftime("%H:%M"),
-            }
-        )
+        self.add_message("user", user_text)
         self.text_input.value = ""
-        self._render_chat_messages_fn.refresh()
+        bot_message, bot_element = self.add_message("bot")
+        self._streaming.add(id(bot_message))
 
-        await asyncio.sleep(0.5)  # Simulate bot thinking
+        start_time = time.perf_counter()
+        ttft, server_timings = None, {}
         try:
-            response = requests.post(
-                f"{settings.BACKEND_URL}/api/chat", json={"message": user_text}
-            )
-            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-            bot_reply_text = response.json().get("response", "Sorry, I could not get a response.")
-        except requests.exceptions.RequestException as e:
+            async for event, data in backend_client.stream_chat(user_text, self.backend_session):
+                if event == "done":
+                    server_timings = data
+                elif event == "error":
+                    logger.error(f"Backend failed to stream the reply: {data}")
+                else:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start_time
+                    bot_message["text"] += data["delta"]
+                    bot_element.set_content(bot_message["text"])
+        except httpx.HTTPError as e:
             logger.error(f"Could not connect to backend: {e}")
-            bot_reply_text = "Error: Could not connect to the backend."
-
-        bot_timestamp = datetime.datetime.now().strftime("%H:%M")
-        self.messages.append(
-            {
-                "role": "bot",
-                "text": bot_reply_text,
-                "timestamp": bot_timestamp,
-            }
+            bot_message["text"] = "Error: Could not connect to the backend."
+        finally:
+            self._streaming.discard(id(bot_message))
+
+        if not bot_message["text"]:
+            bot_message["text"] = "Sorry, I could not get a response."
+        logger.info(
+            f"Bot reply: time to first token {ttft}s, total {time.perf_counter() - start_time}s "
+            f"(backend: {server_timings})"
         )
-        self._render_chat_messages_fn.refresh()
+        bot_element.set_content(bot_message["text"])
+        # the messages sent meanwhile may have grown the window past mounted_messages
+        self._unmount_oldest()
 
     def build(self):
         with ui.column().classes("w-full max-w-2xl mx-auto"):
             # Chat interface container (card)
             with ui.card().classes("w-full max-w-lg shadow-lg rounded-borders"):
                 # Messages area (scroll_area)
-                self.scroll_area = ui.scroll_area().classes(
+                self.scroll_area = ui.scroll_area(on_scroll=self._on_scroll).classes(
                     "flex-grow h-96 p-4 border rounded-borders bg-grey-1 q-mb-md"
                 )
                 with self.scroll_area:
-                    # This column will be populated by the refreshable function
-                    messages_ui_container = ui.column().classes("w-full items-stretch space-y-2")
+                    self._older_button = (
+                        ui.button("Show older messages", on_click=self.load_older)
+                        .props("flat dense no-caps size=sm")
+                        .classes("self-center")
+                    )
+                    self._older_button.set_visibility(False)
+                    self._placeholder = ui.label("No messages yet. Say something!").classes(
+                        "text-center text-grey-6 q-pa-md"
+                    )
+                    # Filled by add_message, one element per message
+                    self.messages_container = ui.column().classes("w-full items-stretch space-y-2")
 
                 # Input area (row with input and button)
                 with ui.row().classes("w-full items-center q-px-sm q-pb-sm"):
@@ -74,25 +169,3 @@ class Chat:
                     ui.button(icon="send", on_click=self._send_message_and_reply).props(
                         "flat round dense color=primary"
                     )
-
-                # Define the refreshable function for rendering messages
-                @ui.refreshable
-                def render_chat_messages_impl():
-                    messages_ui_container.clear()
-                    with messages_ui_container:
-                        if not self.messages:
-                            ui.label("No messages yet. Say something!").classes(
-                                "text-center text-grey-6 q-pa-md"
-                            )
-                        for msg_data in self.messages:
-                            with ui.chat_message(
-                                sent=msg_data["role"] == "user",
-                                stamp=msg_data["timestamp"],
-                                avatar="https://robohash.org/user?set=set2"
-                                if msg_data["role"] == "user"
-                                else "https://robohash.org/bot?set=set2",
-                            ):
-                                ui.html(msg_data["text"])
-
-                self._render_chat_messages_fn = render_chat_messages_impl  # Store the function
-                self._render_chat_messages_fn()  # Initial render
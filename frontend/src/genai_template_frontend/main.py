@@ -3,8 +3,12 @@
 from nicegui import ui, app
 from starlette.responses import FileResponse, PlainTextResponse
 
+from genai_template_frontend.backend_client import backend_client
 from genai_template_frontend.components.chat import Chat
 
+app.on_startup(backend_client.start)
+app.on_shutdown(backend_client.close)
+
 
 @app.get("/favicon.ico")
 async def favicon():
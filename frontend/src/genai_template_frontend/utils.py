@@ -1,10 +1,12 @@
 """Utility functions for the JYM application."""
 
+import json
 import os
 import pathlib
 from nicegui import app
 import sys
 import timeit
+from typing import AsyncIterator
 from loguru import logger as loguru_logger
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -29,10 +31,26 @@ class BaseEnvironmentVariables(BaseSettings):
 
 class APIEnvironmentVariables(BaseEnvironmentVariables):
     BACKEND_URL: str = "http://localhost:8000"
+    # shared http client used by every chat session to call the backend
+    BACKEND_MAX_CONNECTIONS: int = 100
+    BACKEND_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    BACKEND_TIMEOUT: float = 120.0
+    BACKEND_CONNECT_TIMEOUT: float = 5.0
+    BACKEND_RETRIES: int = 3
+    # cookie of the backend session, the backend keeps the conversation of each chat under it
+    BACKEND_SESSION_COOKIE: str = "jym_session"
+
+
+class ChatEnvironmentVariables(BaseEnvironmentVariables):
+    # messages kept mounted in the page, the older ones are mounted again on scrolling up,
+    # CHAT_HISTORY_PAGE_SIZE at a time
+    CHAT_MOUNTED_MESSAGES: int = 50
+    CHAT_HISTORY_PAGE_SIZE: int = 20
 
 
 class Settings(
     APIEnvironmentVariables,
+    ChatEnvironmentVariables,
 ):
     """Settings class for the application.
 
@@ -85,4 +103,23 @@ def time_function(func):
     return wrapper
 
 
+async def aiter_sse_events(lines: AsyncIterator[str]) -> AsyncIterator[tuple[str, dict]]:
+    """Parses a Server-Sent Events stream into ``(event, data)`` tuples.
+
+    Events without an ``event:`` field are yielded as ``"message"``, ``data`` is decoded as json.
+    """
+    event, data_lines = "message", []
+    async for line in lines:
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:") :].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:") :].strip())
+    if data_lines:
+        yield event, json.loads("\n".join(data_lines))
+
+
 settings, logger = initialize()
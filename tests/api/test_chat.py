@@ -27,3 +27,239 @@ def test_post_chat_message_integration(client):
     # Check that the response is not empty and not an error message
     assert len(response_data["response"]) > 0
     assert not response_data["response"].lower().startswith("error")
+
+
+def test_post_chat_message_uses_shared_async_client(monkeypatch):
+    """The route must reuse the client built in lifespan and go through the async path."""
+    import litellm
+
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, **kwargs):
+        return await original_acompletion(*args, mock_response="Hi human!", **kwargs)
+
+    def fail_completion(*args, **kwargs):
+        raise AssertionError("the chat route must not call the blocking completion")
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    monkeypatch.setattr(litellm, "completion", fail_completion)
+
+    with TestClient(app) as client:
+        shared_llm = app.state.inference_llm
+        assert litellm.aclient_session is not None
+
+        for _ in range(2):
+            response = client.post("/api/chat", json={"message": "Hello"})
+            assert response.status_code == 200
+            assert response.json()["response"] == "Hi human!"
+        assert app.state.inference_llm is shared_llm
+
+    assert litellm.aclient_session is None
+
+
+def test_post_chat_message_maps_provider_throttling_to_429(monkeypatch):
+    """Once the retries are exhausted, the provider 429 is passed on to the client."""
+    import httpx
+    import litellm
+    from tenacity import wait_none
+
+    from genai_template_backend.api.llm import InferenceLLMConfig
+
+    async def throttled_acompletion(*args, **kwargs):
+        raise litellm.exceptions.RateLimitError(
+            "slow down",
+            "ollama",
+            "qwen3:0.6b",
+            response=httpx.Response(429, headers={"retry-after": "2"}),
+        )
+
+    monkeypatch.setattr(litellm, "acompletion", throttled_acompletion)
+    # the retries don't wait for the Retry-After
+    retrying = InferenceLLMConfig._a_generate_from_messages.retry
+    monkeypatch.setattr(retrying, "wait", wait_none())
+
+    with TestClient(app) as client:
+        response = client.post("/api/chat", json={"message": "Hello"})
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "2"
+    assert "rate limited" in response.json()["detail"]
+
+
+def test_post_chat_message_stream(monkeypatch):
+    """The stream route sends the deltas as SSE and ends with a done event holding the timings."""
+    import json
+
+    import litellm
+
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, **kwargs):
+        return await original_acompletion(*args, mock_response="Hi human!", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+
+    with TestClient(app) as client:
+        response = client.post("/api/chat/stream", json={"message": "Hello"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.splitlines() for block in response.text.strip().split("\n\n")]
+    deltas = [json.loads(lines[0][len("data: ") :])["delta"] for lines in events[:-1]]
+    assert "".join(deltas) == "Hi human!"
+    assert events[-1][0] == "event: done"
+    timings = json.loads(events[-1][1][len("data: ") :])
+    assert 0 <= timings["ttft"] <= timings["total"]
+
+
+def test_post_chat_batch(monkeypatch):
+    """Items come back in order with their own errors, the fan-out is capped per batch."""
+    import asyncio
+    import json
+
+    import litellm
+
+    from genai_template_backend.env_settings import settings
+
+    original_acompletion = litellm.acompletion
+    in_flight, max_in_flight = 0, 0
+
+    async def fake_acompletion(*args, messages, **kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            content = messages[-1]["content"]
+            if content == "fail":
+                raise litellm.exceptions.BadRequestError("bad prompt", "model", "provider")
+            return await original_acompletion(
+                *args, messages=messages, mock_response=content.upper(), **kwargs
+            )
+        finally:
+            in_flight -= 1
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    monkeypatch.setattr(settings, "LLM_BATCH_MAX_CONCURRENCY", 2)
+    messages = ["a", "fail", "c", "d", "e"]
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/chat/batch", json={"requests": [{"message": m} for m in messages]}
+        )
+        results = response.json()["results"]
+        assert [item["response"] for item in results] == ["A", None, "C", "D", "E"]
+        assert "bad prompt" in results[1]["error"]
+        assert max_in_flight == 2
+
+        response = client.post(
+            "/api/chat/batch",
+            json={"requests": [{"message": m} for m in messages], "stream": True},
+        )
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        items = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(item["index"] for item in items) == list(range(len(messages)))
+
+
+def test_chat_keeps_the_conversation_of_the_session(monkeypatch):
+    """The backend adds the history of the session cookie, each session has its own."""
+    import litellm
+
+    original_acompletion = litellm.acompletion
+    prompts = []
+
+    async def fake_acompletion(*args, messages, **kwargs):
+        prompts.append([m["content"] for m in messages])
+        return await original_acompletion(
+            *args, messages=messages, mock_response=f"answer {len(prompts)}", **kwargs
+        )
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+
+    with TestClient(app) as client, TestClient(app) as other_client:
+        client.post("/api/chat", json={"message": "I like linen"})
+        client.post("/api/chat/stream", json={"message": "Any shirt?"})
+        other_client.post("/api/chat", json={"message": "Hello"})
+
+        assert prompts[1] == ["I like linen", "answer 1", "Any shirt?"]
+        assert prompts[2] == ["Hello"]
+        history = client.get("/api/chat/history").json()
+        assert [m["content"] for m in history["messages"]] == [
+            "I like linen",
+            "answer 1",
+            "Any shirt?",
+            "answer 2",
+        ]
+
+        client.delete("/api/chat/history")
+        assert client.get("/api/chat/history").json()["messages"] == []
+
+
+def test_stream_saves_the_turn_before_the_done_event(monkeypatch):
+    """A client sending its next message as soon as ``done`` arrives sees the previous turn."""
+    import asyncio
+
+    import litellm
+    from starlette.requests import Request
+
+    from genai_template_backend.api.conversations import ConversationStore
+    from genai_template_backend.api.llm import InferenceLLMConfig
+    from genai_template_backend.api.routes.chat import ChatRequest, post_chat_message_stream
+
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, **kwargs):
+        return await original_acompletion(*args, mock_response="Hi human!", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    llm = InferenceLLMConfig(
+        model_name="ollama/qwen3:0.6b", base_url="http://localhost:11434", api_key="t"
+    )
+    conversations = ConversationStore()
+    http_request = Request({"type": "http", "session": {}})
+
+    async def main():
+        response = await post_chat_message_stream(
+            ChatRequest(message="Hello"), http_request, llm, conversations
+        )
+        async for event in response.body_iterator:
+            if event.startswith("event: done"):
+                conversation_id = http_request.session["conversation_id"]
+                return (await conversations.aget(conversation_id)).messages
+
+    messages = asyncio.run(main())
+    assert [m["content"] for m in messages] == ["Hello", "Hi human!"]
+
+
+def test_batch_schema_accepts_nullable_types():
+    from genai_template_backend.api.routes.chat import json_schema_to_model
+
+    model = json_schema_to_model(
+        {
+            "type": "object",
+            "properties": {
+                "color": {"type": ["string", "null"]},
+                "sizes": {"type": "array", "items": {"type": ["integer", "string"]}},
+            },
+            "required": ["color", "sizes"],
+        }
+    )
+    item = model(color=None, sizes=[38, "M"])
+    assert item.color is None and item.sizes == [38, "M"]
+    assert model(color="red", sizes=[]).color == "red"
+
+
+def test_batch_item_errors_unwrap_retry_errors():
+    from tenacity import retry, stop_after_attempt
+
+    from genai_template_backend.api.routes.chat import unwrap_retry_error
+
+    @retry(stop=stop_after_attempt(2))
+    def always_fails():
+        raise TimeoutError("provider timed out")
+
+    try:
+        always_fails()
+    except Exception as e:
+        error = unwrap_retry_error(e)
+    assert isinstance(error, TimeoutError) and str(error) == "provider timed out"
@@ -0,0 +1,57 @@
+import io
+
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from genai_template_backend.api.image_pipeline import ImagePipeline
+from genai_template_backend.app import app
+
+
+def jpeg_bytes(size=(40, 20), orientation=None) -> bytes:
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    Image.new("RGB", size, (0, 128, 255)).save(buffer, format="JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+def test_upload_images(tmp_path):
+    with TestClient(app) as client:
+        pipeline = ImagePipeline(str(tmp_path), width=24, height=32, max_workers=1)
+        app.state.image_pipeline = pipeline
+        response = client.post(
+            "/api/images",
+            files=[
+                ("person", ("person.jpg", jpeg_bytes(orientation=6), "image/jpeg")),
+                ("garment", ("garment.jpg", jpeg_bytes(), "image/jpeg")),
+            ],
+            data={"note": "ignored"},
+        )
+        assert response.status_code == 200
+        person, garment = response.json()["images"]
+        assert person["filename"] == "person.jpg"
+        assert (person["original_width"], person["original_height"]) == (20, 40)
+        assert (garment["width"], garment["height"]) == (24, 32)
+        assert pipeline.get(garment["id"]).shape == (3, 32, 24)
+        assert (tmp_path / person["id"]).read_bytes() == jpeg_bytes(orientation=6)
+
+        response = client.post(
+            "/api/images", files={"file": ("notes.txt", b"not an image", "text/plain")}
+        )
+        assert response.status_code == 422
+        # the rejected upload is deleted
+        assert len(list(tmp_path.iterdir())) == 2
+        assert client.post("/api/images", json={"image": "x"}).status_code == 415
+
+
+def test_upload_images_saturated_pool(tmp_path):
+    with TestClient(app) as client:
+        pipeline = ImagePipeline(str(tmp_path), max_workers=1, max_pending=1, queue_timeout=0.01)
+        app.state.image_pipeline = pipeline
+        # the only slot is held by another upload
+        client.portal.call(pipeline.acquire)
+        response = client.post("/api/images", files={"file": ("a.jpg", jpeg_bytes(), "image/jpeg")})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from genai_template_backend.api.routes.search import SearchRequest, search_similar_items
+from genai_template_backend.api.vector_index import FlatIndex
+from genai_template_backend.app import app
+
+
+def test_search_similar_items():
+    """Items are indexed by vector, then searched by item id, excluding the item itself."""
+    with TestClient(app) as client:
+        app.state.vector_index = FlatIndex()
+        response = client.post(
+            "/api/search/items",
+            json={
+                "items": [
+                    {"id": 1, "vector": [1.0, 0.0, 0.0]},
+                    {"id": 2, "vector": [0.9, 0.1, 0.0]},
+                    {"id": 3, "vector": [0.0, 0.0, 1.0]},
+                ]
+            },
+        )
+        assert response.json() == {"indexed": 3}
+
+        response = client.post("/api/search", json={"item_id": 1, "k": 2})
+        assert [result["id"] for result in response.json()["results"]] == [2, 3]
+
+        assert client.delete("/api/search/items/2").json() == {"deleted": 1}
+        assert client.delete("/api/search/items/2").status_code == 404
+        assert client.post("/api/search", json={"item_id": 2}).status_code == 404
+        assert client.post("/api/search", json={"k": 2}).status_code == 422
+        response = client.post("/api/search/items", json={"items": []})
+        assert response.status_code == 422
+        assert "at least 1 item" in response.text
+
+
+def test_search_waits_for_a_write_off_the_event_loop():
+    index = FlatIndex()
+    index.add([1, 2], [[1.0, 0.0], [0.9, 0.1]])
+    locked, release = threading.Event(), threading.Event()
+
+    def write():
+        with index._lock.write():
+            locked.set()
+            release.wait(5)
+
+    threading.Thread(target=write).start()
+    locked.wait(5)
+
+    async def main():
+        request = SearchRequest(item_id=1, k=1)
+        search = asyncio.create_task(search_similar_items(request, index, None))
+        # the loop keeps running while the search waits for the lock
+        start = time.perf_counter()
+        await asyncio.sleep(0.05)
+        assert time.perf_counter() - start < 1
+        assert not search.done()
+        release.set()
+        return await search
+
+    assert [result.id for result in asyncio.run(main()).results] == [2]
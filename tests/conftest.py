@@ -0,0 +1,28 @@
+import pytest
+from litellm.types.utils import Embedding, EmbeddingResponse
+
+from genai_template_backend.api import llm as llm_module
+
+
+def fake_vector(text: str) -> list[float]:
+    """Deterministic 3 dimensions embedding of ``text``."""
+    return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+
+@pytest.fixture
+def mock_aembedding(monkeypatch):
+    """Replaces the provider embedding call, returns the list of inputs of each call."""
+    calls = []
+
+    async def fake_aembedding(*args, input, **kwargs):
+        calls.append(list(input))
+        return EmbeddingResponse(
+            model=kwargs.get("model"),
+            data=[
+                Embedding(embedding=fake_vector(text), index=i, object="embedding")
+                for i, text in enumerate(input)
+            ],
+        )
+
+    monkeypatch.setattr(llm_module, "aembedding", fake_aembedding)
+    return calls
@@ -0,0 +1,72 @@
+import asyncio
+
+import httpx
+import pytest
+
+from genai_template_frontend.backend_client import BackendClient
+from genai_template_frontend.utils import Settings
+
+
+@pytest.fixture
+def requests_seen(monkeypatch):
+    """Replaces the network with a stub backend, returns the requests it received."""
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        cookie = f"session-{len(seen)}"
+        body = 'data: {"delta": "Hi"}\n\nevent: done\ndata: {"total": 0.1}\n\n'
+        return httpx.Response(
+            200,
+            headers={"Set-Cookie": f"jym_session={cookie}; Path=/"},
+            content=body.encode(),
+        )
+
+    monkeypatch.setattr(httpx, "AsyncHTTPTransport", lambda **kwargs: httpx.MockTransport(handler))
+    return seen
+
+
+def test_sessions_share_the_client_but_not_the_cookies(requests_seen):
+    backend = BackendClient(Settings(BACKEND_URL="http://backend"))
+    first, second = backend.new_session(), backend.new_session()
+
+    async def chat(session):
+        return [event async for event in backend.stream_chat("hello", session)]
+
+    async def main():
+        client = backend.client
+        events = await chat(first)
+        await chat(second)
+        await chat(first)
+        assert backend.client is client  # one pooled client for every session
+        await backend.close()
+        return events
+
+    events = asyncio.run(main())
+
+    assert events == [("message", {"delta": "Hi"}), ("done", {"total": 0.1})]
+    assert [str(request.url) for request in requests_seen] == ["http://backend/api/chat/stream"] * 3
+    # the shared client never stores a cookie, each session sends its own
+    assert [request.headers.get("Cookie") for request in requests_seen] == [
+        None,
+        None,
+        "jym_session=session-1",
+    ]
+    assert second.cookie == "session-2"
+    assert backend._client is None
+
+
+def test_errors_of_the_backend_are_raised(monkeypatch):
+    transport = httpx.MockTransport(lambda request: httpx.Response(503))
+    monkeypatch.setattr(httpx, "AsyncHTTPTransport", lambda **kwargs: transport)
+    backend = BackendClient(Settings(BACKEND_URL="http://backend"))
+
+    async def main():
+        try:
+            with pytest.raises(httpx.HTTPStatusError):
+                async for _ in backend.stream_chat("hello"):
+                    pass
+        finally:
+            await backend.close()
+
+    asyncio.run(main())
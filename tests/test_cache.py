@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import litellm
+from pydantic import BaseModel
+
+from genai_template_backend.api.cache import ResponseCache, make_cache_key
+from genai_template_backend.api.llm import InferenceLLMConfig
+
+
+class Person(BaseModel):
+    name: str
+    age: int
+
+
+def test_cache_key_is_stable_and_sensitive():
+    messages = [{"role": "user", "content": "Hello"}]
+    key = make_cache_key("ollama/qwen3:0.6b", messages, temperature=0.0, seed=1)
+    same_messages = [dict(m) for m in messages]
+    assert key == make_cache_key("ollama/qwen3:0.6b", same_messages, temperature=0.0, seed=1)
+    assert key != make_cache_key("ollama/qwen3:0.6b", messages, temperature=0.5, seed=1)
+    assert key != make_cache_key("ollama/qwen3:0.6b", messages, Person, temperature=0.0, seed=1)
+
+
+def test_cache_lru_eviction_and_ttl(monkeypatch):
+    cache = ResponseCache(max_size=2, ttl=10)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # "a" becomes the most recently used
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+
+    monotonic = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: monotonic + 11)
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_disk_tier_survives_restart(tmp_path):
+    # the directory is created, as .cache/ in .env.example
+    path = str(tmp_path / "cache" / "cache.sqlite")
+    cache = ResponseCache(max_size=10, ttl=60, disk_path=path)
+    cache.set("key", Person(name="John", age=30).model_dump_json())
+    cache.close()
+
+    restarted = ResponseCache(max_size=10, ttl=60, disk_path=path)
+    assert Person.model_validate_json(restarted.get("key")) == Person(name="John", age=30)
+    assert restarted.stats()["disk_hits"] == 1
+    restarted.close()
+
+
+def test_inference_llm_serves_repeated_prompts_from_cache(monkeypatch):
+    calls = []
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, **kwargs):
+        calls.append(kwargs["messages"])
+        return await original_acompletion(*args, mock_response="Hi human!", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    llm = InferenceLLMConfig(
+        model_name="ollama/qwen3:0.6b",
+        base_url="http://localhost:11434",
+        api_key="t",
+        cache=ResponseCache(max_size=10, ttl=60),
+    )
+
+    async def ask(content):
+        return await llm.a_generate_from_messages(messages=[{"role": "user", "content": content}])
+
+    async def main():
+        return [await ask("Hello"), await ask("Hello"), await ask("Bye")]
+
+    assert asyncio.run(main()) == ["Hi human!"] * 3
+    assert len(calls) == 2
+    assert llm.cache.stats()["hits"] == 1
+    assert llm.cache.stats()["misses"] == 2
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import litellm
+import pytest
+
+from genai_template_backend.api import llm as llm_module
+from genai_template_backend.api.cassette import Cassette, CassetteMiss
+from genai_template_backend.api.llm import EmbeddingLLMConfig, InferenceLLMConfig
+from tests.conftest import fake_vector
+
+
+def build_llms() -> tuple[InferenceLLMConfig, EmbeddingLLMConfig]:
+    inference_llm = InferenceLLMConfig(
+        model_name="openai/gpt-4o-mini", api_key="key", base_url="http://provider"
+    )
+    embedding_llm = EmbeddingLLMConfig(
+        model_name="openai/text-embedding-3-small",
+        api_key="key",
+        base_url="http://provider",
+        micro_batch=False,
+    )
+    return inference_llm, embedding_llm
+
+
+async def run_calls(inference_llm, embedding_llm) -> tuple:
+    answer = await inference_llm.a_generate_from_messages([{"role": "user", "content": "Hi"}])
+    deltas = [
+        delta
+        async for delta in inference_llm.a_stream_from_messages(
+            [{"role": "user", "content": "Stream"}]
+        )
+    ]
+    vectors = await embedding_llm.a_embed_texts(["a", "bb"])
+    return answer, deltas, vectors
+
+
+def test_record_then_replay(monkeypatch, mock_aembedding, tmp_path):
+    path = str(tmp_path / "llm.cassette")
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return await original_acompletion(*args, mock_response="Hello from the provider", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    cassette = Cassette(path, "record")
+    cassette.install(litellm, llm_module)
+    recorded = asyncio.run(run_calls(*build_llms()))
+    cassette.close()
+    assert len(mock_aembedding) == 1
+
+    async def unreachable(*args, **kwargs):
+        raise AssertionError("replay must not call the provider")
+
+    monkeypatch.setattr(litellm, "acompletion", unreachable)
+    monkeypatch.setattr(llm_module, "aembedding", unreachable)
+    cassette = Cassette(path, "replay")
+    assert len(cassette) == 3
+    cassette.install(litellm, llm_module)
+    try:
+        start = time.perf_counter()
+        replayed = asyncio.run(run_calls(*build_llms()))
+        assert time.perf_counter() - start < 0.05
+        assert replayed == recorded
+        assert recorded[0] == "Hello from the provider"
+        assert recorded[2] == [fake_vector("a"), fake_vector("bb")]
+
+        inference_llm, _ = build_llms()
+        with pytest.raises(CassetteMiss):
+            asyncio.run(
+                inference_llm._a_generate_from_messages([{"role": "user", "content": "New"}])
+            )
+    finally:
+        cassette.close()
+    assert litellm.acompletion is unreachable
+
+
+def test_replay_with_recorded_timing(monkeypatch, tmp_path):
+    path = str(tmp_path / "llm.cassette")
+    original_acompletion = litellm.acompletion
+
+    async def slow_acompletion(*args, **kwargs):
+        await asyncio.sleep(0.2)
+        return await original_acompletion(*args, mock_response="Slow", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", slow_acompletion)
+    messages = [{"role": "user", "content": "Hi"}]
+    with_cassette = Cassette(path, "record")
+    with_cassette.install(litellm)
+    asyncio.run(litellm.acompletion(model="openai/gpt-4o-mini", messages=messages))
+    with_cassette.close()
+
+    replay = Cassette(path, "replay", timing=0.5)
+    replay.install(litellm)
+    try:
+        start = time.perf_counter()
+        res = asyncio.run(litellm.acompletion(model="openai/gpt-4o-mini", messages=messages))
+        assert 0.09 < time.perf_counter() - start < 0.2
+        assert res.choices[0].message.content == "Slow"
+    finally:
+        replay.close()
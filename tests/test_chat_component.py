@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from nicegui import Client
+from nicegui.page import page
+
+from genai_template_frontend.backend_client import backend_client
+from genai_template_frontend.components.chat import Chat
+
+
+@pytest.fixture
+def client():
+    """Headless NiceGUI client, no browser nor websocket."""
+    client = Client(page("/"), request=None)
+    with client:
+        yield client
+    client.remove_all_elements()
+
+
+def mounted_texts(chat: Chat) -> list[str]:
+    return [
+        element.default_slot.children[0].content
+        for element in chat.messages_container.default_slot.children
+    ]
+
+
+def test_only_the_latest_messages_stay_mounted(client):
+    chat = Chat(mounted_messages=3, page_size=2)
+    chat.build()
+    for i in range(7):
+        chat.add_message("user", f"message {i}")
+
+    assert len(chat.messages) == 7
+    assert mounted_texts(chat) == ["message 4", "message 5", "message 6"]
+    assert chat._first_mounted == 4 and chat._older_button.visible
+
+    assert chat.load_older() == 2
+    assert mounted_texts(chat) == [f"message {i}" for i in range(2, 7)]
+    assert chat.load_older() == 2
+    assert chat.load_older() == 0
+    assert mounted_texts(chat) == [f"message {i}" for i in range(7)]
+    assert not chat._older_button.visible
+
+
+def test_streamed_reply_stays_mounted(client, monkeypatch):
+    chat = Chat(mounted_messages=1)
+    chat.build()
+    seen = []
+
+    async def stream_chat(message, session):
+        yield "message", {"delta": "Hello"}
+        # the user sends another message while the reply streams
+        chat.add_message("user", "second question")
+        chat.add_message("bot", "second answer")
+        seen.append(mounted_texts(chat))
+        yield "message", {"delta": " there"}
+        yield "done", {"total": 0.1}
+
+    monkeypatch.setattr(backend_client, "stream_chat", stream_chat)
+    chat.text_input.value = "first question"
+    asyncio.run(chat._send_message_and_reply())
+
+    assert seen == [["Hello", "second question", "second answer"]]
+    assert chat.messages[1]["text"] == "Hello there"
+    # mounted until the reply completed, then the window shrinks back
+    assert mounted_texts(chat) == ["second answer"]
+    assert chat._first_mounted == 3
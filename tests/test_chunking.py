@@ -0,0 +1,62 @@
+import asyncio
+
+from genai_template_backend.api.chunking import a_map_chunks, iter_chunks, map_chunks
+from genai_template_backend.api.llm import EmbeddingLLMConfig
+from tests.conftest import fake_vector
+
+
+def test_iter_chunks_respects_items_and_tokens():
+    texts = ["a" * 40] * 5 + ["b" * 400] + ["c"] * 3  # 11, 11, ..., 101, 1 estimated tokens
+    chunks = list(iter_chunks(texts, max_items=3, max_tokens=50))
+
+    assert [start for start, _ in chunks] == [0, 3, 5, 6]
+    assert [len(chunk) for _, chunk in chunks] == [3, 2, 1, 3]
+
+
+def test_a_map_chunks_bounds_in_flight_and_retries_failed_chunks():
+    texts = [f"text {i}" for i in range(1000)]
+    in_flight, max_in_flight, failed = 0, 0, set()
+
+    async def embed_chunk(chunk):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        if chunk[0] == "text 300" and chunk[0] not in failed:
+            failed.add(chunk[0])
+            raise ConnectionError("provider hiccup")
+        return [fake_vector(text) for text in chunk]
+
+    vectors = asyncio.run(
+        a_map_chunks(texts, embed_chunk, max_items=100, max_tokens=10_000, max_in_flight=3)
+    )
+
+    assert vectors == [fake_vector(text) for text in texts]
+    assert max_in_flight == 3
+    assert failed == {"text 300"}
+
+
+def test_map_chunks_keeps_input_order():
+    texts = [f"text {i}" for i in range(50)]
+    vectors = map_chunks(
+        texts,
+        lambda chunk: [fake_vector(text) for text in chunk],
+        max_items=7,
+        max_tokens=10_000,
+        max_in_flight=4,
+    )
+    assert vectors == [fake_vector(text) for text in texts]
+
+
+def test_a_embed_texts_is_chunked(mock_aembedding):
+    llm = EmbeddingLLMConfig(
+        model_name="ollama/all-minilm:l6-v2",
+        base_url="http://localhost:11434",
+        api_key="t",
+        chunk_max_items=10,
+    )
+    texts = [f"text {i}" for i in range(25)]
+
+    assert asyncio.run(llm.a_embed_texts(texts)) == [fake_vector(text) for text in texts]
+    assert sorted(len(call) for call in mock_aembedding) == [5, 10, 10]
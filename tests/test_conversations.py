@@ -0,0 +1,121 @@
+import asyncio
+
+from genai_template_backend.api.conversations import Conversation, ConversationStore
+
+
+def turns(count: int, words: int = 20) -> list[dict]:
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "word " * words}
+        for i in range(count)
+    ]
+
+
+def test_prompt_keeps_the_latest_turns_within_the_budget():
+    store = ConversationStore(history_max_tokens=120)
+    conversation = Conversation(summary="The user likes linen.", messages=turns(10))
+
+    prompt = store.prompt_messages(conversation, "And a shirt?")
+
+    assert prompt[0]["role"] == "system" and "linen" in prompt[0]["content"]
+    assert prompt[-1] == {"role": "user", "content": "And a shirt?"}
+    history = prompt[1:-1]
+    assert 0 < len(history) < 10
+    assert history == conversation.messages[-len(history) :]
+
+
+def test_lru_eviction_and_ttl():
+    store = ConversationStore(max_conversations=2, ttl=60)
+
+    async def main():
+        for conversation_id in ("a", "b", "c"):
+            await store.aappend(conversation_id, turns(2))
+        assert store.stats()["evictions"] == 1
+        assert (await store.aget("a")).messages == []
+        store.ttl = -1
+        await store.asave("d", Conversation(messages=turns(2)))
+        assert (await store.aget("d")).messages == []
+
+    asyncio.run(main())
+
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    async def a_generate_from_messages(self, messages):
+        self.prompts.append(messages[-1]["content"])
+        await asyncio.sleep(0.01)
+        return f"summary {len(self.prompts)}"
+
+
+def test_oldest_turns_are_folded_into_the_summary(tmp_path):
+    path = str(tmp_path / "conversations.sqlite")
+    store = ConversationStore(disk_path=path, history_max_tokens=200, summary_max_tokens=20)
+    llm = FakeLLM()
+
+    async def main():
+        for i in range(6):
+            await store.aappend("a", turns(2), llm)
+        # one summary at a time per conversation
+        assert store.stats()["summarizing"] == 1
+        await store.aclose()
+
+    asyncio.run(main())
+
+    assert store.summaries >= 1
+    assert "turn 0" in llm.prompts[0] and "(empty)" in llm.prompts[0]
+    # the summary and the turns left verbatim are persisted
+    reopened = ConversationStore(disk_path=path, history_max_tokens=200)
+    conversation = asyncio.run(reopened.aget("a"))
+    assert conversation.summary == f"summary {store.summaries}"
+    assert conversation.summarized_messages + len(conversation.messages) == 12
+    asyncio.run(reopened.aclose())
+
+
+def test_deleted_conversation_is_not_saved_back_by_its_summary(tmp_path):
+    path = str(tmp_path / "conversations.sqlite")
+    store = ConversationStore(disk_path=path, history_max_tokens=200, summary_max_tokens=20)
+    llm = FakeLLM()
+
+    async def main():
+        for _ in range(6):
+            await store.aappend("a", turns(2))
+        await store.aappend("a", turns(2), llm)
+        assert store.stats()["summarizing"] == 1
+        await store.adelete("a")
+        await asyncio.sleep(0.05)
+        assert store.stats()["summarizing"] == 0
+        assert (await store.aget("a")).messages == []
+        await store.aclose()
+
+    asyncio.run(main())
+    reopened = ConversationStore(disk_path=path)
+    assert asyncio.run(reopened.aget("a")).messages == []
+    asyncio.run(reopened.aclose())
+
+
+def test_workers_sharing_the_file_keep_each_others_turns(tmp_path):
+    path = str(tmp_path / "conversations.sqlite")
+    first = ConversationStore(disk_path=path, history_max_tokens=200, summary_max_tokens=20)
+    second = ConversationStore(disk_path=path, history_max_tokens=200, summary_max_tokens=20)
+    llm = FakeLLM()
+    exchanges = [turns(2, words=20 + i) for i in range(8)]
+
+    async def main():
+        # the second worker holds a copy of the conversation older than the next turns
+        await second.aget("a")
+        for i, exchange in enumerate(exchanges[:6]):
+            await (first if i % 2 == 0 else second).aappend("a", exchange)
+        # a summary of the first worker keeps the turn the second one appended meanwhile
+        await first.aappend("a", exchanges[6], llm)
+        await second.aappend("a", exchanges[7])
+        await first.aclose()
+        await second.aclose()
+        return await ConversationStore(disk_path=path).aget("a")
+
+    conversation = asyncio.run(main())
+
+    assert first.summaries == 1
+    expected = [turn for exchange in exchanges for turn in exchange]
+    assert conversation.messages == expected[conversation.summarized_messages :]
+    assert conversation.summary == "summary 1"
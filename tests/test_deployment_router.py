@@ -0,0 +1,150 @@
+import asyncio
+import time
+
+import litellm
+import pytest
+
+from genai_template_backend.api.deployment_router import (
+    CircuitBreaker,
+    DeploymentRouter,
+    NoDeploymentAvailable,
+)
+from genai_template_backend.api.llm import InferenceLLMConfig
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+
+def build_routed_llm(base_urls: list[str], **router_kwargs) -> InferenceLLMConfig:
+    deployments = [
+        InferenceLLMConfig(
+            model_name="openai/gpt-4o-mini",
+            api_key="key",
+            base_url=base_url,
+            max_concurrency=8,
+            single_flight=False,
+        )
+        for base_url in base_urls
+    ]
+    return InferenceLLMConfig(
+        model_name="openai/gpt-4o-mini",
+        api_key="key",
+        base_url=base_urls[0],
+        single_flight=False,
+        router=DeploymentRouter(deployments, **router_kwargs),
+    )
+
+
+@pytest.fixture
+def fake_deployments(monkeypatch):
+    """Answers after ``latency[base_url]`` seconds, or fails for the ``down`` deployments."""
+    original_acompletion = litellm.acompletion
+    latency, down, calls = {}, set(), []
+
+    async def fake_acompletion(*args, base_url, **kwargs):
+        calls.append(base_url)
+        if base_url in down:
+            raise litellm.exceptions.ServiceUnavailableError(
+                message="down", llm_provider="openai", model="gpt-4o-mini"
+            )
+        await asyncio.sleep(latency.get(base_url, 0.0))
+        return await original_acompletion(*args, mock_response=f"from {base_url}", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    return latency, down, calls
+
+
+def test_routes_to_the_fastest_deployment(fake_deployments):
+    latency, _, calls = fake_deployments
+    latency.update({"http://slow": 0.05, "http://fast": 0.0})
+    llm = build_routed_llm(["http://slow", "http://fast"])
+
+    async def run():
+        for _ in range(20):
+            await llm.a_generate_from_messages(MESSAGES)
+
+    asyncio.run(run())
+    assert calls.count("http://fast") >= 18
+
+
+def test_fails_over_and_drains_the_failing_deployment(fake_deployments):
+    _, down, calls = fake_deployments
+    down.add("http://down")
+    llm = build_routed_llm(["http://down", "http://up"])
+
+    async def run():
+        return [await llm.a_generate_from_messages(MESSAGES) for _ in range(5)]
+
+    assert asyncio.run(run()) == ["from http://up"] * 5
+    # its error rate keeps the failing deployment last
+    assert calls.count("http://down") == 1
+    stats = {s["name"]: s for s in llm.router.stats()}
+    assert stats["openai/gpt-4o-mini@http://down"]["failures"] == 1
+    assert stats["openai/gpt-4o-mini@http://down"]["error_rate_ewma"] > 0
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+    breaker.on_failure()
+    assert breaker.available()
+    breaker.on_failure()
+    assert breaker.state == "open" and not breaker.available()
+    time.sleep(0.06)
+    # half-open: a single probe call
+    assert breaker.available()
+    breaker.on_call()
+    assert not breaker.available()
+    breaker.on_failure()
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    breaker.on_call()
+    breaker.on_success()
+    assert breaker.state == "closed"
+
+
+def test_stream_fails_over_before_the_first_delta(fake_deployments):
+    _, down, _ = fake_deployments
+    down.add("http://down")
+    llm = build_routed_llm(["http://down", "http://up"])
+
+    async def run():
+        return "".join([d async for d in llm.a_stream_from_messages(MESSAGES)])
+
+    assert asyncio.run(run()) == "from http://up"
+
+
+def test_no_deployment_available(fake_deployments):
+    _, down, _ = fake_deployments
+    down.add("http://down")
+    llm = build_routed_llm(["http://down"], failure_threshold=1, cooldown=60)
+    router = llm.router
+
+    async def run():
+        with pytest.raises(litellm.exceptions.ServiceUnavailableError):
+            await router.call(lambda deployment: deployment._a_generate_once(MESSAGES))
+        with pytest.raises(NoDeploymentAvailable) as error:
+            await router.call(lambda deployment: deployment._a_generate_once(MESSAGES))
+        assert 0 < error.value.retry_after <= 60
+
+    asyncio.run(run())
+
+
+def test_sync_calls_are_routed(monkeypatch):
+    original_completion = litellm.completion
+    calls = []
+
+    def fake_completion(*args, base_url, **kwargs):
+        calls.append(base_url)
+        if base_url == "http://down":
+            raise litellm.exceptions.ServiceUnavailableError(
+                message="down", llm_provider="openai", model="gpt-4o-mini"
+            )
+        return original_completion(*args, mock_response=f"from {base_url}", **kwargs)
+
+    monkeypatch.setattr(litellm, "completion", fake_completion)
+    llm = build_routed_llm(["http://down", "http://up"])
+
+    assert [llm.generate_from_messages(MESSAGES) for _ in range(3)] == ["from http://up"] * 3
+    assert calls.count("http://down") == 1
+    stats = {s["name"]: s for s in llm.router.stats()}
+    assert stats["openai/gpt-4o-mini@http://up"]["calls"] == 3
+    assert all(s["in_flight"] == 0 for s in stats.values())
@@ -0,0 +1,56 @@
+import asyncio
+
+from genai_template_backend.api.embedding_batcher import EmbeddingBatcher
+from genai_template_backend.api.llm import EmbeddingLLMConfig
+from tests.conftest import fake_vector
+
+
+def build_embedding_llm(**kwargs) -> EmbeddingLLMConfig:
+    return EmbeddingLLMConfig(
+        model_name="ollama/all-minilm:l6-v2",
+        base_url="http://localhost:11434",
+        api_key="t",
+        **kwargs,
+    )
+
+
+def test_concurrent_embed_text_calls_share_one_request(mock_aembedding):
+    llm = build_embedding_llm(micro_batch=True, micro_batch_max_size=4, micro_batch_max_wait=0.05)
+    texts = [f"text {i}" * (i + 1) for i in range(10)]
+
+    async def main():
+        return await asyncio.gather(*(llm.a_embed_text(text) for text in texts))
+
+    vectors = asyncio.run(main())
+
+    assert vectors == [fake_vector(text) for text in texts]
+    assert [len(call) for call in mock_aembedding] == [4, 4, 2]
+    stats = llm._batcher.stats()
+    assert stats["batches"] == 3
+    assert stats["max_batch_size"] == 4
+
+
+def test_embed_text_without_micro_batch(mock_aembedding):
+    llm = build_embedding_llm()
+
+    async def main():
+        return await asyncio.gather(llm.a_embed_text("a"), llm.a_embed_text("b"))
+
+    assert asyncio.run(main()) == [fake_vector("a"), fake_vector("b")]
+    assert mock_aembedding == [["a"], ["b"]]
+
+
+def test_missing_embeddings_fail_the_whole_batch():
+    async def embed_batch(texts):
+        return [fake_vector(text) for text in texts[:-1]]
+
+    batcher = EmbeddingBatcher(embed_batch, max_batch_size=3, max_wait=0.01)
+
+    async def main():
+        calls = (batcher.embed(text) for text in ["a", "b", "c"])
+        return await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), 1)
+
+    results = asyncio.run(main())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert "2 embeddings for a batch of 3" in str(results[0])
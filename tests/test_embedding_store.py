@@ -0,0 +1,95 @@
+import asyncio
+import multiprocessing
+
+import numpy as np
+
+from genai_template_backend.api.embedding_store import EmbeddingStore
+from genai_template_backend.api.llm import EmbeddingLLMConfig
+from tests.conftest import fake_vector
+
+
+def write_texts(path: str, worker: int):
+    store = EmbeddingStore(path)
+    texts = [f"worker {worker} text {i}" for i in range(200)]
+    for start in range(0, len(texts), 20):
+        chunk = texts[start : start + 20]
+        store.add_many("model", chunk, [fake_vector(text) for text in chunk])
+
+
+def test_store_roundtrip_is_memory_mapped(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.merge_threshold = 2  # exercise the sorted index as well as the recent keys
+    store.add_many("model", ["a", "b", "c"], [fake_vector(t) for t in "abc"])
+    store.add_many("model", ["c", "d"], [fake_vector(t) for t in "cd"])
+    assert len(store) == 4
+
+    reopened = EmbeddingStore(str(tmp_path))
+    vectors = reopened.get_many("model", ["d", "a", "missing"])
+    assert vectors[0].tolist() == fake_vector("d")
+    assert vectors[1].tolist() == fake_vector("a")
+    assert vectors[2] is None
+    assert isinstance(vectors[0].base, np.memmap)
+    # the model name is part of the key
+    assert reopened.get_many("other model", ["a"]) == [None]
+
+
+def test_store_is_safe_for_concurrent_workers(tmp_path):
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=write_texts, args=(str(tmp_path), w)) for w in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    store = EmbeddingStore(str(tmp_path))
+    texts = [f"worker {w} text {i}" for w in range(3) for i in range(200)]
+    assert len(store) == len(texts)
+    assert [v.tolist() for v in store.get_many("model", texts)] == [fake_vector(t) for t in texts]
+
+
+def test_embed_texts_only_sends_store_misses(tmp_path, mock_aembedding):
+    llm = EmbeddingLLMConfig(
+        model_name="ollama/all-minilm:l6-v2",
+        base_url="http://localhost:11434",
+        api_key="t",
+        store=EmbeddingStore(str(tmp_path)),
+    )
+
+    async def main():
+        first = await llm.a_embed_texts(["a", "b", "a"])
+        second = await llm.a_embed_texts(["b", "c"])
+        single = await llm.a_embed_text("c")
+        return first, second, single
+
+    first, second, single = asyncio.run(main())
+
+    assert first == [fake_vector("a"), fake_vector("b"), fake_vector("a")]
+    assert second == [fake_vector("b"), fake_vector("c")]
+    assert single == fake_vector("c")
+    assert mock_aembedding == [["a", "b"], ["c"]]
+
+
+def test_store_lookups_from_threads_while_another_worker_writes(tmp_path):
+    """Readers refresh and merge the index from several threads while rows are appended."""
+    reader = EmbeddingStore(str(tmp_path))
+    reader.merge_threshold = 8
+    writer = EmbeddingStore(str(tmp_path))
+    texts = [f"text {i}" for i in range(400)]
+
+    def write():
+        for start in range(0, len(texts), 10):
+            chunk = texts[start : start + 10]
+            writer.add_many("model", chunk, [fake_vector(text) for text in chunk])
+
+    def read():
+        for _ in range(20):
+            for text, vector in zip(texts, reader.get_many("model", texts)):
+                if vector is not None:
+                    assert vector.tolist() == fake_vector(text)
+
+    async def main():
+        await asyncio.gather(asyncio.to_thread(write), *(asyncio.to_thread(read) for _ in range(4)))
+
+    asyncio.run(main())
+    assert all(vector is not None for vector in reader.get_many("model", texts))
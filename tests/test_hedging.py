@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import litellm
+
+from genai_template_backend.api.hedging import HedgeBudget, Hedger
+from genai_template_backend.api.llm import InferenceLLMConfig
+
+
+def warmed_up_hedger(**kwargs) -> Hedger:
+    hedger = Hedger("test-model", percentile=95, min_delay=0.02, min_samples=10, **kwargs)
+    for _ in range(50):
+        hedger.latencies.record(0.01)
+    return hedger
+
+
+def test_slow_call_is_hedged_and_cancelled():
+    hedger = warmed_up_hedger(max_rate=0.5)
+    calls, cancelled = [], []
+
+    async def call():
+        calls.append(len(calls))
+        try:
+            await asyncio.sleep(2.0 if len(calls) == 1 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return f"call {len(calls)}"
+
+    async def run():
+        start = time.perf_counter()
+        res = await hedger.run(call)
+        await asyncio.sleep(0)
+        return res, time.perf_counter() - start
+
+    res, elapsed = asyncio.run(run())
+    assert res == "call 2"
+    assert elapsed < 0.5
+    assert cancelled == [True]
+
+
+def test_hedges_are_capped_by_the_budget():
+    budget = HedgeBudget(max_rate=0.1, burst=2)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    for _ in range(10):
+        budget.on_call()
+    assert budget.try_spend()
+
+    hedger = warmed_up_hedger(max_rate=0.0)
+    hedger.budget.balance = 0.0
+    calls = []
+
+    async def slow_call():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "slow"
+
+    assert asyncio.run(hedger.run(slow_call)) == "slow"
+    assert len(calls) == 1
+
+
+def test_hedged_completion(monkeypatch):
+    original_acompletion = litellm.acompletion
+    calls = []
+
+    async def fake_acompletion(*args, **kwargs):
+        calls.append(1)
+        # the first call hangs, its hedge answers
+        await asyncio.sleep(5.0 if len(calls) == 1 else 0.0)
+        return await original_acompletion(*args, mock_response=f"call {len(calls)}", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    llm = InferenceLLMConfig(
+        model_name="openai/gpt-4o-mini",
+        api_key="key",
+        base_url="http://provider",
+        single_flight=False,
+        hedger=warmed_up_hedger(max_rate=0.5),
+    )
+    start = time.perf_counter()
+    res = asyncio.run(llm.a_generate_from_messages([{"role": "user", "content": "Hi"}]))
+    assert res == "call 2"
+    assert time.perf_counter() - start < 1.0
@@ -0,0 +1,93 @@
+import asyncio
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from genai_template_backend.api.image_pipeline import (
+    IMAGENET_MEAN,
+    IMAGENET_STD,
+    ImagePipeline,
+    InvalidImage,
+    PipelineSaturated,
+    preprocess,
+)
+
+
+def write_image(path, size=(40, 20), color=(255, 0, 0), orientation=None):
+    image = Image.new("RGB", size, color)
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    image.save(path, format="JPEG", exif=exif, quality=95)
+
+
+def run_preprocess(path, width, height):
+    block = SharedMemory(create=True, size=3 * height * width * 4)
+    try:
+        metadata = preprocess(str(path), block.name, width, height)
+        array = np.ndarray((3, height, width), dtype=np.float32, buffer=block.buf).copy()
+    finally:
+        block.close()
+        block.unlink()
+    return metadata, array
+
+
+def test_preprocess_normalizes_into_shared_memory(tmp_path):
+    path = tmp_path / "red.jpg"
+    write_image(path, color=(255, 0, 0))
+
+    metadata, array = run_preprocess(path, width=16, height=8)
+
+    assert metadata == {"original_width": 40, "original_height": 20}
+    expected = (np.array([1.0, 0.0, 0.0]) - IMAGENET_MEAN) / IMAGENET_STD
+    np.testing.assert_allclose(array.mean(axis=(1, 2)), expected, atol=0.05)
+
+
+def test_preprocess_applies_the_exif_orientation(tmp_path):
+    path = tmp_path / "rotated.jpg"
+    # stored landscape, displayed portrait
+    write_image(path, size=(40, 20), orientation=6)
+
+    metadata, array = run_preprocess(path, width=10, height=20)
+
+    assert metadata == {"original_width": 20, "original_height": 40}
+    assert array.shape == (3, 20, 10)
+
+
+def test_preprocess_rejects_other_files(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("not an image")
+
+    with pytest.raises(InvalidImage):
+        run_preprocess(path, width=8, height=8)
+
+
+def test_pipeline_preprocesses_in_the_pool_and_applies_backpressure(tmp_path):
+    pipeline = ImagePipeline(
+        str(tmp_path), width=16, height=16, max_workers=1, max_pending=1, queue_timeout=0.05
+    )
+    path = tmp_path / "image"
+    write_image(path, color=(0, 0, 255))
+
+    async def main():
+        block = await pipeline.acquire()
+        # the only slot is taken
+        with pytest.raises(PipelineSaturated):
+            await pipeline.acquire()
+        result = await pipeline.preprocess("image", str(path), block)
+        # released by preprocess
+        reused = await pipeline.acquire()
+        pipeline.release(reused)
+        assert pipeline.get("image").shape == (3, 16, 16)
+        await pipeline.aclose()
+        return result, reused is block
+
+    result, reused = asyncio.run(main())
+
+    assert reused
+    assert result["width"] == 16 and result["original_width"] == 40
+    assert pipeline.stats()["rejected"] == 1
+    # the kept uploads don't survive the shutdown
+    assert pipeline.get("image") is None and not path.exists()
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+from genai_template_backend.lazy_imports import lazy_import, warm_up
+
+
+def test_importing_the_app_defers_the_heavy_dependencies():
+    code = (
+        "import sys, genai_template_backend.app\n"
+        "loaded = [m for m in ('litellm.utils', 'instructor.core', 'tiktoken.core', 'torch.nn')"
+        " if m in sys.modules]\n"
+        "assert not loaded, loaded"
+    )
+    process = subprocess.run(
+        [sys.executable, "-c", code], env=os.environ.copy(), capture_output=True, text=True
+    )
+    assert process.returncode == 0, process.stderr[-2000:]
+
+
+def test_lazy_module_is_loaded_on_first_use():
+    code = (
+        "import sys\n"
+        "from genai_template_backend.lazy_imports import lazy_import, warm_up\n"
+        "tomllib = lazy_import('tomllib')\n"
+        "assert 'tomllib._parser' not in sys.modules\n"
+        "assert tomllib.loads('a = 1') == {'a': 1}\n"
+        "assert 'tomllib._parser' in sys.modules\n"
+    )
+    process = subprocess.run(
+        [sys.executable, "-c", code], env=os.environ.copy(), capture_output=True, text=True
+    )
+    assert process.returncode == 0, process.stderr[-2000:]
+    assert lazy_import("os") is os
+    assert set(warm_up(("os", "json"))) == {"os", "json"}
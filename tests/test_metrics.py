@@ -0,0 +1,121 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import litellm
+from fastapi.testclient import TestClient
+
+from genai_template_backend.api.llm import InferenceLLMConfig
+from genai_template_backend.api.metrics import (
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+)
+from genai_template_backend.app import app
+from genai_template_backend.env_settings import settings
+
+
+def test_prometheus_text_format():
+    registry = MetricsRegistry()
+    requests = Counter("requests_total", "Requests.", ("route",), registry=registry)
+    latency = Histogram("latency_seconds", "Latency.", ("route",), (0.1, 1), registry=registry)
+    requests.inc("/a")
+    requests.inc("/a", amount=2)
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, "/a")
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/a"} 3' in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="1"} 3' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in text
+    assert 'latency_seconds_sum{route="/a"} 3.65' in text
+    assert 'latency_seconds_count{route="/a"} 4' in text
+
+
+def test_samples_recorded_from_threads_are_not_lost():
+    registry = MetricsRegistry()
+    requests = Counter("requests_total", "Requests.", ("route",), registry=registry)
+    latency = Histogram("latency_seconds", "Latency.", ("route",), (0.1, 1), registry=registry)
+
+    def record(i):
+        for _ in range(2000):
+            requests.inc(f"/{i % 4}")
+            latency.observe(0.5, f"/{i % 4}")
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(record, range(8)))
+
+    text = registry.render()
+    for route in range(4):
+        assert f'requests_total{{route="/{route}"}} 4000' in text
+        assert f'latency_seconds_count{{route="/{route}"}} 4000' in text
+    # one series per label values, even when created by two threads at once
+    assert len(registry._series) == 8
+
+
+def test_sync_calls_are_tracked(monkeypatch):
+    original_completion = litellm.completion
+    monkeypatch.setattr(
+        litellm,
+        "completion",
+        lambda *args, **kwargs: original_completion(*args, mock_response="Hi human!", **kwargs),
+    )
+    llm = InferenceLLMConfig(
+        model_name="ollama/sync-metrics", base_url="http://localhost:11434", api_key="t"
+    )
+
+    assert llm.generate_from_messages([{"role": "user", "content": "Hi"}]) == "Hi human!"
+    text = REGISTRY.render()
+    assert (
+        'llm_request_duration_seconds_count{model="ollama/sync-metrics",operation="completion",'
+        'outcome="success"} 1' in text
+    )
+    assert 'llm_completion_tokens_total{model="ollama/sync-metrics"}' in text
+
+
+def test_metrics_are_summed_over_worker_processes(tmp_path):
+    registry = MetricsRegistry(str(tmp_path))
+    requests = Counter("requests_total", "Requests.", ("route",), registry=registry)
+    in_flight = Gauge("in_flight", "In flight.", registry=registry)
+    requests.inc("/a")
+
+    children = []
+    for _ in range(3):
+        pid = os.fork()
+        if pid == 0:  # worker: own file, counters start at 0
+            requests.inc("/a", amount=10)
+            in_flight.inc()
+            os._exit(0)
+        children.append(pid)
+    for pid in children:
+        os.waitpid(pid, 0)
+
+    text = registry.render()
+    assert 'requests_total{route="/a"} 31' in text
+    # the gauges of exited workers are dropped
+    assert "in_flight 3" not in text
+
+
+def test_metrics_endpoint_records_routes_and_llm_calls(monkeypatch):
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, **kwargs):
+        return await original_acompletion(*args, mock_response="Hi human!", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+
+    with TestClient(app) as client:
+        assert client.post("/api/chat", json={"message": "Metrics?"}).status_code == 200
+        text = client.get("/metrics").text
+
+    route_labels = 'method="POST",route="/api/chat",status="200"'
+    assert f"http_request_duration_seconds_count{{{route_labels}}}" in text
+    model = settings.INFERENCE_DEPLOYMENT_NAME
+    assert (
+        f'llm_request_duration_seconds_count{{model="{model}",operation="completion",'
+        f'outcome="success"}}' in text
+    )
+    assert f'llm_completion_tokens_total{{model="{model}"}}' in text
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+import torch
+
+from genai_template_backend.api.model_server import ModelServer
+
+
+class Doubler(torch.nn.Module):
+    """Records the batch sizes it is called with."""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_sizes = []
+
+    def forward(self, x):
+        self.batch_sizes.append(len(x))
+        if (x < 0).any():
+            raise ValueError("negative input")
+        return x * 2
+
+
+def test_concurrent_calls_are_batched_and_split_back():
+    server = ModelServer(max_batch_size=4, max_wait=0.05, device="cpu")
+    model = Doubler()
+    worker = server.register("doubler", model)
+
+    async def main():
+        outputs = await asyncio.gather(
+            *(server.infer("doubler", torch.full((3,), float(i))) for i in range(10))
+        )
+        await server.aclose()
+        return outputs
+
+    outputs = asyncio.run(main())
+
+    for i, output in enumerate(outputs):
+        assert torch.equal(output, torch.full((3,), 2.0 * i))
+    assert model.batch_sizes == [4, 4, 2]
+    stats = worker.stats()
+    assert stats["batches"] == 3 and stats["items"] == 10
+    assert stats["batch_size_histogram"] == {2: 1, 4: 2}
+    assert not model.training
+
+
+def test_errors_reach_every_caller_of_the_batch():
+    server = ModelServer(max_batch_size=8, max_wait=0.02, device="cpu")
+    server.register("doubler", lambda: Doubler())
+
+    async def main():
+        results = await asyncio.gather(
+            server.infer("doubler", torch.ones(2)),
+            server.infer("doubler", -torch.ones(2)),
+            return_exceptions=True,
+        )
+        # the worker keeps serving after a failed batch
+        after = await server.infer("doubler", torch.ones(2))
+        await server.aclose()
+        return results, after
+
+    results, after = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert torch.equal(after, torch.full((2,), 2.0))
+    with pytest.raises(ValueError):
+        server.register("doubler", Doubler())
+
+
+def test_callers_are_failed_instead_of_left_waiting():
+    server = ModelServer(max_batch_size=8, max_wait=10.0, device="cpu")
+    server.register("doubler", Doubler)
+    # split dropping an output: every caller of the batch gets the error
+    server.register("lossy", Doubler, max_wait=0.01, split=lambda outputs: list(outputs)[:-1])
+
+    async def main():
+        lossy = await asyncio.wait_for(
+            asyncio.gather(
+                server.infer("lossy", torch.ones(2)),
+                server.infer("lossy", torch.ones(2)),
+                return_exceptions=True,
+            ),
+            timeout=1,
+        )
+        # shut down while the batch waits for more inputs, the callers already taken fail
+        forming = [asyncio.ensure_future(server.infer("doubler", torch.ones(2))) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        await server.aclose()
+        return lossy, await asyncio.wait_for(
+            asyncio.gather(*forming, return_exceptions=True), timeout=1
+        )
+
+    lossy, forming = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in lossy)
+    assert "split returned 1 outputs" in str(lossy[0])
+    assert all(isinstance(result, RuntimeError) for result in forming)
+    assert "shut down" in str(forming[0])
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import httpx
+import litellm
+import pytest
+from instructor.exceptions import InstructorRetryException
+
+from genai_template_backend.api.llm import InferenceLLMConfig, is_retryable
+from genai_template_backend.api.rate_limit import RateLimiter, RateLimitExceeded
+
+
+def test_rate_limiter_queues_then_rejects():
+    # 600 requests/min: a burst of 600, then one request every 100ms
+    limiter = RateLimiter("model", requests_per_minute=600, max_wait=0.25)
+
+    async def main():
+        for _ in range(600):
+            await limiter.acquire()
+        assert limiter.throttled == 0
+        await asyncio.gather(limiter.acquire(), limiter.acquire())  # queued ~100ms and ~200ms
+        assert limiter.throttled == 2 and limiter.max_queue_depth == 2
+        await limiter.acquire()
+        with pytest.raises(RateLimitExceeded):
+            await asyncio.gather(*(limiter.acquire() for _ in range(3)))
+
+    asyncio.run(main())
+    assert limiter.rejected == 1
+
+
+def test_tokens_per_minute_budget():
+    limiter = RateLimiter("model", tokens_per_minute=1000, max_wait=1.0)
+    limiter.acquire_sync(900)
+    limiter.record_usage(900, 1000)  # the provider counted more tokens than estimated
+    with pytest.raises(RateLimitExceeded) as error:
+        limiter.acquire_sync(100)  # needs 6s of refill
+    assert error.value.retry_after == pytest.approx(6, abs=0.1)
+
+
+def test_retry_honors_retry_after_and_pauses_the_model(monkeypatch):
+    calls = []
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, **kwargs):
+        calls.append(asyncio.get_running_loop().time())
+        if len(calls) == 1:
+            raise litellm.exceptions.RateLimitError(
+                "slow down",
+                "ollama",
+                "qwen3:0.6b",
+                response=httpx.Response(429, headers={"retry-after-ms": "200"}),
+            )
+        return await original_acompletion(*args, mock_response="Hi human!", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    limiter = RateLimiter("ollama/qwen3:0.6b", requests_per_minute=6000)
+    llm = InferenceLLMConfig(
+        model_name="ollama/qwen3:0.6b",
+        base_url="http://localhost:11434",
+        api_key="t",
+        rate_limiter=limiter,
+    )
+
+    answer = asyncio.run(llm.a_generate_from_messages([{"role": "user", "content": "Hello"}]))
+    assert answer == "Hi human!"
+    # retry-after 200ms plus up to 1s of jitter, instead of a fixed minute
+    assert 0.2 <= calls[1] - calls[0] < 1.5
+    assert limiter.provider_throttles == 1
+
+
+def test_sync_path_retries_throttling_and_raises_rate_limit_exceeded(monkeypatch):
+    calls = []
+    original_completion = litellm.completion
+
+    def fake_completion(*args, **kwargs):
+        calls.append(time.perf_counter())
+        if len(calls) == 1:
+            raise litellm.exceptions.RateLimitError(
+                "slow down",
+                "ollama",
+                "qwen3:0.6b",
+                response=httpx.Response(429, headers={"retry-after-ms": "100"}),
+            )
+        return original_completion(*args, mock_response="Hi human!", **kwargs)
+
+    monkeypatch.setattr(litellm, "completion", fake_completion)
+    limiter = RateLimiter("ollama/qwen3:0.6b", requests_per_minute=2, max_wait=0.1)
+    llm = InferenceLLMConfig(
+        model_name="ollama/qwen3:0.6b",
+        base_url="http://localhost:11434",
+        api_key="t",
+        rate_limiter=limiter,
+    )
+
+    assert llm.generate_from_messages([{"role": "user", "content": "Hello"}]) == "Hi human!"
+    assert len(calls) == 2 and limiter.provider_throttles == 1
+    # the budget of 2 requests/min is spent, the caller is told instead of getting None
+    with pytest.raises(RateLimitExceeded):
+        llm.generate_from_messages([{"role": "user", "content": "Hello again"}])
+
+
+def test_only_throttling_behind_instructor_is_retried():
+    throttled = litellm.exceptions.RateLimitError("slow down", "ollama", "qwen3:0.6b")
+    unreachable = litellm.exceptions.APIConnectionError("refused", "ollama", "qwen3:0.6b")
+    assert is_retryable(throttled)
+    assert is_retryable(InstructorRetryException(throttled, n_attempts=1, total_usage=0))
+    assert not is_retryable(InstructorRetryException(unreachable, n_attempts=1, total_usage=0))
+    assert not is_retryable(unreachable)
@@ -0,0 +1,93 @@
+import asyncio
+
+import litellm
+import numpy as np
+
+from genai_template_backend.api.llm import InferenceLLMConfig
+from genai_template_backend.api.semantic_cache import SemanticCache
+
+
+class FakeEmbeddingLLM:
+    """Embeds texts on hand-picked vectors so that paraphrases are close."""
+
+    vectors = {
+        "What is your return policy?": [1.0, 0.0, 0.0],
+        "what's your return policy": [0.99, 0.1, 0.0],
+        "Do you ship to Canada?": [0.0, 0.0, 1.0],
+    }
+
+    async def a_embed_text(self, text):
+        return self.vectors[text]
+
+
+def test_semantic_cache_eviction_is_bounded():
+    cache = SemanticCache(FakeEmbeddingLLM(), threshold=0.9, capacity=2)
+    cache.add("a", np.array([1.0, 0.0], np.float32), "first")
+    cache.add("b", np.array([0.0, 1.0], np.float32), "second")
+    assert cache.lookup("a", np.array([1.0, 0.0], np.float32)) == "first"
+    cache.add(
+        "b", np.array([0.6, 0.8], np.float32), "third"
+    )  # evicts "second", least recently used
+
+    assert cache.stats()["size"] == 2
+    assert cache.stats()["evictions"] == 1
+    assert cache.lookup("b", np.array([0.0, 1.0], np.float32)) is None
+    assert cache.lookup("b", np.array([0.6, 0.8], np.float32)) == "third"
+    # namespaces are isolated even when vectors are identical
+    assert cache.lookup("c", np.array([1.0, 0.0], np.float32)) is None
+
+
+def test_inference_llm_answers_paraphrases_from_semantic_cache(monkeypatch):
+    calls = []
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, **kwargs):
+        calls.append(kwargs["messages"][-1]["content"])
+        return await original_acompletion(*args, mock_response=f"answer {len(calls)}", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    llm = InferenceLLMConfig(
+        model_name="ollama/qwen3:0.6b",
+        base_url="http://localhost:11434",
+        api_key="t",
+        semantic_cache=SemanticCache(FakeEmbeddingLLM(), threshold=0.95),
+    )
+
+    async def ask(content):
+        return await llm.a_generate_from_messages(messages=[{"role": "user", "content": content}])
+
+    async def main():
+        return [
+            await ask("What is your return policy?"),
+            await ask("what's your return policy"),
+            await ask("Do you ship to Canada?"),
+        ]
+
+    assert asyncio.run(main()) == ["answer 1", "answer 1", "answer 2"]
+    assert calls == ["What is your return policy?", "Do you ship to Canada?"]
+    assert llm.semantic_cache.stats()["hits"] == 1
+
+
+def test_offloaded_lookups_are_safe_while_entries_are_added():
+    cache = SemanticCache(FakeEmbeddingLLM(), threshold=0.99, capacity=64, offload_size=1)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(2000, 8)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def look_up():
+        for i, vector in enumerate(vectors):
+            cache.lookup(f"ns-{i % 7}", vector)
+
+    async def main():
+        lookups = asyncio.gather(*(asyncio.to_thread(look_up) for _ in range(3)))
+        # evictions rebind the namespaces while the threads look them up
+        for i, vector in enumerate(vectors):
+            cache.add(f"ns-{i % 7}", vector, str(i))
+            if i % 100 == 0:
+                await asyncio.sleep(0)
+        await lookups
+
+    asyncio.run(main())
+
+    stats = cache.stats()
+    assert stats["size"] == 64 and stats["hits"] + stats["misses"] == 3 * len(vectors)
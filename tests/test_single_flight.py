@@ -0,0 +1,80 @@
+import asyncio
+
+import litellm
+import pytest
+
+from genai_template_backend.api.llm import InferenceLLMConfig
+from genai_template_backend.api.single_flight import SingleFlight
+
+
+def test_identical_requests_share_one_provider_call(monkeypatch):
+    calls = []
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, **kwargs):
+        calls.append(kwargs["messages"][-1]["content"])
+        await asyncio.sleep(0.05)
+        return await original_acompletion(*args, mock_response=f"answer {len(calls)}", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    llm = InferenceLLMConfig(
+        model_name="ollama/qwen3:0.6b", base_url="http://localhost:11434", api_key="t"
+    )
+
+    async def ask(content):
+        return await llm.a_generate_from_messages([{"role": "user", "content": content}])
+
+    async def main():
+        return await asyncio.gather(*(ask("Describe this outfit") for _ in range(10)), ask("Hi"))
+
+    answers = asyncio.run(main())
+    assert answers[:10] == ["answer 1"] * 10 or answers[:10] == ["answer 2"] * 10
+    assert sorted(calls) == ["Describe this outfit", "Hi"]
+    assert llm._single_flight.stats() == {"in_flight": 0, "calls": 2, "deduplicated": 9}
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_call():
+    single_flight = SingleFlight()
+    started = []
+
+    async def slow_call():
+        started.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def failing_call():
+        await asyncio.sleep(0.01)
+        raise ValueError("provider error")
+
+    async def main():
+        first = asyncio.ensure_future(single_flight.run("key", slow_call))
+        second = asyncio.ensure_future(single_flight.run("key", slow_call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "done"
+        assert first.cancelled()
+
+        # the exception is raised to every caller
+        results = await asyncio.gather(
+            *(single_flight.run("error", failing_call) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+
+        # the shared call is cancelled when its last caller is
+        alone = asyncio.ensure_future(single_flight.run("alone", slow_call))
+        await asyncio.sleep(0.01)
+        alone.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await alone
+        await asyncio.sleep(0)
+        assert single_flight.stats()["in_flight"] == 0
+
+        # a caller arriving right after the last one left starts a new call
+        abandoned = asyncio.ensure_future(single_flight.run("again", slow_call))
+        await asyncio.sleep(0.01)
+        abandoned.cancel()
+        await asyncio.sleep(0)
+        assert await single_flight.run("again", slow_call) == "done"
+
+    asyncio.run(main())
+    assert started == [1, 1, 1, 1]
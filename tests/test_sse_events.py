@@ -0,0 +1,40 @@
+import asyncio
+
+from genai_template_frontend.utils import aiter_sse_events
+
+
+async def lines_of(text: str):
+    for line in text.split("\n"):
+        yield line
+
+
+def parse(text: str) -> list:
+    async def main():
+        return [event async for event in aiter_sse_events(lines_of(text))]
+
+    return asyncio.run(main())
+
+
+def test_events_are_parsed_with_their_name_and_json_data():
+    stream = (
+        'data: {"delta": "Hel"}\n\ndata: {"delta": "lo"}\n\nevent: done\ndata: {"ttft": 0.1}\n\n'
+    )
+
+    assert parse(stream) == [
+        ("message", {"delta": "Hel"}),
+        ("message", {"delta": "lo"}),
+        ("done", {"ttft": 0.1}),
+    ]
+
+
+def test_multi_line_data_and_a_last_event_without_blank_line():
+    stream = 'event: error\ndata: {"detail":\ndata: "boom"}'
+
+    assert parse(stream) == [("error", {"detail": "boom"})]
+
+
+def test_comments_and_empty_events_are_skipped_and_the_name_is_reset():
+    stream = ': keep-alive\n\nevent: done\n\ndata: {"delta": "x"}\n\n'
+
+    # the name of an event without data doesn't leak into the next one
+    assert parse(stream) == [("message", {"delta": "x"})]
@@ -0,0 +1,66 @@
+import asyncio
+from typing import Optional
+
+import instructor
+import litellm
+import pytest
+from pydantic import BaseModel, ValidationError
+
+from genai_template_backend.api.llm import InferenceLLMConfig
+from genai_template_backend.api.structured_output import (
+    instructor_client,
+    parse_structured_output,
+    response_format,
+)
+
+
+class Garment(BaseModel):
+    name: str
+    in_stock: bool
+    discount: Optional[float]
+
+
+class Outfit(BaseModel):
+    title: str
+    garments: list[Garment]
+
+
+OUTFIT_JSON = (
+    '{"title": "Summer", "garments": [{"name": "dress", "in_stock": true, "discount": null}]}'
+)
+
+
+def test_parse_structured_output_handles_json_literals_and_code_fences():
+    expected = Outfit(
+        title="Summer", garments=[Garment(name="dress", in_stock=True, discount=None)]
+    )
+    assert parse_structured_output(Outfit, OUTFIT_JSON) == expected
+    assert parse_structured_output(Outfit, f"```json\n{OUTFIT_JSON}\n```") == expected
+    with pytest.raises(ValidationError):
+        parse_structured_output(Outfit, '{"title": "Summer"}')
+
+
+def test_schema_derived_objects_are_memoized():
+    assert response_format(Outfit) is response_format(Outfit)
+    assert response_format(Outfit)["json_schema"]["name"] == "Outfit"
+    assert instructor_client(litellm.acompletion, instructor.Mode.JSON) is instructor_client(
+        litellm.acompletion, instructor.Mode.JSON
+    )
+
+
+def test_native_structured_output_path(monkeypatch):
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, response_format, **kwargs):
+        assert response_format["json_schema"]["name"] == "Outfit"
+        return await original_acompletion(*args, mock_response=OUTFIT_JSON, **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    llm = InferenceLLMConfig(
+        model_name="ollama/qwen3:0.6b", base_url="http://localhost:11434", api_key="t"
+    )
+    llm.supports_response_schema = True
+
+    outfit = asyncio.run(llm.a_generate("Suggest an outfit", schema=Outfit))
+    assert outfit.garments[0].in_stock is True
+    assert outfit.garments[0].discount is None
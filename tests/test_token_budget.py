@@ -0,0 +1,109 @@
+import asyncio
+import threading
+
+import litellm
+import pytest
+
+from genai_template_backend.api.llm import InferenceLLMConfig
+from genai_template_backend.api.token_budget import (
+    ContextWindowExceeded,
+    TokenBudget,
+    TokenCounter,
+    model_limits,
+)
+from genai_template_backend.env_settings import Settings
+
+
+def test_counts_are_memoized_per_message():
+    counter = TokenCounter("gpt-4o")
+    history = [{"role": "user", "content": f"message {i} " + "word " * 50} for i in range(20)]
+
+    first = counter.count(history)
+    assert counter.stats()["misses"] == 20
+    assert counter.count(history + [{"role": "user", "content": "new"}]) > first
+    assert counter.stats() == {"memoized": 21, "hits": 20, "misses": 21}
+    # the batched and the per-text encodings agree
+    texts = [message["content"] for message in history]
+    assert counter.count_texts(texts) == [counter.count_texts([text])[0] for text in texts]
+
+
+def test_model_limits_come_from_litellm_model_map():
+    assert model_limits("openai/gpt-4o")[0] == litellm.model_cost["gpt-4o"]["max_input_tokens"]
+    assert model_limits("ollama/unknown-model") == (None, None)
+    assert TokenBudget("ollama/unknown-model", default_context_window=4096).context_window == 4096
+
+
+def test_fit_drops_the_oldest_history_and_keeps_the_instructions():
+    budget = TokenBudget("gpt-4o", context_window=1000, min_output_tokens=200)
+    system = {"role": "system", "content": "You are a fashion assistant."}
+    history = [{"role": "user", "content": f"turn {i} " + "word " * 100} for i in range(10)]
+    question = {"role": "user", "content": "Which shirt?"}
+
+    messages, prompt_tokens, max_tokens = budget.fit([system, *history, question])
+
+    assert messages[0] == system and messages[-1] == question
+    assert prompt_tokens == budget.counter.count(messages) <= 800
+    assert max_tokens == 1000 - prompt_tokens
+    kept = messages[1:-1]
+    # the oldest turn kept is truncated, the most recent ones are intact
+    assert kept[-1] == history[-1]
+    assert "[...]" in kept[0]["content"] or kept[0] in history
+    assert budget.fit([system, question], max_tokens=64)[2] == 64
+
+
+def test_prompt_too_long_for_the_window():
+    budget = TokenBudget("gpt-4o", context_window=300, min_output_tokens=100)
+    with pytest.raises(ContextWindowExceeded):
+        budget.fit([{"role": "user", "content": "word " * 500}])
+
+
+def test_max_tokens_is_sent_from_the_budget(monkeypatch):
+    sent = {}
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, **kwargs):
+        sent.update(kwargs)
+        return await original_acompletion(*args, mock_response="ok", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    llm = InferenceLLMConfig(
+        model_name="ollama/qwen3:0.6b",
+        base_url="http://localhost:11434",
+        api_key="t",
+        single_flight=False,
+        token_budget=TokenBudget("ollama/qwen3:0.6b", context_window=2000),
+    )
+    messages = [{"role": "user", "content": "Hello"}]
+
+    assert asyncio.run(llm.a_generate_from_messages(messages)) == "ok"
+    assert sent["max_tokens"] == 2000 - llm.token_budget.counter.count(messages)
+
+
+def test_prompts_are_counted_off_the_event_loop(monkeypatch):
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, **kwargs):
+        return await original_acompletion(*args, mock_response="ok", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    budget = TokenBudget("ollama/qwen3:0.6b", context_window=2000)
+    counting_threads = []
+    original_fit = budget.fit
+
+    def fit(*args, **kwargs):
+        counting_threads.append(threading.current_thread())
+        return original_fit(*args, **kwargs)
+
+    monkeypatch.setattr(budget, "fit", fit)
+    llm = InferenceLLMConfig(
+        model_name="ollama/qwen3:0.6b",
+        base_url="http://localhost:11434",
+        api_key="t",
+        single_flight=False,
+        token_budget=budget,
+    )
+
+    assert asyncio.run(llm.a_generate_from_messages([{"role": "user", "content": "Hi"}])) == "ok"
+    assert counting_threads and threading.main_thread() not in counting_threads
+    # opt-in, the completions keep the provider's default length otherwise
+    assert Settings.model_fields["LLM_TOKEN_BUDGET_ENABLED"].default is False
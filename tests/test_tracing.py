@@ -0,0 +1,81 @@
+import json
+
+import litellm
+from fastapi.testclient import TestClient
+
+from genai_template_backend.api.tracing import span, tracer
+from genai_template_backend.app import app
+
+
+def read_spans(path) -> list[dict]:
+    spans = []
+    with open(path) as f:
+        for line in f:
+            for resource_spans in json.loads(line)["resourceSpans"]:
+                for scope_spans in resource_spans["scopeSpans"]:
+                    spans.extend(scope_spans["spans"])
+    return spans
+
+
+def attributes(otlp_span: dict) -> dict:
+    return {a["key"]: next(iter(a["value"].values())) for a in otlp_span["attributes"]}
+
+
+def test_request_span_tree(monkeypatch, tmp_path):
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, **kwargs):
+        return await original_acompletion(*args, mock_response="Hi human!", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    path = tmp_path / "traces.jsonl"
+    tracer.configure(str(path))
+    try:
+        # the app shutdown flushes the spans
+        with TestClient(app) as client:
+            response = client.post(
+                "/api/chat", json={"message": "Trace?"}, headers={"X-Request-ID": "req-1"}
+            )
+    finally:
+        tracer.shutdown()
+
+    assert response.status_code == 200
+    assert response.headers["x-request-id"] == "req-1"
+    spans = {s["name"]: s for s in read_spans(path)}
+    root = spans["POST /api/chat"]
+    assert "parentSpanId" not in root
+    assert spans["llm.generate"]["parentSpanId"] == root["spanId"]
+    assert spans["llm.attempt"]["parentSpanId"] == spans["llm.generate"]["spanId"]
+    assert spans["llm.completion"]["parentSpanId"] == spans["llm.attempt"]["spanId"]
+    assert len({s["traceId"] for s in spans.values()}) == 1
+    assert all(attributes(s)["request.id"] == "req-1" for s in spans.values())
+
+
+def test_spans_are_noops_when_disabled():
+    tracer.configure(None)
+    with span("nothing") as s:
+        s.set_attribute("key", "value")
+    assert not tracer.enabled
+
+
+def test_tracing_survives_an_app_restart(monkeypatch, tmp_path):
+    original_acompletion = litellm.acompletion
+
+    async def fake_acompletion(*args, **kwargs):
+        return await original_acompletion(*args, mock_response="Hi human!", **kwargs)
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    path = tmp_path / "traces.jsonl"
+    tracer.configure(str(path))
+    try:
+        for request_id in ("first", "second"):
+            with TestClient(app) as client:
+                client.post(
+                    "/api/chat", json={"message": "Trace?"}, headers={"X-Request-ID": request_id}
+                )
+            assert tracer.enabled
+            # flushed by the shutdown of the app
+            roots = [s for s in read_spans(path) if s["name"] == "POST /api/chat"]
+            assert attributes(roots[-1])["request.id"] == request_id
+    finally:
+        tracer.shutdown()
@@ -0,0 +1,155 @@
+import os
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from genai_template_backend.api.vector_index import (
+    FlatIndex,
+    IVFIndex,
+    ReadWriteLock,
+    VectorIndex,
+    encode_record,
+)
+
+
+def clustered_vectors(n, dim=16, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    vectors = centers[rng.integers(clusters, size=n)] + 0.3 * rng.standard_normal((n, dim))
+    return vectors.astype(np.float32)
+
+
+def test_flat_index_add_replace_delete():
+    index = FlatIndex()
+    index.add([1, 2, 3], [[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]])
+
+    ids, scores = index.search([1.0, 0.1], k=2)
+    assert ids.tolist() == [1, 3]
+    assert scores[0] == pytest.approx(0.995, abs=1e-3)
+
+    index.add([1], [[0.0, -1.0]])  # replaces the vector of item 1
+    assert len(index) == 3
+    assert index.search([1.0, 0.1], k=1)[0].tolist() == [3]
+
+    assert index.delete([3, 42]) == 1
+    assert index.search([1.0, 0.1], k=5)[0].tolist() == [2, 1]
+    with pytest.raises(ValueError):
+        index.add([4], [[1.0, 0.0, 0.0]])
+
+
+def test_ivf_index_recall_and_save_load(tmp_path):
+    vectors = clustered_vectors(4000)
+    ids = np.arange(len(vectors)) + 100
+    flat = FlatIndex()
+    flat.add(ids, vectors)
+    ivf = IVFIndex(n_lists=16, n_probe=4, train_factor=39)
+    ivf.add(ids[:1000], vectors[:1000])
+    assert ivf.is_trained  # 1000 >= 39 * 16 vectors
+    ivf.add(ids[1000:], vectors[1000:])
+    assert len(ivf) == len(vectors)
+
+    queries = clustered_vectors(50, seed=1)
+    overlaps = [len(set(ivf.search(q, 10)[0]) & set(flat.search(q, 10)[0])) for q in queries]
+    assert np.mean(overlaps) / 10 > 0.8  # recall@10
+
+    ivf.delete(ids[:10])
+    path = str(tmp_path / "index.npz")
+    ivf.save(path)
+    loaded = VectorIndex.load(path)
+    assert isinstance(loaded, IVFIndex) and loaded.is_trained
+    assert len(loaded) == len(vectors) - 10
+    for q in queries[:5]:
+        assert loaded.search(q, 10)[0].tolist() == ivf.search(q, 10)[0].tolist()
+
+    # the configured n_probe wins over the saved one
+    assert VectorIndex.load(path, n_probe=8).n_probe == 8
+
+
+def test_workers_share_the_writes_through_the_index_file(tmp_path):
+    settings = SimpleNamespace(
+        VECTOR_INDEX_PATH=str(tmp_path / "index.npz"),
+        VECTOR_INDEX_IVF_LISTS=0,
+        VECTOR_INDEX_N_PROBE=16,
+    )
+    first, second = VectorIndex.from_settings(settings), VectorIndex.from_settings(settings)
+
+    with first.shared_write():
+        first.add([1], [[1.0, 0.0]])
+    # the second worker applies its write on top of the first one
+    with second.shared_write():
+        second.add([2], [[0.0, 1.0]])
+    assert len(second) == 2
+
+    assert first.refresh() and not first.refresh()
+    assert first.search([1.0, 0.1], k=5)[0].tolist() == [1, 2]
+    assert len(VectorIndex.from_settings(settings)) == 2
+
+    with pytest.raises(ValueError):
+        first.add([], [])
+
+
+def test_writes_are_appended_to_a_log_compacted_into_the_snapshot(tmp_path, monkeypatch):
+    path = str(tmp_path / "index.npz")
+    settings = SimpleNamespace(
+        VECTOR_INDEX_PATH=path, VECTOR_INDEX_IVF_LISTS=0, VECTOR_INDEX_N_PROBE=16
+    )
+    first, second = VectorIndex.from_settings(settings), VectorIndex.from_settings(settings)
+    with first.shared_write():
+        first.add([1, 2], [[1.0, 0.0], [0.0, 1.0]])
+    # the first write creates the snapshot
+    assert second.refresh() and len(second) == 2
+    snapshot = os.stat(path)
+
+    with first.shared_write():
+        first.add([3], [[1.0, 1.0]])
+    with first.shared_write():
+        first.delete([2])
+    # the snapshot isn't rewritten, the second worker only reads the new records
+    assert os.stat(path).st_mtime_ns == snapshot.st_mtime_ns
+    monkeypatch.setattr(VectorIndex, "load", None)
+    assert second.refresh()
+    assert sorted(second.search([1.0, 0.0], k=5)[0].tolist()) == [1, 3]
+    monkeypatch.undo()
+
+    # a record being written by another worker is applied once complete
+    with open(f"{path}.log", "ab") as f:
+        f.write(encode_record(b"d", np.array([3]))[:-4])
+    assert not second.refresh()
+
+    monkeypatch.setattr(VectorIndex, "compact_min_bytes", 0)
+    monkeypatch.setattr(VectorIndex, "compact_ratio", 0.0)
+    with second.shared_write():
+        second.add([4], [[0.0, 1.0]])
+    assert os.path.getsize(f"{path}.log") == 8
+    assert first.refresh()
+    assert sorted(first.search([1.0, 0.0], k=5)[0].tolist()) == [1, 3, 4]
+    assert len(VectorIndex.from_settings(settings)) == 3
+
+
+def test_searches_run_in_parallel_and_writes_wait_for_them():
+    lock = ReadWriteLock()
+    both_reading = threading.Barrier(3, timeout=5)
+    release = threading.Event()
+    written = threading.Event()
+
+    def read():
+        with lock.read():
+            both_reading.wait()  # times out if the readers were serialized
+            release.wait(5)
+
+    def write():
+        with lock.write(), lock.write(), lock.read():  # reentrant for the writer
+            written.set()
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for reader in readers:
+        reader.start()
+    both_reading.wait()
+    writer = threading.Thread(target=write)
+    writer.start()
+    assert not written.wait(0.1)
+    release.set()
+    writer.join(5)
+    assert written.is_set()